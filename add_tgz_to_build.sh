@@ -33,6 +33,8 @@ own or third party Python libraries that the PyCascading scripts use, and want t
 distribute these to the Hadoop server together with the PyCascading master tgz.
 
 The tgz files can contain Python libraries that will be added to the search path.
+The Python sources in them are precompiled to Jython bytecode before they are
+added, so that the Hadoop workers don't need to compile them at startup.
 
 Obviously, this script must be run after every new build of PyCascading for all
 the tgzs that should be added to the PyCascading build.
@@ -51,7 +53,11 @@ pycascading_dir=$(dirname "$0")
 temp=$(mktemp -d -t PyCascading-tmp-XXXXXX)
 gzip -d <"$pycascading_dir/build/pycascading.tgz" >"$temp/pycascading.tar"
 for j in "$@"; do
-    gzip -d <"$j" >"$temp/archive.tar"
+    rm -rf "$temp/archive"
+    mkdir "$temp/archive"
+    tar -x -z -f "$j" -C "$temp/archive"
+    "$pycascading_dir/compile_python.sh" "$temp/archive"
+    tar -c -f "$temp/archive.tar" -C "$temp/archive" .
     tar -A -f "$temp/pycascading.tar" "$temp/archive.tar"
 done
 gzip -c <"$temp/pycascading.tar" >"$pycascading_dir/build/pycascading.tgz"
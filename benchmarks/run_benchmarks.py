@@ -0,0 +1,228 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Runs the end-to-end benchmarks in local mode, and compares the results.
+
+This is a PyCascading script, so run it with local_run.sh from the
+benchmarks folder:
+
+../local_run.sh run_benchmarks.py [options]
+
+Options:
+-s <size>       the size factor of the input data (default 1)
+-w <workloads>  the comma-separated names of the workloads to run (default
+                all of them)
+-r <runs>       the number of runs of each workload; the run with the median
+                wall time is reported (default 3)
+-o <file>       the file where the results are written (default results.tsv)
+-b <file>       the baseline to compare the results to (default baseline.tsv)
+-t <percent>    the change in a metric that counts as a regression (default 10)
+-u              store the results in the baseline
+
+The input data is generated in data/<size> the first time a size is used.
+For every workload the wall time, the input tuples processed per second, the
+bytes of the map outputs summed over all its flows, and the peak heap usage of
+the JVM are recorded. The
+tasks run in the same JVM in local mode, so the heap usage includes theirs.
+The script exits with status 1 if a metric regressed compared to the
+baseline.
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys, os, time, getopt, shutil, tempfile
+
+from java.lang import System
+from java.lang.management import ManagementFactory, MemoryType
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import workloads
+
+
+# The columns of the result files
+COLUMNS = ['workload', 'size', 'wall_s', 'tuples_per_s', 'shuffle_bytes',
+           'peak_heap_mb']
+
+# The metrics where a higher value is better. For the others lower is better.
+HIGHER_IS_BETTER = set(['tuples_per_s'])
+
+
+def _heap_pools():
+    return [pool for pool in ManagementFactory.getMemoryPoolMXBeans()
+            if pool.getType() == MemoryType.HEAP]
+
+
+def _reset_peak_heap():
+    System.gc()
+    for pool in _heap_pools():
+        pool.resetPeakUsage()
+
+
+def _peak_heap():
+    return sum([pool.getPeakUsage().getUsed() for pool in _heap_pools()])
+
+
+def run_workload(workload, data_dir, input_tuples):
+    """Run a workload once, and return its metrics in a dict."""
+    output_dir = tempfile.mkdtemp(prefix='pycascading-bench-')
+    try:
+        _reset_peak_heap()
+        start = time.time()
+        result = workload(data_dir, os.path.join(output_dir, 'out'))
+        if isinstance(result, list):
+            # The workload ran its flows itself
+            handles = result
+        else:
+            handle = result.start(num_reducers=2)
+            handle.wait()
+            handles = [handle]
+        shuffle_bytes = None
+        for handle in handles:
+            value = handle.counters().get('Map-Reduce Framework',
+                                          {}).get('Map output bytes')
+            if value is not None:
+                shuffle_bytes = (shuffle_bytes or 0) + value
+        wall = time.time() - start
+        peak_heap = _peak_heap()
+    finally:
+        shutil.rmtree(output_dir, True)
+    return { 'wall_s' : wall,
+             'tuples_per_s' : input_tuples / wall,
+             'shuffle_bytes' : shuffle_bytes,
+             'peak_heap_mb' : peak_heap / 1048576.0 }
+
+
+def read_results(path):
+    """Read a result file into a dict keyed by (workload, size)."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    f = open(path)
+    try:
+        lines = f.read().splitlines()
+    finally:
+        f.close()
+    for line in lines[1:]:
+        row = dict(zip(COLUMNS, line.split('\t')))
+        for column in COLUMNS[2:]:
+            if row.get(column):
+                row[column] = float(row[column])
+            else:
+                row[column] = None
+        results[(row['workload'], row['size'])] = row
+    return results
+
+
+def write_results(path, results):
+    """Write the results, sorted by workload and size."""
+    f = open(path, 'w')
+    try:
+        f.write('\t'.join(COLUMNS) + '\n')
+        keys = results.keys()
+        keys.sort()
+        for key in keys:
+            row = results[key]
+            values = []
+            for column in COLUMNS:
+                value = row.get(column)
+                if value is None:
+                    values.append('')
+                elif isinstance(value, float):
+                    values.append('%.3f' % value)
+                else:
+                    values.append(str(value))
+            f.write('\t'.join(values) + '\n')
+    finally:
+        f.close()
+
+
+def compare(results, baseline, threshold):
+    """Print the changes of the metrics, and return the regressions.
+
+    Arguments:
+    results -- the current results
+    baseline -- the results to compare to
+    threshold -- the relative change in percent that counts as a regression
+
+    Return:
+    the list of (workload, size, metric) tuples that regressed
+    """
+    regressions = []
+    print '%-12s %6s %-14s %12s %12s %8s' % \
+    ('workload', 'size', 'metric', 'baseline', 'current', 'change')
+    keys = results.keys()
+    keys.sort()
+    for key in keys:
+        if key not in baseline:
+            print '%-12s %6s (no baseline)' % key
+            continue
+        for metric in COLUMNS[2:]:
+            old = baseline[key].get(metric)
+            new = results[key].get(metric)
+            if not old or new is None:
+                continue
+            change = 100.0 * (new - old) / old
+            if metric in HIGHER_IS_BETTER:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold
+            if regressed:
+                regressions.append(key + (metric,))
+            print '%-12s %6s %-14s %12.2f %12.2f %+7.1f%%%s' % \
+            (key[0], key[1], metric, old, new, change,
+             regressed and ' REGRESSION' or '')
+    return regressions
+
+
+def main():
+    opts, args = getopt.getopt(sys.argv[1:], 's:w:r:o:b:t:u')
+    opts = dict(opts)
+    size = opts.get('-s', '1')
+    names = opts.get('-w')
+    runs = int(opts.get('-r', 3))
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = opts.get('-o', 'results.tsv')
+    baseline_file = opts.get('-b', os.path.join(here, 'baseline.tsv'))
+    threshold = float(opts.get('-t', 10))
+
+    data_dir = os.path.join(here, 'data', size)
+    input_counts = workloads.generate_data(data_dir, float(size))
+
+    results = {}
+    for (name, workload, inputs) in workloads.WORKLOADS:
+        if names and name not in names.split(','):
+            continue
+        input_tuples = sum([input_counts[i] for i in inputs])
+        measurements = [run_workload(workload, data_dir, input_tuples)
+                        for i in xrange(runs)]
+        measurements.sort(key=lambda m: m['wall_s'])
+        row = measurements[len(measurements) / 2]
+        row['workload'] = name
+        row['size'] = size
+        results[(name, size)] = row
+        print '%s: %.2f s' % (name, row['wall_s'])
+    write_results(output, results)
+
+    baseline = read_results(baseline_file)
+    if '-u' in opts:
+        baseline.update(results)
+        write_results(baseline_file, baseline)
+        print 'Baseline updated in', baseline_file
+    elif baseline:
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+    else:
+        print 'No baseline found in %s, store one with -u' % baseline_file
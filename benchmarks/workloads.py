@@ -0,0 +1,244 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""The workloads of the end-to-end benchmarks, and their input data.
+
+The workloads are the pipelines of the word_count, joins, reduce, total_sort,
+and pagerank examples, reading their inputs from a data folder instead of
+pycascading_data. The inputs are generated with a fixed random seed, so the
+same size factor always results in the same data. A size factor of 1 is about
+as much data as a local run can process in a few seconds.
+
+Every workload is a function called as workload(data_dir, output_dir) that
+builds its flow and returns it without running it, except for pagerank, which
+runs its iterations itself and returns the FlowHandles of the flows it ran.
+The pagerank pipeline is imported from the example.
+
+Exports the following:
+WORKLOADS
+generate_data
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys, os, random
+
+from pycascading.helpers import *
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'examples'))
+import pagerank as pagerank_example
+
+
+# The number of text lines for a size factor of 1
+_LINES = 20000
+
+# The number of rows of the join inputs for a size factor of 1
+_ROWS = 10000
+
+# The number of nodes of the graph for a size factor of 1
+_NODES = 2000
+
+# The number of PageRank iterations
+_ITERATIONS = 3
+
+
+def _words(rnd, n):
+    """Return a list of n distinct random words."""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < n:
+        words.add(''.join([rnd.choice(letters)
+                           for i in xrange(rnd.randint(2, 10))]))
+    words = list(words)
+    words.sort()
+    rnd.shuffle(words)
+    return words
+
+
+def _zipf_choice(rnd, words):
+    """Choose a word with a skewed distribution, like in natural text."""
+    return words[int(len(words) ** rnd.random()) - 1]
+
+
+def _write_lines(path, lines):
+    f = open(path, 'w')
+    try:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+    finally:
+        f.close()
+
+
+def generate_data(data_dir, size):
+    """Generate the inputs of the workloads, unless they exist already.
+
+    Arguments:
+    data_dir -- the folder where the inputs are written
+    size -- the size factor, a positive number
+
+    Return:
+    a dict of the input files mapped to the number of lines in them
+    """
+    words = _words(random.Random(0), 5000)
+    counts = {}
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    def generate(name, n, line):
+        path = os.path.join(data_dir, name)
+        counts[name] = n
+        if not os.path.exists(path):
+            # Every file has its own random generator, so that it is the same
+            # even if the other files exist already
+            rnd = random.Random(len(counts) * 1000003 + n)
+            # Write to a temporary file so that an interrupted run doesn't
+            # leave incomplete data behind
+            _write_lines(path + '.tmp', (line(rnd, i) for i in xrange(n)))
+            os.rename(path + '.tmp', path)
+
+    def text_line(rnd, i):
+        first = ('A' if rnd.random() < 0.2 else '') + _zipf_choice(rnd, words)
+        return ' '.join([first] + [_zipf_choice(rnd, words)
+                                   for j in xrange(rnd.randint(0, 15))])
+    generate('text.txt', int(_LINES * size), text_line)
+
+    rows = int(_ROWS * size)
+    generate('lhs.txt', rows,
+             lambda rnd, i: '%d %s' % (rnd.randint(0, rows),
+                                       rnd.choice(words)))
+    generate('rhs.txt', rows,
+             lambda rnd, i: '%d %s' % (rnd.randint(0, rows),
+                                       rnd.choice(words).upper()))
+
+    # Every node has at least one outgoing link, as the example assumes that
+    # there are no dangling nodes
+    nodes = int(_NODES * size)
+    def link(rnd, i):
+        source = i % nodes
+        dest = int(nodes ** rnd.random()) - 1
+        if dest == source:
+            dest = (dest + 1) % nodes
+        return 'n%d n%d' % (source, dest)
+    generate('graph.txt', 5 * nodes, link)
+    return counts
+
+
+@udf_map(produces=['word'])
+def split_words(tuple):
+    for word in tuple.get(1).split():
+        yield [word]
+
+
+def word_count(data_dir, output_dir):
+    flow = Flow()
+    input = flow.source(Hfs(TextLine(), os.path.join(data_dir, 'text.txt')))
+    output = flow.tsv_sink(output_dir)
+    input | split_words | group_by('word', native.count()) | output
+    return flow
+
+
+@udf_map(produces=['ucase_lhs2', 'rhs2'])
+def upper_case(tuple):
+    return [tuple.get('lhs2').upper(), tuple.get('rhs2')]
+
+
+def joins(data_dir, output_dir):
+    flow = Flow()
+    scheme = TextDelimited(Fields(['col1', 'col2']), ' ', [Integer, String])
+    lhs = flow.source(Hfs(scheme, os.path.join(data_dir, 'lhs.txt')))
+    rhs = flow.source(Hfs(scheme, os.path.join(data_dir, 'rhs.txt')))
+    output1 = flow.tsv_sink(os.path.join(output_dir, 'out1'))
+    output2 = flow.tsv_sink(os.path.join(output_dir, 'out2'))
+
+    p = (lhs & rhs) | \
+    inner_join(['col1', 'col1'],
+               declared_fields=['lhs1', 'lhs2', 'rhs1', 'rhs2'])
+    p | retain('lhs2', 'rhs2') | output1
+    ((p | upper_case) & (rhs | retain('col2'))) | \
+    inner_join(['ucase_lhs2', 'col2']) | output2
+    return flow
+
+
+@udf_filter
+def starts_with_letter(tuple, letter):
+    try:
+        return tuple.get(1)[0].upper() == letter
+    except:
+        return False
+
+
+@udf_map
+def line_word_count(tuple):
+    return [len(tuple.get(1).split()), tuple.get(1)]
+
+
+@udf_buffer(produces=['word_count', 'count', 'first_chars'])
+def count_lines(group, tuples):
+    c = 0
+    first_char = ''
+    for tuple in tuples:
+        c += 1
+        first_char += tuple.get('line')[0]
+    yield [group.get(0), c, first_char]
+
+
+def reduce(data_dir, output_dir):
+    flow = Flow()
+    input = flow.source(Hfs(TextLine(), os.path.join(data_dir, 'text.txt')))
+    output = flow.tsv_sink(output_dir)
+    input | filter_by(starts_with_letter('A')) | \
+    map_replace(line_word_count(), ['word_count', 'line']) | \
+    group_by('word_count', count_lines()) | output
+    return flow
+
+
+@udf_map
+def split_line(tuple):
+    for word in tuple.get(1).split():
+        yield [word]
+
+
+def total_sort(data_dir, output_dir):
+    flow = Flow()
+    input = flow.source(Hfs(TextLine(), os.path.join(data_dir, 'text.txt')))
+    output = flow.tsv_sink(output_dir)
+    input | map_replace(split_line, 'word') | group_by('word') | \
+    native.count() | \
+    group_by(Fields.VALUES, sort_fields=['count'], reverse_order=True) | \
+    output
+    return flow
+
+
+def pagerank(data_dir, output_dir):
+    flow = Flow()
+    graph = flow.source(Hfs(TextDelimited(Fields(['from', 'to']), ' ',
+                                          [String, String]),
+                            os.path.join(data_dir, 'graph.txt')))
+    pagerank_example.pagerank(flow, graph, 0.85, _ITERATIONS, output_dir)
+    return flow.iteration_handles
+
+
+# The workloads, and the input files whose lines are counted as their input
+# tuples
+WORKLOADS = [
+    ('word_count', word_count, ['text.txt']),
+    ('joins', joins, ['lhs.txt', 'rhs.txt']),
+    ('reduce', reduce, ['text.txt']),
+    ('total_sort', total_sort, ['text.txt']),
+    ('pagerank', pagerank, ['graph.txt']),
+]
@@ -0,0 +1,55 @@
+#!/usr/bin/env bash
+
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Precompiles Python sources to Jython bytecode ($py.class files).
+#
+# The mappers and reducers use the precompiled files if they are shipped in the
+# archives together with the sources, instead of compiling the modules every
+# time they start up.
+#
+
+usage()
+{
+    cat << EOF
+Usage: $0 <folder1> [<folder2> ...]
+
+Compiles all the Python sources in the folders recursively with Jython. The
+location of Jython is taken from java/dependencies.properties. If Jython cannot
+be found, nothing is compiled, and the sources will be compiled on the Hadoop
+workers as usual.
+
+EOF
+}
+
+if [ $# -eq 0 ]; then
+    usage
+    exit
+fi
+
+pycascading_dir=$(dirname "$0")
+source "$pycascading_dir/java/dependencies.properties"
+
+if [ ! -e "$jython/jython.jar" ]; then
+    echo "Jython was not found in $jython, the Python sources are not precompiled." >&2
+    exit
+fi
+
+java -Dpython.home="$jython" -classpath "$jython/jython.jar" \
+org.python.util.jython -c \
+"import sys, compileall; [compileall.compile_dir(d, quiet=1) for d in sys.argv[1 :]]" \
+"$@" >/dev/null
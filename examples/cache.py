@@ -22,7 +22,9 @@ different separators: after the first run, the checkpointed state will be
 used for subsequent runs.
 
 This is useful if we want to repeatedly run the script with modifications
-to parts that do not change the cached results.
+to parts that do not change the cached results. If we change the pipeline
+before the cache (for instance find_lines_with_beginning or its parameter),
+or the input file, the cached data is regenerated automatically.
 
 For this script, the first run will have two MR jobs, but any subsequent runs
 will only have one, as the
@@ -0,0 +1,69 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Example showing how to run several flows together in a cascade.
+
+The word and character counting flows are independent of each other, so they
+are run concurrently. The last flow reads the output of the word count, so it
+is started only after that has finished. Running the script again skips all
+the flows, as their outputs are newer than their inputs.
+"""
+
+from __future__ import with_statement
+
+from pycascading.helpers import *
+
+
+@udf_map(produces=['word'])
+def split_words(tuple):
+    for word in tuple.get(1).split():
+        yield [word]
+
+
+@udf_map(produces=['char'])
+def split_chars(tuple):
+    for char in tuple.get(1):
+        yield [char]
+
+
+@udf_filter
+def frequent(tuple):
+    return tuple.get('count') > 1
+
+
+def main():
+    town = Hfs(TextLine(), 'pycascading_data/town.txt')
+    word_counts = 'pycascading_data/out/cascade/words'
+
+    with cascade():
+        flow = Flow()
+        flow.source(town) | split_words | \
+        group_by('word', native.count('count')) | \
+        flow.tsv_sink(word_counts)
+        flow.run(num_reducers=1)
+
+        flow = Flow()
+        flow.source(town) | split_chars | \
+        group_by('char', native.count('count')) | \
+        flow.tsv_sink('pycascading_data/out/cascade/chars')
+        flow.run(num_reducers=1)
+
+        # We cannot use a meta_source here as the word counts don't exist yet
+        flow = Flow()
+        flow.source(Hfs(TextDelimited(Fields(['word', 'count']), '\t',
+                                      [String, Integer]), word_counts)) | \
+        filter_by(frequent) | \
+        flow.tsv_sink('pycascading_data/out/cascade/frequent')
+        flow.run(num_reducers=1)
@@ -57,98 +57,118 @@ def test(graph_file, d, iterations):
     return old_pr
 
 
-def main():
-    """The PyCascading job."""
-    # The damping factor
-    d = 0.85
-    # The number of iterations
-    iterations = 5
+@udf
+def constant(tuple, c):
+    """Just a field with a constant value c."""
+    yield [c]
 
-    # The directed, unweighted graph in a space-separated file, in
-    # <source_node> <destination_node> format
-    graph_file = 'pycascading_data/graph.txt'
 
-    graph_source = Hfs(TextDelimited(Fields(['from', 'to']), ' ',
-                                     [String, String]), graph_file)
+@udf
+def both_nodes(tuple):
+    """For each link returns both endpoints."""
+    yield [tuple.get(0)]
+    yield [tuple.get(1)]
 
-    out_links_file = 'pycascading_data/out/pagerank/out_links'
-    pr_values_1 = 'pycascading_data/out/pagerank/iter1'
-    pr_values_2 = 'pycascading_data/out/pagerank/iter2'
 
-    # Some setup here: we'll need the ougoing degree of nodes, and we will
-    # initialize the pageranks of nodes to 1.0
-    flow = Flow()
-    graph = flow.source(graph_source)
+@udf
+def incremental_pagerank(tuple, d):
+    """The part of the source's pagerank that goes through a link."""
+    yield [d * tuple.get('from_pagerank') / tuple.get('out_degree')]
 
-    # Count the number of outgoing links for every node that is a source,
-    # and store it in a field called 'out_degree'
-    graph | group_by('from') | native.count('out_degree') | \
-    flow.binary_sink(out_links_file)
 
-    # Initialize the pageranks of all nodes to 1.0
-    # This file has fields 'node' and 'pagerank', and is stored to pr_values_1
-    @udf
-    def constant(tuple, c):
-        """Just a field with a constant value c."""
-        yield [c]
-    @udf
-    def both_nodes(tuple):
-        """For each link returns both endpoints."""
-        yield [tuple.get(0)]
-        yield [tuple.get(1)]
-    graph | map_replace(both_nodes, 'node') | \
-    native.unique(Fields.ALL) | map_add(constant(1.0), 'pagerank') | \
-    flow.binary_sink(pr_values_1)
+def initial_state(graph):
+    """Return the links with the out-degrees, and the initial pageranks.
 
-    flow.run(num_reducers=1)
+    The links have the fields 'from', 'out_degree', and 'to', and the
+    pageranks have the fields 'node' and 'pagerank'.
+    """
+    # Count the number of outgoing links for every node that is a source,
+    # and store it in a field called 'out_degree'. We join this to the links
+    # only once, as it doesn't change between the iterations.
+    out_links = graph | group_by('from', native.count('out_degree')) | \
+    rename('from', 'from_out')
+    links = (graph & out_links) | inner_join(['from', 'from_out']) | \
+    retain('from', 'out_degree', 'to')
 
-    pr_input = pr_values_1
-    pr_output = pr_values_2
-    for iteration in xrange(0, iterations):
-        flow = Flow()
+    # Initialize the pageranks of all nodes to 1.0
+    pageranks = graph | map_replace(both_nodes, 'node') | \
+    native.unique(Fields.ALL) | map_add(constant(1.0), 'pagerank')
+    return (links, pageranks)
 
-        graph = flow.source(graph_source)
-        pageranks = flow.meta_source(pr_input)
-        out_links = flow.meta_source(out_links_file)
 
-        # Decorate the graph's source nodes with their pageranks and the
-        # number of their outgoing links
-        # We could have joined graph & out_links outside of the loop, but
-        # in order to demonstrate joins with multiple streams, we do it here
-        p = (graph & pageranks & (out_links | rename('from', 'from_out'))) | \
-        inner_join(['from', 'node', 'from_out']) | \
-        rename(['pagerank', 'out_degree'], ['from_pagerank', 'from_out_degree']) | \
-        retain('from', 'from_pagerank', 'from_out_degree', 'to')
+def pagerank_iteration(d):
+    """Return the body of the iterations for Flow.iterate."""
+    def iteration(flow, inputs, pageranks):
+        """Calculate the new pageranks from the previous ones."""
+        # Decorate the links' source nodes with their pageranks
+        p = (inputs['links'] & pageranks) | inner_join(['from', 'node']) | \
+        rename('pagerank', 'from_pagerank') | \
+        retain('from', 'from_pagerank', 'out_degree', 'to')
 
         # Distribute the sources' pageranks to their out-neighbors equally
-        @udf
-        def incremental_pagerank(tuple, d):
-            yield [d * tuple.get('from_pagerank') / tuple.get('from_out_degree')]
-        p = p | map_replace(['from', 'from_pagerank', 'from_out_degree'],
+        p = p | map_replace(['from', 'from_pagerank', 'out_degree'],
                             incremental_pagerank(d), 'incr_pagerank') | \
         rename('to', 'node') | retain('node', 'incr_pagerank')
 
         # Add the constant jump probability to all the pageranks that come
         # from the in-links
-        p = (p & (pageranks | map_replace('pagerank', constant(1.0 - d), 'incr_pagerank'))) | group_by()
-        p = p | group_by('node', 'incr_pagerank', native.sum('pagerank'))
+        p = (p & (pageranks | map_replace('pagerank', constant(1.0 - d),
+                                          'incr_pagerank'))) | group_by()
+        return p | group_by('node', 'incr_pagerank', native.sum('pagerank'))
+    return iteration
+
+
+def pagerank(flow, graph, d, iterations, work_dir, num_reducers=1):
+    """Run the PageRank iterations on a graph.
+
+    Arguments:
+    flow -- the flow of the graph
+    graph -- the pipe of the links, with the fields 'from' and 'to'
+    d -- the damping factor
+    iterations -- the number of iterations
+    work_dir -- the folder where the iterations store their states
+    num_reducers -- the number of reducers of the flows
 
-        if iteration == iterations - 1:
-            # Only store the final result in a TSV file
-            p | flow.tsv_sink(pr_output)
-        else:
-            # Store intermediate results in a binary format for faster IO
-            p | flow.binary_sink(pr_output)
+    Return:
+    the folder with the final pageranks in a binary format
+    """
+    (links, pageranks) = initial_state(graph)
+    return flow.iterate(pagerank_iteration(d), { 'links' : links },
+                        iterations, state=pageranks,
+                        key={ 'links' : 'from', 'state' : 'node' },
+                        work_dir=work_dir, num_reducers=num_reducers)
 
-        # Swap the input and output folders for the next iteration
-        tmp = pr_input
-        pr_input = pr_output
-        pr_output = tmp
 
-        flow.run(num_reducers=1)
+def main():
+    """The PyCascading job."""
+    # The damping factor
+    d = 0.85
+    # The number of iterations
+    iterations = 5
+
+    # The directed, unweighted graph in a space-separated file, in
+    # <source_node> <destination_node> format
+    graph_file = 'pycascading_data/graph.txt'
+
+    graph_source = Hfs(TextDelimited(Fields(['from', 'to']), ' ',
+                                     [String, String]), graph_file)
+
+    work_dir = 'pycascading_data/out/pagerank/work'
+    pr_output = 'pycascading_data/out/pagerank/result'
+
+    flow = Flow()
+    graph = flow.source(graph_source)
+
+    # The final pageranks are stored in a binary format in the work folder
+    pr_binary = pagerank(flow, graph, d, iterations, work_dir)
+
+    # Store the final result in a TSV file
+    flow = Flow()
+    flow.meta_source(pr_binary) | flow.tsv_sink(pr_output)
+    flow.run(num_reducers=1)
 
-    print 'Results from PyCascading:', pr_input
-    os.system('cat %s/.pycascading_header %s/part*' % (pr_input, pr_input))
+    print 'Results from PyCascading:', pr_output
+    os.system('cat %s/.pycascading_header %s/part*' % (pr_output, pr_output))
 
     print 'The test values:'
     test_pr = test(graph_file, d, iterations)
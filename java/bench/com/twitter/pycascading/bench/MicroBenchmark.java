@@ -0,0 +1,524 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.bench;
+
+import java.io.BufferedInputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataOutputStream;
+import java.io.File;
+import java.io.FileWriter;
+import java.io.IOException;
+import java.io.PrintWriter;
+import java.math.BigInteger;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Iterator;
+import java.util.List;
+import java.util.Properties;
+import java.util.Random;
+import java.util.regex.Pattern;
+
+import org.apache.hadoop.io.WritableUtils;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.OutputCollector;
+import org.python.core.PyFunction;
+import org.python.core.PyObject;
+import org.python.core.PyTuple;
+import org.python.util.PythonInterpreter;
+
+import cascading.operation.ConcreteCall;
+import cascading.scheme.Scheme;
+import cascading.scheme.TextDelimited;
+import cascading.tuple.Fields;
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntry;
+import cascading.tuple.TupleEntryCollector;
+
+import com.twitter.pycascading.CascadingBaseOperationWrapper.ConvertInputTuples;
+import com.twitter.pycascading.CascadingBufferWrapper;
+import com.twitter.pycascading.CascadingFilterWrapper;
+import com.twitter.pycascading.CascadingFunctionWrapper;
+import com.twitter.pycascading.CascadingRecordProducerWrapper.OutputMethod;
+import com.twitter.pycascading.CascadingRecordProducerWrapper.OutputType;
+import com.twitter.pycascading.MetaScheme;
+import com.twitter.pycascading.bigintegerserialization.BigIntegerComparator;
+import com.twitter.pycascading.bigintegerserialization.BigIntegerDeserializer;
+import com.twitter.pycascading.bigintegerserialization.BigIntegerSerializer;
+import com.twitter.pycascading.memory.MemoryFlowProcess;
+import com.twitter.pycascading.pythonserialization.PythonDeserializer;
+import com.twitter.pycascading.pythonserialization.PythonSerializer;
+
+/**
+ * Micro-benchmarks of the paths between Cascading and the Python UDFs.
+ *
+ * The operation wrappers are called directly with synthetic input tuples,
+ * without a flow around them, for every combination of input conversion,
+ * output method and output type. The Python functions do as little as
+ * possible, so that the time is spent in the wrappers and in Jython. The
+ * Python and BigInteger serializers, the BigInteger comparator and the
+ * MetaScheme sink are measured as well.
+ *
+ * Every benchmark is warmed up, and then run for a number of rounds of a fixed
+ * duration. The results are written to a tab-separated file with the name and
+ * parameters of each benchmark, and the mean and standard deviation of the
+ * operations per second over the rounds, so that runs can be compared (see
+ * micro_benchmark.sh).
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class MicroBenchmark {
+  // The operations are run in batches of this size between the clock checks
+  private static final int BATCH = 1000;
+
+  // The number of tuples in a group passed to the buffers
+  private static final int GROUP_SIZE = 100;
+
+  // The number of different input tuples, which must be a power of 2
+  private static final int NUM_INPUTS = 1024;
+
+  private static final Fields INPUT_FIELDS = new Fields("word", "count");
+  private static final Fields OUTPUT_FIELDS = new Fields("word", "n");
+
+  /**
+   * A benchmark that runs an operation a given number of times.
+   */
+  private static abstract class Case {
+    final String name;
+    final String params;
+
+    Case(String name, String params) {
+      this.name = name;
+      this.params = params;
+    }
+
+    abstract void run(int n) throws Exception;
+  }
+
+  /**
+   * A collector that only counts the tuples, so that the output tuples are
+   * not optimized away.
+   */
+  private static class CountingCollector extends TupleEntryCollector {
+    long count = 0;
+
+    @Override
+    public void add(TupleEntry tupleEntry) {
+      count++;
+    }
+
+    @Override
+    public void add(Tuple tuple) {
+      count++;
+    }
+
+    protected void collect(Tuple tuple) {
+      count++;
+    }
+  }
+
+  private final PythonInterpreter interpreter;
+  private final MemoryFlowProcess flowProcess = new MemoryFlowProcess(new JobConf());
+  private final TupleEntry[] inputs = new TupleEntry[NUM_INPUTS];
+  private final List<Case> cases = new ArrayList<Case>();
+  private int functionCounter = 0;
+
+  public MicroBenchmark() {
+    Properties props = new Properties();
+    props.put("python.cachedir.skip", "true");
+    PythonInterpreter.initialize(System.getProperties(), props, new String[0]);
+    interpreter = new PythonInterpreter();
+    interpreter.exec("from cascading.tuple import Tuple, TupleEntry");
+    interpreter.set("output_fields", OUTPUT_FIELDS);
+
+    Random random = new Random(0);
+    for (int i = 0; i < NUM_INPUTS; i++) {
+      Tuple tuple = new Tuple(new Object[] { "word" + random.nextInt(100000),
+              random.nextInt(1000) });
+      inputs[i] = new TupleEntry(INPUT_FIELDS, tuple);
+    }
+  }
+
+  /**
+   * Define a Python function and return it.
+   *
+   * @param args
+   *          the arguments of the function
+   * @param body
+   *          the body of the function, with lines separated by newlines
+   * @return the function object
+   */
+  private PyFunction define(String args, String body) {
+    String name = "f" + (functionCounter++);
+    StringBuilder source = new StringBuilder("def " + name + "(" + args + "):\n");
+    for (String line : body.split("\n"))
+      source.append("    " + line + "\n");
+    interpreter.exec(source.toString());
+    return (PyFunction) interpreter.get(name);
+  }
+
+  // The Python expression that gets the first field of the input tuple
+  private static String inputExpression(ConvertInputTuples convert) {
+    if (convert == ConvertInputTuples.NONE)
+      return "t.get(0)";
+    else if (convert == ConvertInputTuples.PYTHON_LIST)
+      return "t[0]";
+    else
+      return "t['word']";
+  }
+
+  // The Python statement that builds an output record r of the given type.
+  // With AUTO the wrapper finds out the type from the first record, and the
+  // UDFs usually output Python lists.
+  private static String outputStatement(OutputType type) {
+    if (type == OutputType.PYTHON_LIST || type == OutputType.AUTO)
+      return "r = [w, 1]";
+    String tuple = "r = Tuple()\nr.add(w)\nr.add(1)";
+    if (type == OutputType.TUPLE)
+      return tuple;
+    else
+      return tuple + "\nr = TupleEntry(output_fields, r)";
+  }
+
+  // The Python statement that passes on the record r. With YIELDS_OR_RETURNS
+  // the wrapper finds out from the first call that the function is a
+  // generator.
+  private static String emitStatement(OutputMethod method) {
+    if (method == OutputMethod.RETURNS)
+      return "return r";
+    else if (method == OutputMethod.YIELDS || method == OutputMethod.YIELDS_OR_RETURNS)
+      return "yield r";
+    else
+      return "collector.add(r)";
+  }
+
+  // The output types that can be used with an output method. A function that
+  // collects its output has to add Cascading tuples or tuple entries. AUTO
+  // with YIELDS_OR_RETURNS is the default of the undecorated UDFs.
+  private static List<OutputType> outputTypes(OutputMethod method) {
+    if (method == OutputMethod.COLLECTS)
+      return Arrays.asList(OutputType.TUPLE, OutputType.TUPLEENTRY);
+    else
+      return Arrays.asList(OutputType.AUTO, OutputType.PYTHON_LIST, OutputType.TUPLE,
+              OutputType.TUPLEENTRY);
+  }
+
+  private static final OutputMethod[] OUTPUT_METHODS = { OutputMethod.RETURNS,
+          OutputMethod.YIELDS, OutputMethod.YIELDS_OR_RETURNS, OutputMethod.COLLECTS };
+
+  private void addFunctionCases() {
+    for (final ConvertInputTuples convert : ConvertInputTuples.values()) {
+      for (OutputMethod method : OUTPUT_METHODS) {
+        for (OutputType type : outputTypes(method)) {
+          final CascadingFunctionWrapper wrapper = new CascadingFunctionWrapper(OUTPUT_FIELDS);
+          wrapper.setConvertInputTuples(convert);
+          wrapper.setOutputMethod(method);
+          wrapper.setOutputType(type);
+          wrapper.setFunction(define(method == OutputMethod.COLLECTS ? "t, collector" : "t",
+                  "w = " + inputExpression(convert) + "\n" + outputStatement(type) + "\n"
+                          + emitStatement(method)));
+          wrapper.setContextArgs(new PyTuple());
+          final ConcreteCall call = new ConcreteCall();
+          call.setOutputCollector(new CountingCollector());
+          cases.add(new Case("function", convert + "/" + method + "/" + type) {
+            int next = 0;
+
+            void run(int n) {
+              for (int i = 0; i < n; i++) {
+                call.setArguments(inputs[next++ & (NUM_INPUTS - 1)]);
+                wrapper.operate(flowProcess, call);
+              }
+            }
+          });
+        }
+      }
+    }
+  }
+
+  private void addFilterCases() {
+    for (ConvertInputTuples convert : ConvertInputTuples.values()) {
+      final CascadingFilterWrapper wrapper = new CascadingFilterWrapper(OUTPUT_FIELDS);
+      wrapper.setConvertInputTuples(convert);
+      wrapper.setFunction(define("t", "return " + inputExpression(convert) + " < 'word5'"));
+      wrapper.setContextArgs(new PyTuple());
+      final ConcreteCall call = new ConcreteCall();
+      cases.add(new Case("filter", convert.toString()) {
+        int next = 0;
+
+        void run(int n) {
+          for (int i = 0; i < n; i++) {
+            call.setArguments(inputs[next++ & (NUM_INPUTS - 1)]);
+            wrapper.isRemove(flowProcess, call);
+          }
+        }
+      });
+    }
+  }
+
+  private void addBufferCases() {
+    final TupleEntry group = new TupleEntry(new Fields("key"), new Tuple(new Object[] { "key" }));
+    for (OutputMethod method : OUTPUT_METHODS) {
+      for (OutputType type : outputTypes(method)) {
+        final CascadingBufferWrapper wrapper = new CascadingBufferWrapper(OUTPUT_FIELDS);
+        wrapper.setConvertInputTuples(ConvertInputTuples.NONE);
+        wrapper.setOutputMethod(method);
+        wrapper.setOutputType(type);
+        // A buffer that returns can only output one record for the group
+        String body;
+        if (method == OutputMethod.RETURNS)
+          body = "for t in tuples:\n    w = t.get(0)\n" + outputStatement(type) + "\nreturn r";
+        else
+          body = "for t in tuples:\n    w = t.get(0)\n"
+                  + ("    " + outputStatement(type)).replace("\n", "\n    ") + "\n    "
+                  + emitStatement(method);
+        wrapper.setFunction(define(method == OutputMethod.COLLECTS ? "group, tuples, collector"
+                : "group, tuples", body));
+        wrapper.setContextArgs(new PyTuple());
+        final ConcreteCall call = new ConcreteCall();
+        call.setOutputCollector(new CountingCollector());
+        call.setGroup(group);
+        cases.add(new Case("buffer", method + "/" + type) {
+          int next = 0;
+
+          void run(int n) {
+            // n is the number of tuples, in groups of GROUP_SIZE
+            for (int i = 0; i < n; i += GROUP_SIZE) {
+              final int start = next;
+              next += GROUP_SIZE;
+              call.setArgumentsIterator(new Iterator<TupleEntry>() {
+                int j = start;
+
+                public boolean hasNext() {
+                  return j < start + GROUP_SIZE;
+                }
+
+                public TupleEntry next() {
+                  return inputs[j++ & (NUM_INPUTS - 1)];
+                }
+
+                public void remove() {
+                  throw new UnsupportedOperationException();
+                }
+              });
+              wrapper.operate(flowProcess, call);
+            }
+          }
+        });
+      }
+    }
+  }
+
+  private void addSerializationCases() throws IOException {
+    String[][] objects = { { "int", "12345" }, { "string", "'a short string'" },
+            { "list", "['word', 12, 3.5]" }, { "dict", "{'word': 'hello', 'count': 12}" } };
+    for (String[] object : objects) {
+      final PyObject value = interpreter.eval(object[1]);
+      final ByteArrayOutputStream baos = new ByteArrayOutputStream();
+      final PythonSerializer serializer = new PythonSerializer();
+      serializer.open(baos);
+      cases.add(new Case("python_serializer", object[0]) {
+        void run(int n) throws IOException {
+          baos.reset();
+          for (int i = 0; i < n; i++)
+            serializer.serialize(value);
+        }
+      });
+
+      ByteArrayOutputStream serialized = new ByteArrayOutputStream();
+      PythonSerializer s = new PythonSerializer();
+      s.open(serialized);
+      for (int i = 0; i < BATCH; i++)
+        s.serialize(value);
+      final byte[] bytes = serialized.toByteArray();
+      final PythonDeserializer deserializer = new PythonDeserializer(PyObject.class);
+      cases.add(new Case("python_deserializer", object[0]) {
+        void run(int n) throws IOException {
+          for (int i = 0; i < n; i += BATCH) {
+            deserializer.open(new ByteArrayInputStream(bytes));
+            for (int j = 0; j < BATCH; j++)
+              deserializer.deserialize(null);
+          }
+        }
+      });
+    }
+
+    final BigInteger[] numbers = new BigInteger[BATCH];
+    Random random = new Random(0);
+    for (int i = 0; i < BATCH; i++)
+      numbers[i] = BigInteger.valueOf(random.nextLong() >> random.nextInt(64));
+    final ByteArrayOutputStream baos = new ByteArrayOutputStream();
+    final BigIntegerSerializer serializer = new BigIntegerSerializer();
+    serializer.open(baos);
+    cases.add(new Case("biginteger_serializer", "") {
+      void run(int n) throws IOException {
+        baos.reset();
+        for (int i = 0; i < n; i++)
+          serializer.serialize(numbers[i % BATCH]);
+      }
+    });
+
+    ByteArrayOutputStream serialized = new ByteArrayOutputStream();
+    BigIntegerSerializer s = new BigIntegerSerializer();
+    s.open(serialized);
+    for (BigInteger number : numbers)
+      s.serialize(number);
+    s.close();
+    final byte[] bytes = serialized.toByteArray();
+    final BigIntegerDeserializer deserializer = new BigIntegerDeserializer(BigInteger.class);
+    cases.add(new Case("biginteger_deserializer", "") {
+      void run(int n) throws IOException {
+        for (int i = 0; i < n; i += BATCH) {
+          deserializer.open(new ByteArrayInputStream(bytes));
+          for (int j = 0; j < BATCH; j++)
+            deserializer.deserialize(null);
+        }
+      }
+    });
+
+    final BigIntegerComparator comparator = new BigIntegerComparator(BigInteger.class);
+    final byte[][] encoded = new byte[BATCH][];
+    for (int i = 0; i < BATCH; i++) {
+      ByteArrayOutputStream out = new ByteArrayOutputStream();
+      DataOutputStream data = new DataOutputStream(out);
+      WritableUtils.writeVLong(data, numbers[i].longValue());
+      data.close();
+      encoded[i] = out.toByteArray();
+    }
+    cases.add(new Case("biginteger_comparator", "stream") {
+      void run(int n) {
+        for (int i = 0; i < n; i++) {
+          comparator.compare(new BufferedInputStream(new ByteArrayInputStream(encoded[i % BATCH])),
+                  new BufferedInputStream(new ByteArrayInputStream(encoded[(i + 1) % BATCH])));
+        }
+      }
+    });
+    cases.add(new Case("biginteger_comparator", "object") {
+      void run(int n) {
+        for (int i = 0; i < n; i++)
+          comparator.compare(numbers[i % BATCH], numbers[(i + 1) % BATCH]);
+      }
+    });
+  }
+
+  private void addMetaSchemeCases() throws IOException {
+    File folder = File.createTempFile("pycascading-bench-", "");
+    folder.delete();
+    folder.mkdirs();
+    folder.deleteOnExit();
+    final Scheme scheme = MetaScheme.getSinkScheme(new TextDelimited(INPUT_FIELDS, "\t"),
+            folder.getAbsolutePath());
+    final OutputCollector collector = new OutputCollector() {
+      long count = 0;
+
+      public void collect(Object key, Object value) {
+        count++;
+      }
+    };
+    cases.add(new Case("metascheme_sink", "text_delimited") {
+      int next = 0;
+
+      void run(int n) throws IOException {
+        for (int i = 0; i < n; i++)
+          scheme.sink(inputs[next++ & (NUM_INPUTS - 1)], collector);
+      }
+    });
+  }
+
+  /**
+   * Run a benchmark.
+   *
+   * @return the operations per second in the measured rounds
+   */
+  private static double[] measure(Case benchmark, int rounds, long roundMillis) throws Exception {
+    // The first round is for warming up
+    double[] result = new double[rounds];
+    for (int round = -1; round < rounds; round++) {
+      long start = System.nanoTime();
+      long deadline = start + roundMillis * 1000000L;
+      long ops = 0;
+      long now;
+      do {
+        benchmark.run(BATCH);
+        ops += BATCH;
+        now = System.nanoTime();
+      } while (now < deadline);
+      if (round >= 0)
+        result[round] = ops * 1e9 / (now - start);
+    }
+    return result;
+  }
+
+  /**
+   * @param args
+   *          [-r rounds] [-t round_ms] [-f regex] output_file
+   */
+  public static void main(String[] args) throws Exception {
+    int rounds = 5;
+    long roundMillis = 1000;
+    Pattern filter = null;
+    String output = null;
+    for (int i = 0; i < args.length; i++) {
+      if ("-r".equals(args[i]))
+        rounds = Integer.parseInt(args[++i]);
+      else if ("-t".equals(args[i]))
+        roundMillis = Long.parseLong(args[++i]);
+      else if ("-f".equals(args[i]))
+        filter = Pattern.compile(args[++i]);
+      else
+        output = args[i];
+    }
+    if (output == null) {
+      System.err.println("Usage: MicroBenchmark [-r rounds] [-t round_ms] [-f regex] output_file");
+      System.exit(1);
+    }
+
+    MicroBenchmark bench = new MicroBenchmark();
+    bench.addFunctionCases();
+    bench.addFilterCases();
+    bench.addBufferCases();
+    bench.addSerializationCases();
+    bench.addMetaSchemeCases();
+
+    PrintWriter out = new PrintWriter(new FileWriter(output));
+    out.println("benchmark\tparams\tops_per_sec\tstddev\trounds");
+    for (Case benchmark : bench.cases) {
+      String id = benchmark.name + "\t" + benchmark.params;
+      if (filter != null && !filter.matcher(benchmark.name + "/" + benchmark.params).find())
+        continue;
+      double[] rates;
+      try {
+        rates = measure(benchmark, rounds, roundMillis);
+      } catch (Exception e) {
+        // Report the failure, but go on with the other benchmarks
+        System.err.println(id + "\tfailed: " + e);
+        out.println(id + "\tfailed\t\t0");
+        continue;
+      }
+      double mean = 0;
+      for (double rate : rates)
+        mean += rate / rates.length;
+      double variance = 0;
+      for (double rate : rates)
+        variance += (rate - mean) * (rate - mean) / Math.max(1, rates.length - 1);
+      String line = String.format("%s\t%.0f\t%.0f\t%d", id, mean, Math.sqrt(variance),
+              rates.length);
+      System.out.println(line);
+      out.println(line);
+      out.flush();
+    }
+    out.close();
+  }
+}
@@ -0,0 +1,74 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.bench;
+
+import java.util.Properties;
+
+import org.apache.hadoop.mapred.JobConf;
+import org.python.util.PythonInterpreter;
+
+import cascading.flow.hadoop.HadoopFlowProcess;
+
+import com.twitter.pycascading.CascadingBaseOperationWrapper;
+
+/**
+ * Measures the time it takes for a task to set up its Python environment in
+ * the prepare() phase of the PyCascading operations. This is the same setup
+ * that a mapper or reducer does before it can call the first UDF: the
+ * interpreter is started, the import paths are set up, and the main script of
+ * the job is run.
+ *
+ * The benchmark should be run in a fresh JVM for each measurement, see
+ * startup_benchmark.sh. The PyCascading sources are taken from the folder in
+ * the pycascading.root system property, as in local mode.
+ *
+ * Prints a tab-separated line with the label, the time to start the
+ * interpreter, and the time of the rest of the setup in milliseconds.
+ *
+ * @author Gabor Szabo
+ */
+public class StartupBenchmark {
+
+  /**
+   * @param args
+   *          the label of the measurement and the main script of the job
+   */
+  public static void main(String[] args) {
+    if (args.length != 2) {
+      System.err.println("Usage: StartupBenchmark <label> <main_script.py>");
+      System.exit(1);
+    }
+    String label = args[0];
+    String mainFile = args[1];
+
+    long start = System.nanoTime();
+    // Like on the workers, we don't use a package cache
+    Properties props = new Properties();
+    props.put("python.cachedir.skip", "true");
+    PythonInterpreter.initialize(System.getProperties(), props, new String[0]);
+    long initialized = System.nanoTime();
+
+    JobConf jobConf = new JobConf();
+    jobConf.set("pycascading.running_mode", "local");
+    jobConf.set("pycascading.main_file", mainFile);
+    // Measure the worst case, when the whole main script is run
+    jobConf.setBoolean(CascadingBaseOperationWrapper.LOAD_MAIN_FILE, true);
+    CascadingBaseOperationWrapper.setupInterpreter(jobConf, new HadoopFlowProcess(jobConf));
+    long prepared = System.nanoTime();
+
+    System.out.println(label + "\t" + (initialized - start) / 1000000 + "\t"
+            + (prepared - initialized) / 1000000);
+  }
+}
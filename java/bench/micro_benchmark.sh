@@ -0,0 +1,111 @@
+#!/usr/bin/env bash
+
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Runs the micro-benchmarks of the Java-Python call paths, and compares the
+# results to an earlier run.
+#
+
+usage()
+{
+    cat <<EOF
+Usage: $(basename "$0") [options]
+
+Runs the operation wrappers, serializers, and comparators directly with
+synthetic data, and writes the operations per second of each benchmark to a
+tab-separated file.
+
+Build PyCascading and the benchmarks first with "ant all bench" in the java
+folder.
+
+Options:
+   -h                Show this message
+   -o <file>         The file to write the results to (default
+                     micro_benchmark.tsv)
+   -b <file>         The results of an earlier run to compare to
+   -f <regex>        Run only the benchmarks whose names and parameters,
+                     separated by "/", match the regular expression
+   -r <rounds>       The number of measured rounds of each benchmark
+                     (default 5)
+   -t <ms>           The length of a round in milliseconds (default 1000)
+
+Only the comparison is done if -b is given together with -o, and the file of
+-o exists already.
+
+EOF
+}
+
+output='micro_benchmark.tsv'
+baseline=''
+declare -a bench_options
+while getopts ":ho:b:f:r:t:" OPTION; do
+    case $OPTION in
+        h)  usage
+            exit 1
+            ;;
+        o)  output="$OPTARG"
+            ;;
+        b)  baseline="$OPTARG"
+            ;;
+        f|r|t)
+            bench_options=("${bench_options[@]}" "-$OPTION" "$OPTARG")
+            ;;
+    esac
+done
+shift $((OPTIND-1))
+
+home_dir=$(cd "$(dirname "$0")/../.." && pwd)
+source "$home_dir/java/dependencies.properties"
+
+if [ ! -d "$home_dir/build/classes" -o ! -d "$home_dir/build/bench" ]; then
+    echo 'Build PyCascading and the benchmarks first with "ant all bench".'
+    exit 2
+fi
+
+classpath="$home_dir/build/classes:$home_dir/build/bench"
+function add2classpath
+{
+    for lib in $1; do
+        for file in $(ls $2/$lib); do
+            classpath="$classpath:$file"
+        done
+    done
+}
+add2classpath 'jython.jar' "$jython"
+add2classpath 'cascading-[0-9].*.jar lib/jgrapht-*.jar' "$cascading"
+add2classpath 'hadoop-*core*.jar lib/*.jar' "$hadoop"
+
+if [ "$baseline" == "" -o ! -e "$output" ]; then
+    java -classpath "$classpath" com.twitter.pycascading.bench.MicroBenchmark \
+    "${bench_options[@]}" "$output" || exit 3
+fi
+
+if [ "$baseline" != "" ]; then
+    # Join the two runs on the benchmark names and parameters
+    echo
+    echo -e "benchmark\tparams\tbaseline\tcurrent\tchange"
+    awk -F '\t' '
+    FNR == 1 { next }
+    NR == FNR { base[$1 "\t" $2] = $3; next }
+    ($1 "\t" $2) in base {
+        old = base[$1 "\t" $2]
+        if (old + 0 > 0 && $3 + 0 > 0)
+            printf "%s\t%s\t%s\t%s\t%+.1f%%\n", $1, $2, old, $3, 100 * ($3 - old) / old
+        else
+            printf "%s\t%s\t%s\t%s\t\n", $1, $2, old, $3
+    }' "$baseline" "$output"
+fi
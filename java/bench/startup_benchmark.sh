@@ -0,0 +1,108 @@
+#!/usr/bin/env bash
+
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Measures the startup time of the PyCascading tasks with and without the
+# Python sources precompiled to Jython bytecode.
+#
+
+usage()
+{
+    cat <<EOF
+Usage: $(basename "$0") [-n runs] [main_script.py]
+
+Runs the prepare phase of a PyCascading task several times in fresh JVMs, once
+with the sources as they are shipped in build/pycascading.tgz (precompiled),
+and once with the same sources without the \$py.class files. Every run without
+the precompiled files starts from a clean copy, as a new task would on a
+Hadoop worker.
+
+Build PyCascading and the benchmarks first with "ant all bench" in the java
+folder. The default main script is examples/word_count.py.
+
+Options:
+   -h                Show this message
+   -n <runs>         The number of runs for both cases (default 5)
+
+EOF
+}
+
+runs=5
+while getopts ":hn:" OPTION; do
+    case $OPTION in
+        h)  usage
+            exit 1
+            ;;
+        n)  runs="$OPTARG"
+            ;;
+    esac
+done
+shift $((OPTIND-1))
+
+home_dir=$(cd "$(dirname "$0")/../.." && pwd)
+main_file="${1:-$home_dir/examples/word_count.py}"
+source "$home_dir/java/dependencies.properties"
+
+if [ ! -e "$home_dir/build/pycascading.tgz" -o ! -d "$home_dir/build/bench" ]; then
+    echo 'Build PyCascading and the benchmarks first with "ant all bench".'
+    exit 2
+fi
+
+classpath="$home_dir/build/classes:$home_dir/build/bench"
+function add2classpath
+{
+    for lib in $1; do
+        for file in $(ls $2/$lib); do
+            classpath="$classpath:$file"
+        done
+    done
+}
+add2classpath 'jython.jar' "$jython"
+add2classpath 'cascading-[0-9].*.jar lib/jgrapht-*.jar' "$cascading"
+add2classpath 'hadoop-*core*.jar lib/*.jar' "$hadoop"
+
+temp=$(mktemp -d -t PyCascading-bench-XXXXXX)
+mkdir "$temp/compiled" "$temp/job"
+tar -x -z -f "$home_dir/build/pycascading.tgz" -C "$temp/compiled"
+cp -p "$main_file" "$temp/job/"
+"$home_dir/compile_python.sh" "$temp/job"
+main_name=$(basename "$main_file")
+
+# Runs the benchmark once, with the PyCascading sources in $2
+run()
+{
+    (cd "$temp/job" && java -classpath "$classpath" -Dpycascading.root="$2" \
+    com.twitter.pycascading.bench.StartupBenchmark "$1" "$main_name" 2>/dev/null)
+}
+
+for i in $(seq "$runs"); do
+    run compiled "$temp/compiled" >>"$temp/results"
+done
+for i in $(seq "$runs"); do
+    # Start from sources without any bytecode, as Jython writes the compiled
+    # modules next to the sources if it can
+    rm -rf "$temp/source"
+    cp -R -p "$temp/compiled" "$temp/source"
+    find "$temp/source" "$temp/job" -name '*$py.class' -delete
+    run source "$temp/source" >>"$temp/results"
+done
+
+echo -e "case\truns\tinterpreter_ms\tprepare_ms"
+awk -F '\t' '{ n[$1]++; init[$1] += $2; prep[$1] += $3 }
+END { for (c in n) printf "%s\t%d\t%.0f\t%.0f\n", c, n[c], init[c] / n[c], prep[c] / n[c] }' \
+"$temp/results" | sort
+rm -rf "$temp"
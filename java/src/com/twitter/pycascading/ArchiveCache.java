@@ -0,0 +1,157 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.BufferedInputStream;
+import java.io.FileInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.security.MessageDigest;
+import java.security.NoSuchAlgorithmException;
+import java.util.Random;
+
+import org.apache.hadoop.conf.Configuration;
+import org.apache.hadoop.fs.FileStatus;
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+
+/**
+ * Keeps the archives shipped in the distributed cache on HDFS, under file
+ * names derived from the SHA-1 hash of their contents.
+ *
+ * An archive that was already uploaded by an earlier job is not copied again,
+ * and since its HDFS path and modification time stay the same, the
+ * TaskTrackers also find it in their local caches and don't need to localize
+ * it again. The archives that haven't been used for a while are deleted when
+ * a new job is submitted.
+ *
+ * We don't touch the archives themselves to record their last use, as the
+ * distributed cache relies on their modification times. Instead, a marker
+ * file with the ".last_used" suffix is rewritten next to each archive every
+ * time it is used.
+ *
+ * @author Gabor Szabo
+ */
+public class ArchiveCache {
+  // The jobconf parameter for the number of days after which unused archives
+  // are deleted
+  public static final String MAX_AGE_PARAMETER = "pycascading.archive_cache.max_age_days";
+
+  // The default number of days to keep unused archives
+  public static final int DEFAULT_MAX_AGE_DAYS = 7;
+
+  private static final String FOLDER_NAME = "pycascading-archives";
+  private static final String LAST_USED_SUFFIX = ".last_used";
+
+  private final Path root;
+  private final FileSystem fs;
+
+  /**
+   * Create the archive cache in hadoop.tmp.dir on the default file system.
+   *
+   * @param conf
+   *          the Hadoop configuration
+   * @throws IOException
+   */
+  public ArchiveCache(Configuration conf) throws IOException {
+    // Only fs.default.name and hadoop.tmp.dir are defined at the time of the
+    // job initialization, we cannot use mapreduce.job.dir, mapred.working.dir,
+    // or mapred.job.id
+    root = new Path(conf.get("fs.default.name") + conf.get("hadoop.tmp.dir") + "/"
+            + FOLDER_NAME);
+    fs = root.getFileSystem(conf);
+    fs.mkdirs(root);
+  }
+
+  /**
+   * Add a local file to the cache, unless a file with the same contents is
+   * there already. The extension of the file is kept, so that zip and tgz
+   * archives are recognized by the distributed cache.
+   *
+   * @param source
+   *          the path to the local file
+   * @return the path to the file on HDFS
+   * @throws IOException
+   */
+  public String add(String source) throws IOException {
+    Path dest = new Path(root, hashFile(source) + getExtension(source));
+    if (!fs.exists(dest)) {
+      // Several jobs may be submitted at the same time with the same archive,
+      // so we upload to a temporary file first and rename it atomically
+      Path tmp = new Path(root, "." + dest.getName() + "." + new Random().nextInt(1000000)
+              + ".tmp");
+      fs.copyFromLocalFile(new Path(source), tmp);
+      if (!fs.rename(tmp, dest))
+        fs.delete(tmp, false);
+    }
+    fs.create(new Path(root, dest.getName() + LAST_USED_SUFFIX), true).close();
+    return dest.toString();
+  }
+
+  /**
+   * Delete the archives that haven't been used for the given time.
+   *
+   * @param maxAgeDays
+   *          the number of days after which an unused archive is deleted
+   * @throws IOException
+   */
+  public void collectGarbage(int maxAgeDays) throws IOException {
+    long threshold = System.currentTimeMillis() - maxAgeDays * 24L * 3600 * 1000;
+    FileStatus[] files = fs.listStatus(root);
+    if (files == null)
+      return;
+    for (FileStatus file : files) {
+      String name = file.getPath().getName();
+      if (name.endsWith(LAST_USED_SUFFIX) || name.startsWith("."))
+        continue;
+      long lastUsed = file.getModificationTime();
+      Path marker = new Path(root, name + LAST_USED_SUFFIX);
+      if (fs.exists(marker))
+        lastUsed = Math.max(lastUsed, fs.getFileStatus(marker).getModificationTime());
+      if (lastUsed < threshold) {
+        fs.delete(file.getPath(), false);
+        fs.delete(marker, false);
+      }
+    }
+  }
+
+  private static String getExtension(String path) {
+    String name = new Path(path).getName();
+    int i = name.lastIndexOf('.');
+    return (i >= 0 ? name.substring(i, name.length()) : "");
+  }
+
+  private static String hashFile(String path) throws IOException {
+    MessageDigest digest;
+    try {
+      digest = MessageDigest.getInstance("SHA-1");
+    } catch (NoSuchAlgorithmException e) {
+      throw new RuntimeException(e);
+    }
+    InputStream in = new BufferedInputStream(new FileInputStream(path));
+    try {
+      byte[] buffer = new byte[64 * 1024];
+      int n;
+      while ((n = in.read(buffer)) > 0)
+        digest.update(buffer, 0, n);
+    } finally {
+      in.close();
+    }
+    StringBuilder hex = new StringBuilder();
+    for (byte b : digest.digest())
+      hex.append(String.format("%02x", b));
+    return hex.toString();
+  }
+}
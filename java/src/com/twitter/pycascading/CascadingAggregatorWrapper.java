@@ -17,8 +17,10 @@ package com.twitter.pycascading;
 import java.io.Serializable;
 
 import cascading.flow.FlowProcess;
+import cascading.flow.hadoop.HadoopFlowProcess;
 import cascading.operation.Aggregator;
 import cascading.operation.AggregatorCall;
+import cascading.operation.OperationCall;
 import cascading.tuple.Fields;
 import cascading.tuple.TupleEntry;
 import cascading.tuple.TupleEntryCollector;
@@ -34,6 +36,9 @@ public class CascadingAggregatorWrapper extends CascadingRecordProducerWrapper i
         Aggregator, Serializable {
   private static final long serialVersionUID = -5110929817978998473L;
 
+  // The sizes of the groups, or null if the skew report is off
+  private transient GroupSkew skew = null;
+
   public CascadingAggregatorWrapper() {
     super();
   }
@@ -50,10 +55,27 @@ public class CascadingAggregatorWrapper extends CascadingRecordProducerWrapper i
     super(numArgs, fieldDeclaration);
   }
 
+  @Override
+  public void prepare(FlowProcess flowProcess, OperationCall operationCall) {
+    super.prepare(flowProcess, operationCall);
+    skew = GroupSkew.create(((HadoopFlowProcess) flowProcess).getJobConf(), getName());
+  }
+
+  @Override
+  public void cleanup(FlowProcess flowProcess, OperationCall operationCall) {
+    super.cleanup(flowProcess, operationCall);
+    if (skew != null) {
+      skew.write();
+      skew = null;
+    }
+  }
+
   @Override
   public void start(FlowProcess flowProcess, AggregatorCall aggregatorCall) {
     // TODO Auto-generated method stub
     System.out.println("Aggregator start called");
+    if (skew != null)
+      skew.startGroup();
   }
 
   @Override
@@ -62,11 +84,15 @@ public class CascadingAggregatorWrapper extends CascadingRecordProducerWrapper i
     TupleEntryCollector outputCollector = aggregatorCall.getOutputCollector();
 
     System.out.println("Aggregator called with group: " + group);
+    if (skew != null)
+      skew.countTuple();
   }
 
   @Override
   public void complete(FlowProcess flowProcess, AggregatorCall aggregatorCall) {
     // TODO Auto-generated method stub
     System.out.println("Aggregator complete called");
+    if (skew != null)
+      skew.groupFinished(aggregatorCall.getGroup());
   }
 }
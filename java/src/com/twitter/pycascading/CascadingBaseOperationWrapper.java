@@ -21,7 +21,9 @@ import java.io.ObjectInputStream;
 import java.io.ObjectOutputStream;
 import java.io.Serializable;
 import java.net.URISyntaxException;
+import java.util.ArrayList;
 import java.util.Iterator;
+import java.util.List;
 
 import org.apache.hadoop.filecache.DistributedCache;
 import org.apache.hadoop.fs.Path;
@@ -53,6 +55,13 @@ import cascading.tuple.TupleEntry;
 public class CascadingBaseOperationWrapper extends BaseOperation implements Serializable {
   private static final long serialVersionUID = -535185466322890691L;
 
+  // The group of the Hadoop counters that PyCascading increments
+  public static final String COUNTER_GROUP = "PyCascading";
+
+  // If true, the whole main script of the job is run on the workers, instead
+  // of defining only the names that the Python functions depend on
+  public static final String LOAD_MAIN_FILE = "pycascading.load_main_file";
+
   // This defines whether the input tuples should be converted to Python lists
   // or dicts before passing them to the Python function
   public enum ConvertInputTuples {
@@ -67,9 +76,21 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
   private PyFunction writeObjectCallBack;
   private byte[] serializedFunction;
 
+  // The name of the pipe of the operation, used to name the counters of the
+  // instrumentation
+  private String name = null;
+  // The estimated ratio of the output and input sizes of the operation, or
+  // null if it's not known. This is only used when the flow is planned, so
+  // it is not serialized.
+  private Double selectivity = null;
+  // The statistics of the calls, or null if the instrumentation is off
+  protected UdfStats stats = null;
+
   // These are some variables to optimize the frequent UDF calls
   protected PyObject[] callArgs = null;
   private String[] contextKwArgsNames = null;
+  // The input file of a combined split that map_input_file was last set to
+  private String mapInputFile = null;
 
   /**
    * Class to convert elements in an iterator to corresponding Jython objects.
@@ -121,20 +142,36 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     super(numArgs, fieldDeclaration);
   }
 
-  private PythonInterpreter setupInterpreter(JobConf jobConf, FlowProcess flowProcess) {
+  /**
+   * Set up the Python interpreter for running the UDFs: set the import paths to
+   * the PyCascading and job sources, and run the main file of the job.
+   * 
+   * @param jobConf
+   *          the job's configuration
+   * @param flowProcess
+   *          the flow process passed to the operation
+   * @return the interpreter
+   */
+  public static PythonInterpreter setupInterpreter(JobConf jobConf, FlowProcess flowProcess) {
+    long startTime = System.currentTimeMillis();
     String pycascadingDir = null;
     String sourceDir = null;
     String[] modulePaths = null;
+    String packageCacheDir = null;
     if ("hadoop".equals(jobConf.get("pycascading.running_mode"))) {
       try {
         Path[] archives = DistributedCache.getLocalCacheArchives(jobConf);
         pycascadingDir = archives[0].toString() + "/";
         sourceDir = archives[1].toString() + "/";
-        modulePaths = new String[archives.length];
-        int i = 0;
+        // The package cache is not a Python module folder
+        String packageCache = jobConf.get(PackageCache.ARCHIVE_PARAMETER);
+        List<String> paths = new ArrayList<String>();
         for (Path archive : archives) {
-          modulePaths[i++] = archive.toString();
+          if (!PackageCache.isPackageCache(packageCache, archive))
+            paths.add(archive.toString());
         }
+        modulePaths = paths.toArray(new String[paths.size()]);
+        packageCacheDir = PackageCache.setupTaskCache(packageCache, archives);
       } catch (IOException e) {
         throw new RuntimeException(e);
       }
@@ -143,6 +180,13 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
       sourceDir = "";
       modulePaths = new String[] { pycascadingDir, sourceDir };
     }
+    // Jython is initialized only by the first operation in the JVM, and only
+    // on the workers, since the launcher has initialized it already
+    if (Main.initialize(packageCacheDir)) {
+      Main.getInterpreter();
+      flowProcess.increment(COUNTER_GROUP, "Interpreter initialization (ms)",
+              (int) (System.currentTimeMillis() - startTime));
+    }
     PythonInterpreter interpreter = Main.getInterpreter();
     interpreter.execfile(pycascadingDir + "python/pycascading/init_module.py");
     interpreter.set("module_paths", modulePaths);
@@ -163,9 +207,16 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     // function in the variable flow_process
     interpreter.set("flow_process", flowProcess);
 
-    // We need to run the main file first so that imports etc. are defined,
-    // and nested functions can also be used
-    interpreter.execfile(sourceDir + (String) jobConf.get("pycascading.main_file"));
+    // The Python functions are deserialized together with the imports,
+    // functions, and values they depend on. The main file is only run if
+    // requested, or if some of the dependencies could not be serialized. This
+    // uses the precompiled main file if it was shipped.
+    interpreter.set("main_file", sourceDir + (String) jobConf.get("pycascading.main_file"));
+    interpreter.set("main_file_loaded", Py.False);
+    if (jobConf.getBoolean(LOAD_MAIN_FILE, false))
+      interpreter.exec("load_main_file(main_file)");
+    flowProcess.increment(COUNTER_GROUP, "Interpreter setup (ms)",
+            (int) (System.currentTimeMillis() - startTime));
     return interpreter;
   }
 
@@ -195,6 +246,9 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
       throw new RuntimeException(e);
     }
     serializedFunction = null;
+    if (UdfStats.isInstrumented(jobConf, name))
+      stats = new UdfStats(name);
+    UdfProfiler.operationPrepared(jobConf);
     if (!PyFunction.class.isInstance(function)) {
       // function is assumed to be decorated, resulting in a
       // DecoratedFunction, so we can get the original function back.
@@ -229,6 +283,7 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     pythonStream.close();
 
     stream.writeObject(baos.toByteArray());
+    stream.writeObject(name);
   }
 
   private void readObject(ObjectInputStream stream) throws IOException, ClassNotFoundException,
@@ -237,6 +292,14 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     // the parameters may use other imports, like datetime. Or how else can
     // we do this better?
     serializedFunction = (byte[]) stream.readObject();
+    name = (String) stream.readObject();
+  }
+
+  @Override
+  public void cleanup(FlowProcess flowProcess, OperationCall operationCall) {
+    if (stats != null)
+      stats.flush(flowProcess);
+    UdfProfiler.operationCleanedUp();
   }
 
   /**
@@ -286,8 +349,25 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     }
   }
 
-  @SuppressWarnings("unchecked")
+  /**
+   * Convert the input tuple to the type the Python function expects, recording
+   * the time it takes if the instrumentation is on.
+   * 
+   * @param tupleEntry
+   *          the input tuple
+   * @return the converted tuple
+   */
   public Object convertInput(TupleEntry tupleEntry) {
+    if (stats == null)
+      return convertTupleEntry(tupleEntry);
+    long start = System.nanoTime();
+    Object result = convertTupleEntry(tupleEntry);
+    stats.addInputConversion(System.nanoTime() - start);
+    return result;
+  }
+
+  @SuppressWarnings("unchecked")
+  private Object convertTupleEntry(TupleEntry tupleEntry) {
     Object result = null;
     if (convertInputTuples == ConvertInputTuples.NONE) {
       // We don't need to convert the tuples
@@ -327,6 +407,13 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
    * @return the return value of the Python function
    */
   public PyObject callFunction() {
+    // With combined splits the mapper reads several files, so we update
+    // map_input_file when the next file is opened
+    String inputFile = CombinedInputFormat.getCurrentFile();
+    if (inputFile != null && inputFile != mapInputFile) {
+      mapInputFile = inputFile;
+      Main.getInterpreter().set("map_input_file", inputFile);
+    }
     if (contextKwArgsNames == null)
       return function.__call__(callArgs);
     else
@@ -343,6 +430,50 @@ public class CascadingBaseOperationWrapper extends BaseOperation implements Seri
     this.function = function;
   }
 
+  /**
+   * Setter for the name of the pipe of the operation, which is used to name
+   * the counters of the instrumentation.
+   * 
+   * @param name
+   *          the name of the pipe
+   */
+  public void setName(String name) {
+    this.name = name;
+  }
+
+  /**
+   * @return the name of the pipe of the operation, or null if it's not set
+   */
+  public String getName() {
+    return name;
+  }
+
+  /**
+   * Setter for the estimated ratio of the output and input sizes of the
+   * operation, used for choosing the number of reducers.
+   * 
+   * @param selectivity
+   *          the estimated ratio, or null if it's not known
+   */
+  public void setSelectivity(Double selectivity) {
+    this.selectivity = selectivity;
+  }
+
+  /**
+   * @return the estimated ratio of the output and input sizes, or null if
+   *         it's not known
+   */
+  public Double getSelectivity() {
+    return selectivity;
+  }
+
+  /**
+   * @return the type of conversion done on the input tuples
+   */
+  public ConvertInputTuples getConvertInputTuples() {
+    return convertInputTuples;
+  }
+
   /**
    * Setter for the input tuple conversion type.
    * 
@@ -22,8 +22,10 @@ import java.util.Iterator;
 import org.python.core.Py;
 
 import cascading.flow.FlowProcess;
+import cascading.flow.hadoop.HadoopFlowProcess;
 import cascading.operation.Buffer;
 import cascading.operation.BufferCall;
+import cascading.operation.OperationCall;
 import cascading.tuple.Fields;
 import cascading.tuple.TupleEntry;
 import cascading.tuple.TupleEntryCollector;
@@ -38,6 +40,9 @@ public class CascadingBufferWrapper extends CascadingRecordProducerWrapper imple
         Serializable {
   private static final long serialVersionUID = -3512295576396796360L;
 
+  // The sizes of the groups, or null if the skew report is off
+  private transient GroupSkew skew = null;
+
   public CascadingBufferWrapper() {
     super();
   }
@@ -62,6 +67,21 @@ public class CascadingBufferWrapper extends CascadingRecordProducerWrapper imple
     return super.getNumParameters() + 1;
   }
 
+  @Override
+  public void prepare(FlowProcess flowProcess, OperationCall operationCall) {
+    super.prepare(flowProcess, operationCall);
+    skew = GroupSkew.create(((HadoopFlowProcess) flowProcess).getJobConf(), getName());
+  }
+
+  @Override
+  public void cleanup(FlowProcess flowProcess, OperationCall operationCall) {
+    super.cleanup(flowProcess, operationCall);
+    if (skew != null) {
+      skew.write();
+      skew = null;
+    }
+  }
+
   @Override
   public void operate(FlowProcess flowProcess, BufferCall bufferCall) {
     // TODO: if the Python buffer expects Python dicts or lists, then we need to
@@ -76,6 +96,17 @@ public class CascadingBufferWrapper extends CascadingRecordProducerWrapper imple
       TupleEntry group = bufferCall.getGroup();
       TupleEntryCollector outputCollector = bufferCall.getOutputCollector();
 
+      // The tuples read by the buffer are counted by both, but the tuples it
+      // didn't read are only counted in the group size
+      Iterator<TupleEntry> groupTuples = null;
+      if (skew != null) {
+        arguments = skew.countGroup(arguments);
+        groupTuples = arguments;
+      }
+      if (stats != null) {
+        arguments = stats.countInputs(arguments);
+        stats.callStarted();
+      }
       callArgs[0] = Py.java2py(group);
       callArgs[1] = Py.java2py(arguments);
       if (outputMethod == OutputMethod.COLLECTS) {
@@ -85,6 +116,10 @@ public class CascadingBufferWrapper extends CascadingRecordProducerWrapper imple
         Object ret = callFunction();
         collectOutput(outputCollector, ret);
       }
+      if (stats != null)
+        stats.callFinished(flowProcess);
+      if (skew != null)
+        skew.groupFinished(group, groupTuples);
     }
   }
 }
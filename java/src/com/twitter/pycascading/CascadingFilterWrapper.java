@@ -18,7 +18,6 @@ import java.io.ObjectInputStream;
 import java.io.Serializable;
 
 import org.python.core.Py;
-import org.python.core.PyObject;
 
 import cascading.flow.FlowProcess;
 import cascading.operation.Filter;
@@ -64,7 +63,14 @@ public class CascadingFilterWrapper extends CascadingBaseOperationWrapper implem
   public boolean isRemove(FlowProcess flowProcess, FilterCall filterCall) {
     Object tuple = convertInput(filterCall.getArguments());
     callArgs[0] = Py.java2py(tuple);
-    PyObject ret = callFunction();
-    return !Py.py2boolean(ret);
+    if (stats == null)
+      return !Py.py2boolean(callFunction());
+    stats.addInputTuples(1);
+    stats.callStarted();
+    boolean keep = Py.py2boolean(callFunction());
+    stats.callFinished(flowProcess);
+    if (keep)
+      stats.addOutputTuples(1);
+    return !keep;
   }
 }
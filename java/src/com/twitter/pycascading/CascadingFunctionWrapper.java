@@ -71,6 +71,10 @@ public class CascadingFunctionWrapper extends CascadingRecordProducerWrapper imp
     TupleEntryCollector outputCollector = functionCall.getOutputCollector();
 
     callArgs[0] = Py.java2py(inputTuple);
+    if (stats != null) {
+      stats.addInputTuples(1);
+      stats.callStarted();
+    }
     if (outputMethod == OutputMethod.COLLECTS) {
       // The Python function collects the output tuples itself into the output
       // collector
@@ -81,5 +85,7 @@ public class CascadingFunctionWrapper extends CascadingRecordProducerWrapper imp
       Object ret = callFunction();
       collectOutput(outputCollector, ret);
     }
+    if (stats != null)
+      stats.callFinished(flowProcess);
   }
 }
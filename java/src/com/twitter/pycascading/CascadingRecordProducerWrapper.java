@@ -92,6 +92,26 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
    */
   private void castPythonObject(Object ret, TupleEntryCollector outputCollector,
           boolean simpleCastIfTuple) {
+    if (stats == null)
+      collect(outputCollector, castRecord(ret, simpleCastIfTuple));
+    else {
+      long start = System.nanoTime();
+      Object record = castRecord(ret, simpleCastIfTuple);
+      long converted = System.nanoTime();
+      // Adding the tuple to the collector runs the downstream operations of
+      // the step, which are not part of the conversion
+      collect(outputCollector, record);
+      stats.addOutputConversion(converted - start);
+      stats.addDownstream(System.nanoTime() - converted);
+      stats.addOutputTuples(1);
+    }
+  }
+
+  /**
+   * Convert the object returned or yielded by the Python function to a Tuple
+   * or a TupleEntry.
+   */
+  private Object castRecord(Object ret, boolean simpleCastIfTuple) {
     if (outputType == OutputType.AUTO) {
       // We need to determine the type of the record now
       if (PySequenceList.class.isInstance(ret))
@@ -110,7 +130,7 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
       // We can return both a Python (immutable) tuple and a list, so we
       // need to use their common superclass, PySequenceList.
       try {
-        outputCollector.add(new Tuple(((PySequenceList) ret).toArray()));
+        return new Tuple(((PySequenceList) ret).toArray());
       } catch (ClassCastException e) {
         throw new RuntimeException(
                 "Python function or generator must return a Python list, we got " + ret.getClass()
@@ -121,9 +141,9 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
         // For some reason yield doesn't wrap the object in a Jython
         // container, but return does
         if (simpleCastIfTuple)
-          outputCollector.add((Tuple) ret);
+          return (Tuple) ret;
         else
-          outputCollector.add((Tuple) ((PyObject) ret).__tojava__(Tuple.class));
+          return (Tuple) ((PyObject) ret).__tojava__(Tuple.class);
       } catch (ClassCastException e) {
         throw new RuntimeException(
                 "Python function or generator must return a Cascading Tuple, we got "
@@ -131,7 +151,7 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
       }
     } else {
       try {
-        outputCollector.add((TupleEntry) ((PyObject) ret).__tojava__(TupleEntry.class));
+        return (TupleEntry) ((PyObject) ret).__tojava__(TupleEntry.class);
       } catch (ClassCastException e) {
         throw new RuntimeException(
                 "Python function or generator must return a Cascading TupleEntry, we got "
@@ -140,6 +160,13 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
     }
   }
 
+  private static void collect(TupleEntryCollector outputCollector, Object record) {
+    if (record instanceof Tuple)
+      outputCollector.add((Tuple) record);
+    else
+      outputCollector.add((TupleEntry) record);
+  }
+
   protected void collectOutput(TupleEntryCollector outputCollector, Object ret) {
     if (ret == null)
       return;
@@ -168,7 +195,15 @@ public class CascadingRecordProducerWrapper extends CascadingBaseOperationWrappe
     this.outputMethod = outputMethod;
   }
 
+  public OutputMethod getOutputMethod() {
+    return outputMethod;
+  }
+
   public void setOutputType(OutputType outputType) {
     this.outputType = outputType;
   }
+
+  public OutputType getOutputType() {
+    return outputType;
+  }
 }
@@ -0,0 +1,254 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.io.compress.CompressionCodecFactory;
+import org.apache.hadoop.mapred.FileSplit;
+import org.apache.hadoop.mapred.InputFormat;
+import org.apache.hadoop.mapred.InputSplit;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.JobConfigurable;
+import org.apache.hadoop.mapred.RecordReader;
+import org.apache.hadoop.mapred.Reporter;
+import org.apache.hadoop.mapred.lib.CombineFileInputFormat;
+import org.apache.hadoop.mapred.lib.CombineFileSplit;
+import org.apache.hadoop.util.ReflectionUtils;
+
+/**
+ * An input format that packs many small files into one split, so that they are
+ * read by the same mapper. It is set up by CombinedScheme.
+ *
+ * The splits are built by Hadoop's CombineFileInputFormat, which puts blocks
+ * on the same node, and then on the same rack, into the same split, up to the
+ * maximum size. The files in a split are read one after the other with the
+ * input format of the original scheme. The map.input.file parameter and the
+ * map_input_file variable of the UDFs are updated whenever the next file is
+ * opened.
+ *
+ * The files that can't be split, such as compressed text files, are always
+ * read whole, from the split that has their first block.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class CombinedInputFormat extends CombineFileInputFormat implements JobConfigurable {
+  // The jobconf parameters set by CombinedScheme
+  public static final String INPUT_FORMAT = "pycascading.combine_splits.input_format";
+  public static final String MAX_SIZE = "pycascading.combine_splits.max_size";
+
+  // The file being read by the combined record reader in this JVM. The
+  // records are read by the same thread that calls the operations.
+  private static volatile String currentFile = null;
+
+  private CompressionCodecFactory compressionCodecs = null;
+
+  /**
+   * Reads the files in a combined split one after the other, with record
+   * readers of the original input format.
+   */
+  private static class CombinedRecordReader implements RecordReader {
+    private final CombineFileSplit split;
+    private final JobConf job;
+    private final Reporter reporter;
+    private final InputFormat inputFormat;
+    private final long totalLength;
+
+    // The index of the file read now in the split
+    private int index = -1;
+    private RecordReader reader = null;
+    // The bytes in the files that were read already
+    private long finishedLength = 0;
+
+    public CombinedRecordReader(CombineFileSplit split, JobConf job, Reporter reporter,
+            InputFormat inputFormat) throws IOException {
+      this.split = split;
+      this.job = job;
+      this.reporter = reporter;
+      this.inputFormat = inputFormat;
+      this.totalLength = split.getLength();
+      // Open the first file now, so that map.input.file is set already when
+      // the mapper is configured
+      nextReader();
+    }
+
+    /**
+     * Close the current reader and open the next file.
+     *
+     * @return false if there are no more files
+     */
+    private boolean nextReader() throws IOException {
+      if (reader != null) {
+        finishedLength += split.getLength(index);
+        reader.close();
+        reader = null;
+      }
+      index++;
+      if (index >= split.getNumPaths())
+        return false;
+      Path path = split.getPath(index);
+      job.set("map.input.file", path.toString());
+      job.setLong("map.input.start", split.getOffset(index));
+      job.setLong("map.input.length", split.getLength(index));
+      currentFile = path.toString();
+      FileSplit fileSplit = new FileSplit(path, split.getOffset(index), split.getLength(index),
+              split.getLocations());
+      reader = inputFormat.getRecordReader(fileSplit, job, reporter);
+      return true;
+    }
+
+    @Override
+    public boolean next(Object key, Object value) throws IOException {
+      while (reader != null) {
+        if (reader.next(key, value))
+          return true;
+        nextReader();
+      }
+      return false;
+    }
+
+    @Override
+    public Object createKey() {
+      return reader == null ? null : reader.createKey();
+    }
+
+    @Override
+    public Object createValue() {
+      return reader == null ? null : reader.createValue();
+    }
+
+    @Override
+    public long getPos() throws IOException {
+      return finishedLength + (reader == null ? 0 : reader.getPos());
+    }
+
+    @Override
+    public void close() throws IOException {
+      if (reader != null) {
+        reader.close();
+        reader = null;
+      }
+      currentFile = null;
+    }
+
+    @Override
+    public float getProgress() throws IOException {
+      if (totalLength == 0)
+        return 1.0f;
+      long current = 0;
+      if (reader != null)
+        current = (long) (reader.getProgress() * split.getLength(index));
+      return Math.min(1.0f, (float) (finishedLength + current) / totalLength);
+    }
+  }
+
+  /**
+   * @return the path of the file read by a combined split in this JVM, or null
+   *         if no combined split is being read
+   */
+  public static String getCurrentFile() {
+    return currentFile;
+  }
+
+  @Override
+  public void configure(JobConf conf) {
+    compressionCodecs = new CompressionCodecFactory(conf);
+  }
+
+  @Override
+  protected boolean isSplitable(FileSystem fs, Path file) {
+    // Compressed text files can't be split, as in TextInputFormat
+    return compressionCodecs == null || compressionCodecs.getCodec(file) == null;
+  }
+
+  /**
+   * Replace the blocks of the files that can't be split with the whole files.
+   * The CombineFileInputFormat of Hadoop 0.20 doesn't call isSplitable
+   * (MAPREDUCE-1597), and cuts these files into blocks, which can't be read
+   * separately. A file is read whole by the first split that has a block of
+   * it, and its other blocks are removed from the splits.
+   */
+  private InputSplit[] keepWhole(JobConf job, InputSplit[] splits) throws IOException {
+    Set<Path> placed = new HashSet<Path>();
+    List<InputSplit> result = new ArrayList<InputSplit>(splits.length);
+    for (InputSplit inputSplit : splits) {
+      CombineFileSplit split = (CombineFileSplit) inputSplit;
+      List<Path> paths = new ArrayList<Path>();
+      List<Long> starts = new ArrayList<Long>();
+      List<Long> lengths = new ArrayList<Long>();
+      boolean changed = false;
+      for (int i = 0; i < split.getNumPaths(); i++) {
+        Path path = split.getPath(i);
+        FileSystem fs = path.getFileSystem(job);
+        if (isSplitable(fs, path)) {
+          paths.add(path);
+          starts.add(split.getOffset(i));
+          lengths.add(split.getLength(i));
+          continue;
+        }
+        changed = true;
+        if (placed.add(path)) {
+          paths.add(path);
+          starts.add(0L);
+          lengths.add(fs.getFileStatus(path).getLen());
+        }
+      }
+      if (!changed) {
+        result.add(split);
+      } else if (!paths.isEmpty()) {
+        long[] startArray = new long[paths.size()];
+        long[] lengthArray = new long[paths.size()];
+        for (int i = 0; i < paths.size(); i++) {
+          startArray[i] = starts.get(i);
+          lengthArray[i] = lengths.get(i);
+        }
+        result.add(new CombineFileSplit(job, paths.toArray(new Path[paths.size()]), startArray,
+                lengthArray, split.getLocations()));
+      }
+    }
+    return result.toArray(new InputSplit[result.size()]);
+  }
+
+  private InputFormat getInputFormat(JobConf job) throws IOException {
+    String className = job.get(INPUT_FORMAT);
+    try {
+      return (InputFormat) ReflectionUtils.newInstance(job.getClassByName(className), job);
+    } catch (ClassNotFoundException e) {
+      throw new IOException("Could not find the input format " + className);
+    }
+  }
+
+  @Override
+  public InputSplit[] getSplits(JobConf job, int numSplits) throws IOException {
+    // Without a maximum size all the blocks on a node would go into one split
+    setMaxSplitSize(job.getLong(MAX_SIZE, 256L * 1024 * 1024));
+    if (compressionCodecs == null)
+      configure(job);
+    return keepWhole(job, super.getSplits(job, numSplits));
+  }
+
+  @Override
+  public RecordReader getRecordReader(InputSplit split, JobConf job, Reporter reporter)
+          throws IOException {
+    return new CombinedRecordReader((CombineFileSplit) split, job, reporter, getInputFormat(job));
+  }
+}
@@ -0,0 +1,86 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.OutputCollector;
+
+import cascading.scheme.Scheme;
+import cascading.tap.Tap;
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntry;
+
+/**
+ * A source scheme that reads the files of another scheme with combined splits,
+ * so that many small files are read by the same mapper.
+ *
+ * The input format of the original scheme is replaced by a
+ * CombinedInputFormat, which uses the original input format to read the files
+ * in its splits.
+ *
+ * @author Gabor Szabo
+ */
+public class CombinedScheme extends Scheme {
+  private static final long serialVersionUID = 4418873416282746359L;
+
+  private Scheme scheme;
+  private long maxSplitSize;
+
+  /**
+   * @param scheme
+   *          the scheme that reads the data
+   * @param maxSplitSize
+   *          the maximum number of bytes in a combined split
+   */
+  public CombinedScheme(Scheme scheme, long maxSplitSize) {
+    super(scheme.getSourceFields(), scheme.getSinkFields());
+    if (maxSplitSize <= 0)
+      throw new IllegalArgumentException("The split size must be positive: " + maxSplitSize);
+    this.scheme = scheme;
+    this.maxSplitSize = maxSplitSize;
+  }
+
+  /**
+   * @return the scheme that reads the data
+   */
+  public Scheme getScheme() {
+    return scheme;
+  }
+
+  @Override
+  public void sourceInit(Tap tap, JobConf conf) throws IOException {
+    scheme.sourceInit(tap, conf);
+    conf.set(CombinedInputFormat.INPUT_FORMAT, conf.getInputFormat().getClass().getName());
+    conf.setLong(CombinedInputFormat.MAX_SIZE, maxSplitSize);
+    conf.setInputFormat(CombinedInputFormat.class);
+  }
+
+  @Override
+  public Tuple source(Object key, Object value) {
+    return scheme.source(key, value);
+  }
+
+  @Override
+  public void sinkInit(Tap tap, JobConf conf) throws IOException {
+    throw new UnsupportedOperationException("A combined scheme can only be used as a source");
+  }
+
+  @Override
+  public void sink(TupleEntry tupleEntry, OutputCollector outputCollector) throws IOException {
+    throw new UnsupportedOperationException("A combined scheme can only be used as a source");
+  }
+}
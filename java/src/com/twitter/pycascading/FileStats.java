@@ -0,0 +1,234 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.ObjectOutputStream;
+import java.io.Serializable;
+import java.util.HashMap;
+import java.util.Map;
+
+import org.apache.hadoop.conf.Configuration;
+import org.apache.hadoop.fs.FSDataOutputStream;
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+
+import cascading.tuple.Fields;
+import cascading.tuple.Tuple;
+
+/**
+ * The minimum and maximum values and the number of nulls of some fields in a
+ * part file written by a meta sink. They are collected by MetaScheme while the
+ * tuples are written, and are stored by FileStatsOutputFormat in the file
+ * .pycascading_filestats.<part file> next to the part file when it is closed.
+ * meta_source uses them to skip the part files that can't have the tuples it
+ * is looking for.
+ *
+ * The statistics being collected are kept in a thread local map by the path
+ * of the sink, since the part file is written by the same thread that sinks
+ * the tuples.
+ *
+ * @author Gabor Szabo
+ */
+public class FileStats implements Serializable {
+  private static final long serialVersionUID = 3357093213553049281L;
+
+  // The prefix of the names of the files with the statistics
+  public static final String FILE_PREFIX = ".pycascading_filestats.";
+
+  // The jobconf parameters set by MetaScheme
+  public static final String OUTPUT_PATH = "pycascading.filestats.output_path";
+  public static final String OUTPUT_FORMAT = "pycascading.filestats.output_format";
+
+  private static final ThreadLocal<Map<String, FileStats>> current =
+          new ThreadLocal<Map<String, FileStats>>() {
+    @Override
+    protected Map<String, FileStats> initialValue() {
+      return new HashMap<String, FileStats>();
+    }
+  };
+
+  private final String[] fields;
+  // The positions of the fields in the tuples, or -1 if a field is missing
+  private final transient int[] positions;
+  private final Comparable[] min;
+  private final Comparable[] max;
+  private final long[] nulls;
+  // False for the fields whose values couldn't be compared to each other
+  private final boolean[] comparable;
+  private long count = 0;
+
+  /**
+   * @param fields
+   *          the names of the fields to collect the statistics of
+   * @param tupleFields
+   *          the fields of the tuples written
+   */
+  public FileStats(String[] fields, Fields tupleFields) {
+    this.fields = fields;
+    positions = new int[fields.length];
+    min = new Comparable[fields.length];
+    max = new Comparable[fields.length];
+    nulls = new long[fields.length];
+    comparable = new boolean[fields.length];
+    for (int i = 0; i < fields.length; i++) {
+      positions[i] = -1;
+      for (int j = 0; j < tupleFields.size(); j++) {
+        if (fields[i].equals(tupleFields.get(j))) {
+          positions[i] = j;
+          break;
+        }
+      }
+      comparable[i] = (positions[i] >= 0);
+    }
+  }
+
+  /**
+   * @param outputPath
+   *          the path of the sink
+   * @return the statistics being collected for the sink in this thread, or
+   *         null
+   */
+  public static FileStats getCurrent(String outputPath) {
+    return current.get().get(outputPath);
+  }
+
+  /**
+   * Start collecting statistics for a sink in this thread.
+   */
+  public static void setCurrent(String outputPath, FileStats stats) {
+    current.get().put(outputPath, stats);
+  }
+
+  /**
+   * Stop collecting the statistics for a sink in this thread.
+   *
+   * @return the statistics collected, or null if there were no tuples
+   */
+  public static FileStats removeCurrent(String outputPath) {
+    return current.get().remove(outputPath);
+  }
+
+  /**
+   * Add a tuple to the statistics.
+   */
+  @SuppressWarnings("unchecked")
+  public void add(Tuple tuple) {
+    count++;
+    for (int i = 0; i < fields.length; i++) {
+      if (!comparable[i])
+        continue;
+      Object value = tuple.getObject(positions[i]);
+      if (value == null) {
+        nulls[i]++;
+      } else if (!(value instanceof Comparable) || !(value instanceof Serializable)) {
+        // We can't store the range of values that can't be serialized
+        comparable[i] = false;
+      } else {
+        Comparable c = (Comparable) value;
+        try {
+          if (min[i] == null || c.compareTo(min[i]) < 0)
+            min[i] = c;
+          if (max[i] == null || c.compareTo(max[i]) > 0)
+            max[i] = c;
+        } catch (ClassCastException e) {
+          // Values of different types, we can't say anything about the range
+          comparable[i] = false;
+        }
+      }
+    }
+  }
+
+  private int index(String field) {
+    for (int i = 0; i < fields.length; i++)
+      if (fields[i].equals(field))
+        return i;
+    return -1;
+  }
+
+  /**
+   * @return true if the range of the field is known
+   */
+  public boolean hasField(String field) {
+    int i = index(field);
+    return i >= 0 && comparable[i];
+  }
+
+  /**
+   * @return the smallest value of the field, or null if all values are null
+   */
+  public Comparable getMin(String field) {
+    int i = index(field);
+    return i < 0 || !comparable[i] ? null : min[i];
+  }
+
+  /**
+   * @return the largest value of the field, or null if all values are null
+   */
+  public Comparable getMax(String field) {
+    int i = index(field);
+    return i < 0 || !comparable[i] ? null : max[i];
+  }
+
+  /**
+   * @return the number of nulls in the field
+   */
+  public long getNulls(String field) {
+    int i = index(field);
+    return i < 0 ? 0 : nulls[i];
+  }
+
+  /**
+   * @return the number of tuples in the file
+   */
+  public long getCount() {
+    return count;
+  }
+
+  /**
+   * Write the statistics to a file.
+   */
+  public void write(Path path, Configuration conf) throws IOException {
+    FileSystem fs = path.getFileSystem(conf);
+    FSDataOutputStream stream = fs.create(path, true);
+    ObjectOutputStream ostream = new ObjectOutputStream(stream);
+    ostream.writeObject(this);
+    ostream.close();
+  }
+
+  /**
+   * Read the statistics of a part file.
+   *
+   * @param partFile
+   *          the path of the part file
+   * @return the statistics, or null if they were not collected
+   */
+  public static FileStats read(String partFile) throws IOException {
+    Path part = new Path(partFile);
+    Path path = new Path(part.getParent(), FILE_PREFIX + part.getName());
+    FileSystem fs = path.getFileSystem(new Configuration());
+    if (!fs.exists(path))
+      return null;
+    ObjectInputStream istream = new ObjectInputStream(fs.open(path));
+    try {
+      return (FileStats) istream.readObject();
+    } catch (ClassNotFoundException e) {
+      throw new IOException("Could not read the statistics in " + path);
+    } finally {
+      istream.close();
+    }
+  }
+}
@@ -0,0 +1,81 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.mapred.FileOutputFormat;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.OutputFormat;
+import org.apache.hadoop.mapred.RecordWriter;
+import org.apache.hadoop.mapred.Reporter;
+import org.apache.hadoop.util.Progressable;
+import org.apache.hadoop.util.ReflectionUtils;
+
+/**
+ * An output format that writes the part files with the output format of the
+ * original scheme of a meta sink, and the statistics collected by MetaScheme
+ * for each part file when it is closed. It is set up by MetaScheme if
+ * statistics are collected.
+ *
+ * The statistics are written into the work folder of the task, so they are
+ * moved to the output folder together with the part file when the task is
+ * committed.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class FileStatsOutputFormat implements OutputFormat {
+
+  private OutputFormat getOutputFormat(JobConf job) throws IOException {
+    String className = job.get(FileStats.OUTPUT_FORMAT);
+    try {
+      return (OutputFormat) ReflectionUtils.newInstance(job.getClassByName(className), job);
+    } catch (ClassNotFoundException e) {
+      throw new IOException("Could not find the output format " + className);
+    }
+  }
+
+  @Override
+  public RecordWriter getRecordWriter(FileSystem ignored, final JobConf job, final String name,
+          Progressable progress) throws IOException {
+    final RecordWriter writer = getOutputFormat(job).getRecordWriter(ignored, job, name, progress);
+    final String outputPath = job.get(FileStats.OUTPUT_PATH);
+    return new RecordWriter() {
+
+      @Override
+      public void write(Object key, Object value) throws IOException {
+        writer.write(key, value);
+      }
+
+      @Override
+      public void close(Reporter reporter) throws IOException {
+        writer.close(reporter);
+        FileStats stats = FileStats.removeCurrent(outputPath);
+        if (stats != null) {
+          Path workPath = FileOutputFormat.getWorkOutputPath(job);
+          stats.write(new Path(workPath, FileStats.FILE_PREFIX + name), job);
+        }
+      }
+    };
+  }
+
+  @Override
+  public void checkOutputSpecs(FileSystem ignored, JobConf job) throws IOException {
+    getOutputFormat(job).checkOutputSpecs(ignored, job);
+  }
+}
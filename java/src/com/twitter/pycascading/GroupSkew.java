@@ -0,0 +1,250 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.Iterator;
+import java.util.List;
+import java.util.PriorityQueue;
+import java.util.Random;
+
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.TaskAttemptID;
+
+import cascading.tuple.TupleEntry;
+
+/**
+ * The sizes of the groups processed by a PyCascading buffer or an aggregator
+ * in a reduce task, which are collected if the pycascading.skew_report
+ * parameter is set.
+ *
+ * The largest TOP_K groups and a histogram of the group sizes in powers of 2
+ * are kept. Since all the tuples of a group go to the same reducer, the
+ * largest groups of a step are the largest of the largest groups of its
+ * tasks. The sizes are written to a file in the folder given in
+ * pycascading.skew_report.dir when the operation is cleaned up.
+ *
+ * The files are tab-separated. The lines starting with "#" contain the job,
+ * the task, the pipe of the operation, the number of groups and tuples, and
+ * the histogram. The other lines contain the size and the key of a large
+ * group. Every attempt of a task writes a file, so the files of the same task
+ * have to be merged only once.
+ *
+ * @author Gabor Szabo
+ */
+public class GroupSkew {
+  // The jobconf parameter that turns on the collection of the group sizes
+  public static final String REPORT = "pycascading.skew_report";
+
+  // The jobconf parameter for the folder where the group sizes are written
+  public static final String REPORT_DIR = "pycascading.skew_report.dir";
+
+  // The jobconf parameter for the number of largest groups kept
+  public static final String TOP_K = "pycascading.skew_report.top_k";
+
+  // The file extension of the group sizes
+  public static final String EXTENSION = ".skew";
+
+  private static final int DEFAULT_TOP_K = 20;
+
+  // The keys of the groups are truncated to this many characters
+  private static final int MAX_KEY_LENGTH = 200;
+
+  private static final Random random = new Random();
+
+  private static class Group {
+    final long size;
+    final String key;
+
+    Group(long size, String key) {
+      this.size = size;
+      this.key = key;
+    }
+  }
+
+  private static final Comparator<Group> bySize = new Comparator<Group>() {
+    @Override
+    public int compare(Group g1, Group g2) {
+      return (g1.size < g2.size ? -1 : (g1.size == g2.size ? 0 : 1));
+    }
+  };
+
+  private final JobConf jobConf;
+  private final String name;
+  private final int topK;
+
+  private long groups = 0;
+  private long totalTuples = 0;
+  // The number of groups with sizes in [2^i, 2^(i+1))
+  private final long[] histogram = new long[64];
+  // The largest groups, with the smallest of them at the head
+  private final PriorityQueue<Group> largest;
+  // The number of tuples in the current group
+  private long groupSize = 0;
+
+  private GroupSkew(JobConf jobConf, String name) {
+    this.jobConf = jobConf;
+    this.name = (name == null ? "unnamed" : name);
+    topK = Math.max(1, jobConf.getInt(TOP_K, DEFAULT_TOP_K));
+    largest = new PriorityQueue<Group>(topK + 1, bySize);
+  }
+
+  /**
+   * @param jobConf
+   *          the job's configuration
+   * @param name
+   *          the name of the pipe of the operation
+   * @return the collector of the group sizes, or null if the skew report is
+   *         off
+   */
+  public static GroupSkew create(JobConf jobConf, String name) {
+    if (!jobConf.getBoolean(REPORT, false) || jobConf.get(REPORT_DIR) == null)
+      return null;
+    return new GroupSkew(jobConf, name);
+  }
+
+  /**
+   * Wrap the iterator over the tuples of a group so that they are counted.
+   *
+   * @param tuples
+   *          the iterator over the tuples of the group
+   * @return the counting iterator
+   */
+  public <T> Iterator<T> countGroup(final Iterator<T> tuples) {
+    groupSize = 0;
+    return new Iterator<T>() {
+      @Override
+      public boolean hasNext() {
+        return tuples.hasNext();
+      }
+
+      @Override
+      public T next() {
+        groupSize++;
+        return tuples.next();
+      }
+
+      @Override
+      public void remove() {
+        tuples.remove();
+      }
+    };
+  }
+
+  /**
+   * Start counting the tuples of a new group without an iterator, as for
+   * aggregators.
+   */
+  public void startGroup() {
+    groupSize = 0;
+  }
+
+  /**
+   * Count a tuple of the current group started with startGroup.
+   */
+  public void countTuple() {
+    groupSize++;
+  }
+
+  /**
+   * Record the size of a group after the buffer was called.
+   *
+   * @param group
+   *          the key of the group
+   * @param tuples
+   *          the counting iterator returned by countGroup. The tuples that
+   *          the buffer didn't read are counted here.
+   */
+  public void groupFinished(TupleEntry group, Iterator<?> tuples) {
+    while (tuples.hasNext())
+      tuples.next();
+    groupFinished(group);
+  }
+
+  /**
+   * Record the size of the group started with startGroup or countGroup.
+   *
+   * @param group
+   *          the key of the group
+   */
+  public void groupFinished(TupleEntry group) {
+    if (groupSize == 0)
+      return;
+    groups++;
+    totalTuples += groupSize;
+    histogram[63 - Long.numberOfLeadingZeros(groupSize)]++;
+    if (largest.size() < topK || groupSize > largest.peek().size) {
+      String key = group.getTuple().toString().replace('\t', ' ').replace('\n', ' ');
+      if (key.length() > MAX_KEY_LENGTH)
+        key = key.substring(0, MAX_KEY_LENGTH) + "...";
+      largest.add(new Group(groupSize, key));
+      if (largest.size() > topK)
+        largest.poll();
+    }
+  }
+
+  /**
+   * Write the group sizes to a file in the folder of the report.
+   */
+  public void write() {
+    String taskId = jobConf.get("mapred.task.id");
+    String fileId = (taskId == null ? "local" : taskId) + "-"
+            + Long.toHexString(random.nextLong() & Long.MAX_VALUE);
+    String job = "local";
+    // Outside of Hadoop every operation is a task of its own
+    String task = fileId;
+    if (taskId != null) {
+      try {
+        TaskAttemptID attempt = TaskAttemptID.forName(taskId);
+        job = attempt.getJobID().toString();
+        task = attempt.getTaskID().toString();
+      } catch (IllegalArgumentException e) {
+        // Not a Hadoop task, for instance with the memory engine
+      }
+    }
+    Path path = new Path(jobConf.get(REPORT_DIR), fileId + EXTENSION);
+    List<Group> sorted = new ArrayList<Group>(largest);
+    Collections.sort(sorted, Collections.reverseOrder(bySize));
+    try {
+      FileSystem fs = path.getFileSystem(jobConf);
+      PrintWriter writer = new PrintWriter(new OutputStreamWriter(fs.create(path), "UTF-8"));
+      try {
+        writer.println("#job\t" + job);
+        writer.println("#task\t" + task);
+        writer.println("#pipe\t" + name);
+        writer.println("#groups\t" + groups);
+        writer.println("#tuples\t" + totalTuples);
+        for (int i = 0; i < histogram.length; i++) {
+          if (histogram[i] > 0)
+            writer.println("#histogram\t" + i + "\t" + histogram[i]);
+        }
+        for (Group group : sorted)
+          writer.println(group.size + "\t" + group.key);
+      } finally {
+        writer.close();
+      }
+    } catch (IOException e) {
+      // A failure to write the report should not fail the task
+      e.printStackTrace();
+    }
+  }
+}
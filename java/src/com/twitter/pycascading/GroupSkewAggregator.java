@@ -0,0 +1,109 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import cascading.flow.FlowProcess;
+import cascading.flow.hadoop.HadoopFlowProcess;
+import cascading.operation.Aggregator;
+import cascading.operation.AggregatorCall;
+import cascading.operation.BaseOperation;
+import cascading.operation.OperationCall;
+
+/**
+ * A native Cascading Aggregator that also records the sizes of the groups it
+ * aggregates for the skew report. The native aggregators of a flow are
+ * wrapped in this only if the flow is run with the pycascading.skew_report
+ * parameter set.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings("rawtypes")
+public class GroupSkewAggregator extends BaseOperation implements Aggregator {
+  private static final long serialVersionUID = 7322516590342128451L;
+
+  private Aggregator aggregator;
+  private String name;
+
+  // The sizes of the groups, or null if the skew report is off
+  private transient GroupSkew skew = null;
+
+  /**
+   * @param aggregator
+   *          the aggregator that does the work
+   * @param name
+   *          the name of the pipe of the aggregator in the skew report
+   */
+  public GroupSkewAggregator(Aggregator aggregator, String name) {
+    super(aggregator.getNumArgs(), aggregator.getFieldDeclaration());
+    this.aggregator = aggregator;
+    this.name = name;
+  }
+
+  /**
+   * @return the aggregator that does the work
+   */
+  public Aggregator getAggregator() {
+    return aggregator;
+  }
+
+  @Override
+  public boolean isSafe() {
+    return aggregator.isSafe();
+  }
+
+  @Override
+  public void prepare(FlowProcess flowProcess, OperationCall operationCall) {
+    aggregator.prepare(flowProcess, operationCall);
+    skew = GroupSkew.create(((HadoopFlowProcess) flowProcess).getJobConf(), name);
+  }
+
+  @Override
+  public void cleanup(FlowProcess flowProcess, OperationCall operationCall) {
+    aggregator.cleanup(flowProcess, operationCall);
+    if (skew != null) {
+      skew.write();
+      skew = null;
+    }
+  }
+
+  @SuppressWarnings("unchecked")
+  @Override
+  public void start(FlowProcess flowProcess, AggregatorCall aggregatorCall) {
+    if (skew != null)
+      skew.startGroup();
+    aggregator.start(flowProcess, aggregatorCall);
+  }
+
+  @SuppressWarnings("unchecked")
+  @Override
+  public void aggregate(FlowProcess flowProcess, AggregatorCall aggregatorCall) {
+    if (skew != null)
+      skew.countTuple();
+    aggregator.aggregate(flowProcess, aggregatorCall);
+  }
+
+  @SuppressWarnings("unchecked")
+  @Override
+  public void complete(FlowProcess flowProcess, AggregatorCall aggregatorCall) {
+    aggregator.complete(flowProcess, aggregatorCall);
+    if (skew != null)
+      skew.groupFinished(aggregatorCall.getGroup());
+  }
+
+  @Override
+  public String toString() {
+    return aggregator.toString();
+  }
+}
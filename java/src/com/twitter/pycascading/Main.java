@@ -7,6 +7,7 @@ import org.python.util.PythonInterpreter;
 public class Main {
 
   private static PythonInterpreter interpreter = null;
+  private static boolean initialized = false;
 
   /**
    * This is the main method that gets passed to Hadoop, or executed in local
@@ -17,20 +18,41 @@ public class Main {
    * @throws Exception
    */
   public static void main(String[] args) throws Exception {
-    Properties sysProps = System.getProperties();
     Properties props = new Properties();
-    props.put("python.cachedir", sysProps.get("user.home") + "/.jython-cache");
+    props.put("python.cachedir", PackageCache.getLauncherCacheDir());
     props.put("python.cachedir.skip", "0");
     PythonInterpreter.initialize(System.getProperties(), props, args);
+    initialized = true;
     getInterpreter().execfile(args[0]);
   }
 
+  /**
+   * Initialize Jython on a worker, unless it has been initialized already in
+   * this JVM. This must be called before the interpreter is created.
+   * 
+   * @param cacheDir
+   *          the folder of Jython's package cache, or null if there is none
+   * @return true if Jython was initialized now
+   */
+  public static synchronized boolean initialize(String cacheDir) {
+    if (initialized || interpreter != null)
+      return false;
+    Properties props = new Properties();
+    if (cacheDir != null) {
+      props.put("python.cachedir", cacheDir);
+      props.put("python.cachedir.skip", "0");
+    }
+    PythonInterpreter.initialize(System.getProperties(), props, new String[0]);
+    initialized = true;
+    return true;
+  }
+
   /**
    * Create and return the Python interpreter (singleton per JVM).
    * 
    * @return the Python interpreter
    */
-  public static PythonInterpreter getInterpreter() {
+  public static synchronized PythonInterpreter getInterpreter() {
     if (interpreter == null) {
       interpreter = new PythonInterpreter();
     }
@@ -0,0 +1,306 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.List;
+
+import org.apache.hadoop.fs.BlockLocation;
+import org.apache.hadoop.fs.FileStatus;
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.io.NullWritable;
+import org.apache.hadoop.mapred.FileInputFormat;
+import org.apache.hadoop.mapred.FileSplit;
+import org.apache.hadoop.mapred.InputFormat;
+import org.apache.hadoop.mapred.InputSplit;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.RecordReader;
+import org.apache.hadoop.mapred.Reporter;
+import org.apache.hadoop.util.ReflectionUtils;
+
+import cascading.scheme.Scheme;
+import cascading.tuple.Tuple;
+
+/**
+ * An input format that joins the buckets of two bucketed data sets. It is set
+ * up by MergeJoinScheme.
+ *
+ * Every part file of the left side is a split, which is read whole together
+ * with the part file of the same name of the right side. Since both files are
+ * sorted by the keys, they are merged in one pass. The tuples of the right
+ * side with the same key are kept in memory, so the side with fewer tuples
+ * for a key should be the right side.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class MergeJoinInputFormat implements InputFormat {
+  // The jobconf parameters set by MergeJoinScheme
+  public static final String LEFT_INPUT_FORMAT = "pycascading.merge_join.left_input_format";
+  public static final String RIGHT_INPUT_FORMAT = "pycascading.merge_join.right_input_format";
+  public static final String SCHEME = "pycascading.merge_join.scheme";
+
+  /**
+   * Reads the tuples of a part file of one side in order, and checks that
+   * they are sorted by the keys.
+   */
+  private static class SortedReader {
+    private final RecordReader reader;
+    private final Scheme scheme;
+    private final int[] keyPositions;
+    private final Path path;
+    private final Object key;
+    private final Object value;
+
+    private Tuple tuple = null;
+    private Tuple tupleKey = null;
+
+    public SortedReader(RecordReader reader, Scheme scheme, int[] keyPositions, Path path)
+            throws IOException {
+      this.reader = reader;
+      this.scheme = scheme;
+      this.keyPositions = keyPositions;
+      this.path = path;
+      key = reader.createKey();
+      value = reader.createValue();
+      advance();
+    }
+
+    /**
+     * Read the next tuple.
+     */
+    public void advance() throws IOException {
+      if (!reader.next(key, value)) {
+        tuple = null;
+        tupleKey = null;
+        return;
+      }
+      // The record readers reuse their values, so we copy the tuples
+      tuple = new Tuple(scheme.source(key, value));
+      Tuple previousKey = tupleKey;
+      tupleKey = tuple.get(keyPositions);
+      if (previousKey != null && previousKey.compareTo(tupleKey) > 0)
+        throw new IOException("The tuples are not sorted by the keys in " + path);
+    }
+
+    /**
+     * @return the current tuple, or null if there are no more tuples
+     */
+    public Tuple getTuple() {
+      return tuple;
+    }
+
+    /**
+     * @return the key of the current tuple
+     */
+    public Tuple getKey() {
+      return tupleKey;
+    }
+
+    public long getPos() throws IOException {
+      return reader.getPos();
+    }
+
+    public float getProgress() throws IOException {
+      return reader.getProgress();
+    }
+
+    public void close() throws IOException {
+      reader.close();
+    }
+  }
+
+  /**
+   * Merges the tuples of a left and a right part file.
+   */
+  private static class MergeJoinRecordReader implements RecordReader {
+    private final SortedReader left;
+    // The right side, or null if there is no right part file
+    private final SortedReader right;
+    private final boolean leftOuter;
+    private final int rightSize;
+
+    // The right tuples with the key of the last left tuple
+    private final List<Tuple> matches = new ArrayList<Tuple>();
+    private Tuple matchesKey = null;
+    // The next match to join with the current left tuple, or -1 if the
+    // matches of the current left tuple haven't been looked up yet
+    private int position = -1;
+
+    public MergeJoinRecordReader(SortedReader left, SortedReader right, boolean leftOuter,
+            int rightSize) {
+      this.left = left;
+      this.right = right;
+      this.leftOuter = leftOuter;
+      this.rightSize = rightSize;
+    }
+
+    /**
+     * Collect the right tuples with the key into matches.
+     */
+    private void findMatches(Tuple key) throws IOException {
+      if (matchesKey != null && matchesKey.equals(key))
+        return;
+      matches.clear();
+      matchesKey = key;
+      if (right == null)
+        return;
+      while (right.getTuple() != null && right.getKey().compareTo(key) < 0)
+        right.advance();
+      while (right.getTuple() != null && right.getKey().compareTo(key) == 0) {
+        matches.add(right.getTuple());
+        right.advance();
+      }
+    }
+
+    private void join(Tuple result, Tuple rightTuple) {
+      result.clear();
+      result.addAll(left.getTuple());
+      result.addAll(rightTuple);
+    }
+
+    @Override
+    public boolean next(Object key, Object value) throws IOException {
+      Tuple result = (Tuple) value;
+      while (left.getTuple() != null) {
+        if (position < 0) {
+          findMatches(left.getKey());
+          position = 0;
+          if (matches.isEmpty() && leftOuter) {
+            join(result, Tuple.size(rightSize));
+            left.advance();
+            position = -1;
+            return true;
+          }
+        }
+        if (position < matches.size()) {
+          join(result, matches.get(position++));
+          if (position == matches.size()) {
+            left.advance();
+            position = -1;
+          }
+          return true;
+        }
+        left.advance();
+        position = -1;
+      }
+      return false;
+    }
+
+    @Override
+    public Object createKey() {
+      return NullWritable.get();
+    }
+
+    @Override
+    public Object createValue() {
+      return new Tuple();
+    }
+
+    @Override
+    public long getPos() throws IOException {
+      return left.getPos();
+    }
+
+    @Override
+    public void close() throws IOException {
+      left.close();
+      if (right != null)
+        right.close();
+    }
+
+    @Override
+    public float getProgress() throws IOException {
+      return left.getProgress();
+    }
+  }
+
+  private InputFormat getInputFormat(JobConf job, String parameter) throws IOException {
+    String className = job.get(parameter);
+    try {
+      return (InputFormat) ReflectionUtils.newInstance(job.getClassByName(className), job);
+    } catch (ClassNotFoundException e) {
+      throw new IOException("Could not find the input format " + className);
+    }
+  }
+
+  private MergeJoinScheme getScheme(JobConf job) throws IOException {
+    return (MergeJoinScheme) cascading.util.Util.deserializeBase64(job.get(SCHEME));
+  }
+
+  /**
+   * Add the part files in a folder or matching a glob to files.
+   */
+  private void listFiles(FileSystem fs, Path path, List<FileStatus> files) throws IOException {
+    FileStatus[] statuses = fs.globStatus(path);
+    if (statuses == null)
+      return;
+    for (FileStatus status : statuses) {
+      String name = status.getPath().getName();
+      // Hidden files are not read by Hadoop either
+      if (name.startsWith(".") || name.startsWith("_"))
+        continue;
+      if (status.isDir())
+        listFiles(fs, new Path(status.getPath(), "*"), files);
+      else
+        files.add(status);
+    }
+  }
+
+  @Override
+  public InputSplit[] getSplits(JobConf job, int numSplits) throws IOException {
+    List<FileStatus> files = new ArrayList<FileStatus>();
+    for (Path path : FileInputFormat.getInputPaths(job))
+      listFiles(path.getFileSystem(job), path, files);
+    InputSplit[] splits = new InputSplit[files.size()];
+    for (int i = 0; i < files.size(); i++) {
+      FileStatus file = files.get(i);
+      FileSystem fs = file.getPath().getFileSystem(job);
+      // The buckets can't be split, so a split is read where the first block
+      // of its left file is
+      BlockLocation[] blocks = fs.getFileBlockLocations(file, 0, file.getLen());
+      String[] hosts = (blocks == null || blocks.length == 0 ? new String[0] : blocks[0]
+              .getHosts());
+      splits[i] = new FileSplit(file.getPath(), 0, file.getLen(), hosts);
+    }
+    return splits;
+  }
+
+  @Override
+  public RecordReader getRecordReader(InputSplit split, JobConf job, Reporter reporter)
+          throws IOException {
+    MergeJoinScheme scheme = getScheme(job);
+    FileSplit leftSplit = (FileSplit) split;
+    job.set("map.input.file", leftSplit.getPath().toString());
+    SortedReader left = new SortedReader(getInputFormat(job, LEFT_INPUT_FORMAT).getRecordReader(
+            leftSplit, job, reporter), scheme.getLeft(), scheme.getLeftKeyPositions(),
+            leftSplit.getPath());
+    // The bucket of the right side is in the part file with the same name
+    Path rightPath = new Path(scheme.getRightPath(), leftSplit.getPath().getName());
+    FileSystem fs = rightPath.getFileSystem(job);
+    SortedReader right = null;
+    if (fs.exists(rightPath)) {
+      FileSplit rightSplit = new FileSplit(rightPath, 0, fs.getFileStatus(rightPath).getLen(),
+              new String[0]);
+      right = new SortedReader(getInputFormat(job, RIGHT_INPUT_FORMAT).getRecordReader(
+              rightSplit, job, reporter), scheme.getRight(), scheme.getRightKeyPositions(),
+              rightPath);
+    }
+    return new MergeJoinRecordReader(left, right, scheme.isLeftOuter(), scheme.getRight()
+            .getSourceFields().size());
+  }
+}
@@ -0,0 +1,156 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.OutputCollector;
+
+import cascading.scheme.Scheme;
+import cascading.tap.Hfs;
+import cascading.tap.Tap;
+import cascading.tuple.Fields;
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntry;
+
+/**
+ * A source scheme that joins two bucketed data sets in the mappers, without
+ * shuffling them. The data sets must have been written by bucketed sinks with
+ * the same number of buckets, so that the tuples with the same keys are in
+ * the part files with the same names, sorted by the keys.
+ *
+ * The tap of the scheme reads the left data set, and the input format is
+ * replaced by a MergeJoinInputFormat, which makes a split of each part file
+ * of the left side, and merges it with the same part file of the right side.
+ * The tuples read are the joined tuples, with the fields of the left side
+ * followed by the fields of the right side.
+ *
+ * @author Gabor Szabo
+ */
+public class MergeJoinScheme extends Scheme {
+  private static final long serialVersionUID = -6038296751328461402L;
+
+  private Scheme left;
+  private Scheme right;
+  private String rightPath;
+  private Fields leftKeys;
+  private Fields rightKeys;
+  private boolean leftOuter;
+
+  /**
+   * @param left
+   *          the scheme of the left data set
+   * @param right
+   *          the scheme of the right data set
+   * @param rightPath
+   *          the folder of the right data set
+   * @param leftKeys
+   *          the key fields of the left side
+   * @param rightKeys
+   *          the key fields of the right side
+   * @param declaredFields
+   *          the names of the fields of the joined tuples, or null to use the
+   *          fields of the left side followed by the fields of the right side
+   * @param leftOuter
+   *          if true, the left tuples without a match on the right side are
+   *          joined with nulls, otherwise they are dropped
+   */
+  public MergeJoinScheme(Scheme left, Scheme right, String rightPath, Fields leftKeys,
+          Fields rightKeys, Fields declaredFields, boolean leftOuter) {
+    super(declaredFields == null ? Fields.join(left.getSourceFields(), right.getSourceFields())
+            : declaredFields);
+    if (leftKeys.size() != rightKeys.size())
+      throw new IllegalArgumentException("The numbers of key fields must be the same: "
+              + leftKeys + ", " + rightKeys);
+    this.left = left;
+    this.right = right;
+    this.rightPath = rightPath;
+    this.leftKeys = leftKeys;
+    this.rightKeys = rightKeys;
+    this.leftOuter = leftOuter;
+  }
+
+  /**
+   * @return the scheme of the left data set
+   */
+  public Scheme getLeft() {
+    return left;
+  }
+
+  /**
+   * @return the scheme of the right data set
+   */
+  public Scheme getRight() {
+    return right;
+  }
+
+  /**
+   * @return the folder of the right data set
+   */
+  public String getRightPath() {
+    return rightPath;
+  }
+
+  /**
+   * @return the positions of the key fields in the tuples of the left side
+   */
+  public int[] getLeftKeyPositions() {
+    return left.getSourceFields().getPos(leftKeys);
+  }
+
+  /**
+   * @return the positions of the key fields in the tuples of the right side
+   */
+  public int[] getRightKeyPositions() {
+    return right.getSourceFields().getPos(rightKeys);
+  }
+
+  /**
+   * @return true if the unmatched left tuples are kept
+   */
+  public boolean isLeftOuter() {
+    return leftOuter;
+  }
+
+  @Override
+  public void sourceInit(Tap tap, JobConf conf) throws IOException {
+    left.sourceInit(tap, conf);
+    conf.set(MergeJoinInputFormat.LEFT_INPUT_FORMAT, conf.getInputFormat().getClass().getName());
+    // The right side is read by the record readers, so only its input format
+    // is needed
+    JobConf rightConf = new JobConf(conf);
+    right.sourceInit(new Hfs(right, rightPath), rightConf);
+    conf.set(MergeJoinInputFormat.RIGHT_INPUT_FORMAT, rightConf.getInputFormat().getClass()
+            .getName());
+    conf.set(MergeJoinInputFormat.SCHEME, cascading.util.Util.serializeBase64(this));
+    conf.setInputFormat(MergeJoinInputFormat.class);
+  }
+
+  @Override
+  public Tuple source(Object key, Object value) {
+    return (Tuple) value;
+  }
+
+  @Override
+  public void sinkInit(Tap tap, JobConf conf) throws IOException {
+    throw new UnsupportedOperationException("A merge join scheme can only be used as a source");
+  }
+
+  @Override
+  public void sink(TupleEntry tupleEntry, OutputCollector outputCollector) throws IOException {
+    throw new UnsupportedOperationException("A merge join scheme can only be used as a source");
+  }
+}
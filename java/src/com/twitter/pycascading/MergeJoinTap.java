@@ -0,0 +1,94 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.mapred.JobConf;
+
+import cascading.tap.MultiSourceTap;
+import cascading.tap.Tap;
+import cascading.tuple.TupleEntryIterator;
+
+/**
+ * The source tap of a merge join of two bucketed data sets.
+ *
+ * Only the left tap, whose scheme is a MergeJoinScheme, is read by the flow.
+ * The right data set is read by the record readers of the
+ * MergeJoinInputFormat, but it is still a source of the tap. This way the
+ * flow is not skipped as up to date if only the right side changed, and a
+ * cascade runs the flow after the flow writing the right side.
+ *
+ * @author Gabor Szabo
+ */
+public class MergeJoinTap extends MultiSourceTap {
+  private static final long serialVersionUID = -2816439375215096482L;
+
+  private Tap left;
+  private Tap right;
+
+  /**
+   * @param left
+   *          the tap reading the left side with a MergeJoinScheme
+   * @param right
+   *          the tap of the right side
+   */
+  public MergeJoinTap(Tap left, Tap right) {
+    super(left.getScheme());
+    this.left = left;
+    this.right = right;
+  }
+
+  /**
+   * @return the tap reading the left side with a MergeJoinScheme
+   */
+  public Tap getLeft() {
+    return left;
+  }
+
+  /**
+   * @return the tap of the right side
+   */
+  public Tap getRight() {
+    return right;
+  }
+
+  @Override
+  protected Tap[] getTaps() {
+    return new Tap[] { left, right };
+  }
+
+  @Override
+  public Path getPath() {
+    return left.getPath();
+  }
+
+  @Override
+  public void sourceInit(JobConf conf) throws IOException {
+    // The right side must not be an input path of the job
+    left.sourceInit(conf);
+  }
+
+  @Override
+  public TupleEntryIterator openForRead(JobConf conf) throws IOException {
+    return left.openForRead(conf);
+  }
+
+  @Override
+  public String toString() {
+    return "MergeJoinTap[" + left + ", " + right + "]";
+  }
+}
@@ -14,7 +14,9 @@
  */
 package com.twitter.pycascading;
 
+import java.io.BufferedReader;
 import java.io.IOException;
+import java.io.InputStreamReader;
 import java.io.ObjectInputStream;
 import java.io.ObjectOutputStream;
 
@@ -48,9 +50,24 @@ public class MetaScheme extends Scheme {
   private static final String schemeFileName = ".pycascading_scheme";
   private static final String headerFileName = ".pycascading_header";
   private static final String typeFileName = ".pycascading_types";
+  private static final String sampleFileName = ".pycascading_sample";
+  private static final String partitionsFileName = ".pycascading_partitions";
+  private static final String bucketsFileName = ".pycascading_buckets";
 
   private Scheme scheme;
   private String outputPath;
+  // The description of the sampled sources that the data was computed from,
+  // or null if the data is not sampled
+  private String sampling = null;
+  // The names of the fields that the data is partitioned into folders by, or
+  // null if the data is not partitioned
+  private String[] partitionFields = null;
+  // The names of the fields whose ranges are stored for every part file, or
+  // null
+  private String[] statsFields = null;
+  // The names of the fields that the data is bucketed and sorted by, or null
+  // if the data is not bucketed
+  private String[] bucketFields = null;
   private boolean firstLine = true;
   private boolean typeFileToWrite = true;
 
@@ -82,6 +99,83 @@ public class MetaScheme extends Scheme {
     }
   }
 
+  /**
+   * Read the description of the sampled sources of the data, which is stored
+   * in the .pycascading_sample file if any of the sources was sampled.
+   * 
+   * @param inputPath
+   *          The path to where the data was stored
+   * @return The lines of the description, or null if the data is not sampled
+   * @throws IOException
+   */
+  public static String getSampling(String inputPath) throws IOException {
+    Path path = new Path(inputPath + "/" + sampleFileName);
+    FileSystem fs = path.getFileSystem(new Configuration());
+    if (!fs.exists(path))
+      return null;
+    BufferedReader reader = new BufferedReader(new InputStreamReader(fs.open(path), "UTF-8"));
+    try {
+      StringBuilder sampling = new StringBuilder();
+      String line;
+      while ((line = reader.readLine()) != null)
+        sampling.append(line).append("\n");
+      return sampling.toString();
+    } finally {
+      reader.close();
+    }
+  }
+
+  /**
+   * Read the names of the fields that the data is partitioned by. The data of
+   * a partition is in the folder field1=value1/field2=value2/..., and the
+   * names of the fields are stored in the .pycascading_partitions file.
+   * 
+   * @param inputPath
+   *          The path to where the data was stored
+   * @return The names of the partition fields in the order of the folders, or
+   *         null if the data is not partitioned
+   * @throws IOException
+   */
+  public static String[] getPartitionFields(String inputPath) throws IOException {
+    Path path = new Path(inputPath + "/" + partitionsFileName);
+    FileSystem fs = path.getFileSystem(new Configuration());
+    if (!fs.exists(path))
+      return null;
+    BufferedReader reader = new BufferedReader(new InputStreamReader(fs.open(path), "UTF-8"));
+    try {
+      String line = reader.readLine();
+      return (line == null ? new String[0] : line.split("\t"));
+    } finally {
+      reader.close();
+    }
+  }
+
+  /**
+   * Read how the data is bucketed. The tuples are hashed into the part files
+   * by the key fields, and are sorted by the key fields in each part file.
+   * The number of buckets and the key fields are stored in the
+   * .pycascading_buckets file.
+   * 
+   * @param inputPath
+   *          The path to where the data was stored
+   * @return The number of buckets followed by the names of the key fields, or
+   *         null if the data is not bucketed
+   * @throws IOException
+   */
+  public static String[] getBucketing(String inputPath) throws IOException {
+    Path path = new Path(inputPath + "/" + bucketsFileName);
+    FileSystem fs = path.getFileSystem(new Configuration());
+    if (!fs.exists(path))
+      return null;
+    BufferedReader reader = new BufferedReader(new InputStreamReader(fs.open(path), "UTF-8"));
+    try {
+      String line = reader.readLine();
+      return (line == null ? null : line.split("\t"));
+    } finally {
+      reader.close();
+    }
+  }
+
   /**
    * Returns the scheme that will store field information and the scheme in
    * outputPath. Additionally, a file called .pycascading_header will be
@@ -104,6 +198,57 @@ public class MetaScheme extends Scheme {
     this.outputPath = outputPath;
   }
 
+  /**
+   * Set the description of the sampled sources that the data is computed
+   * from. It is stored in the .pycascading_sample file with the data.
+   * 
+   * @param sampling
+   *          The lines of the description, or null if the data is not sampled
+   */
+  public void setSampling(String sampling) {
+    this.sampling = sampling;
+  }
+
+  /**
+   * Set the names of the fields that the data is partitioned by. They are
+   * stored in the .pycascading_partitions file with the data.
+   * 
+   * @param partitionFields
+   *          The names of the fields in the order of the folders
+   */
+  public void setPartitionFields(String[] partitionFields) {
+    this.partitionFields = partitionFields;
+  }
+
+  /**
+   * Set the fields whose minimum and maximum values and number of nulls are
+   * stored for every part file, so that meta_source can skip the files that
+   * can't match a predicate.
+   * 
+   * @param statsFields
+   *          The names of the fields
+   * @see FileStats
+   */
+  public void setStatsFields(String[] statsFields) {
+    this.statsFields = statsFields;
+  }
+
+  /**
+   * Write the data into a fixed number of buckets. The tuples have to be
+   * grouped by the key fields before the sink, so that each reducer writes
+   * the sorted tuples of one bucket into its part file. The bucketing is
+   * stored in the .pycascading_buckets file with the data.
+   * 
+   * @param buckets
+   *          The number of buckets, which is also the number of reducers
+   * @param bucketFields
+   *          The names of the key fields
+   */
+  public void setBucketing(int buckets, String[] bucketFields) {
+    setNumSinkParts(buckets);
+    this.bucketFields = bucketFields;
+  }
+
   @Override
   public void sourceInit(Tap tap, JobConf conf) throws IOException {
     // We're returning the original storage scheme, so this should not be called
@@ -119,6 +264,11 @@ public class MetaScheme extends Scheme {
   @Override
   public void sinkInit(Tap tap, JobConf conf) throws IOException {
     scheme.sinkInit(tap, conf);
+    if (statsFields != null) {
+      conf.set(FileStats.OUTPUT_FORMAT, conf.getOutputFormat().getClass().getName());
+      conf.set(FileStats.OUTPUT_PATH, outputPath);
+      conf.setOutputFormat(FileStatsOutputFormat.class);
+    }
   }
 
   @Override
@@ -161,6 +311,57 @@ public class MetaScheme extends Scheme {
       } catch (IOException e) {
       }
 
+      if (partitionFields != null) {
+        path = new Path(outputPath + "/" + partitionsFileName);
+        fs = path.getFileSystem(new Configuration());
+        try {
+          if (fs.createNewFile(path)) {
+            FSDataOutputStream stream = fs.create(path, true);
+            StringBuilder line = new StringBuilder();
+            for (String field : partitionFields) {
+              if (line.length() > 0)
+                line.append("\t");
+              line.append(field);
+            }
+            line.append("\n");
+            stream.write(line.toString().getBytes("UTF-8"));
+            stream.close();
+          }
+        } catch (IOException e) {
+        }
+      }
+
+      if (bucketFields != null) {
+        path = new Path(outputPath + "/" + bucketsFileName);
+        fs = path.getFileSystem(new Configuration());
+        try {
+          if (fs.createNewFile(path)) {
+            FSDataOutputStream stream = fs.create(path, true);
+            StringBuilder line = new StringBuilder();
+            line.append(getNumSinkParts());
+            for (String field : bucketFields)
+              line.append("\t").append(field);
+            line.append("\n");
+            stream.write(line.toString().getBytes("UTF-8"));
+            stream.close();
+          }
+        } catch (IOException e) {
+        }
+      }
+
+      if (sampling != null) {
+        path = new Path(outputPath + "/" + sampleFileName);
+        fs = path.getFileSystem(new Configuration());
+        try {
+          if (fs.createNewFile(path)) {
+            FSDataOutputStream stream = fs.create(path, true);
+            stream.write(sampling.getBytes("UTF-8"));
+            stream.close();
+          }
+        } catch (IOException e) {
+        }
+      }
+
       firstLine = false;
     }
 
@@ -188,6 +389,14 @@ public class MetaScheme extends Scheme {
       }
       typeFileToWrite = false;
     }
+    if (statsFields != null) {
+      FileStats stats = FileStats.getCurrent(outputPath);
+      if (stats == null) {
+        stats = new FileStats(statsFields, tupleEntry.getFields());
+        FileStats.setCurrent(outputPath, stats);
+      }
+      stats.add(tupleEntry.getTuple());
+    }
     scheme.sink(tupleEntry, outputCollector);
   }
 }
@@ -0,0 +1,164 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.util.Arrays;
+import java.util.zip.ZipEntry;
+import java.util.zip.ZipOutputStream;
+
+import org.apache.hadoop.fs.Path;
+
+/**
+ * Handles Jython's cache of the Java packages found on the classpath.
+ *
+ * Jython scans all the jars on the classpath when it starts up to build an
+ * index of the Java packages, which takes several seconds with the Hadoop
+ * classpath. The launcher JVM keeps this index in a cache folder, and we ship
+ * the index to the workers in the distributed cache, so that the tasks only
+ * need to scan the jars that are not found in it. The index is keyed by the
+ * paths of the jars, so the jars of the Hadoop installation are found if it
+ * is installed to the same location on the workers.
+ *
+ * @author Gabor Szabo
+ */
+public class PackageCache {
+  // The jobconf parameter with the name of the package cache archive in the
+  // distributed cache
+  public static final String ARCHIVE_PARAMETER = "pycascading.package_cache";
+
+  // The name of the local copy of the package cache on the workers
+  private static final String LOCAL_CACHE_DIR = "pycascading-jython-cache";
+
+  /**
+   * Return the folder where the launcher keeps Jython's cache.
+   *
+   * @return the cache folder
+   */
+  public static String getLauncherCacheDir() {
+    return System.getProperty("user.home") + "/.jython-cache";
+  }
+
+  /**
+   * Create a zip archive of the package index in the launcher's cache, so that
+   * it can be shipped to the workers.
+   *
+   * @return the path to the zip file, or null if there is no package cache
+   * @throws IOException
+   */
+  public static String createArchive() throws IOException {
+    File packages = new File(getLauncherCacheDir(), "packages");
+    if (!packages.isDirectory())
+      return null;
+    File archive = File.createTempFile("pycascading-packages-", ".zip");
+    archive.deleteOnExit();
+    ZipOutputStream zip = new ZipOutputStream(new BufferedOutputStream(new FileOutputStream(
+            archive)));
+    try {
+      // The archive must have the same contents as long as the index doesn't
+      // change, so that the archive cache on HDFS can reuse it
+      File[] files = packages.listFiles();
+      Arrays.sort(files);
+      for (File file : files) {
+        if (!file.isFile())
+          continue;
+        ZipEntry entry = new ZipEntry("packages/" + file.getName());
+        entry.setTime(file.lastModified());
+        zip.putNextEntry(entry);
+        InputStream in = new BufferedInputStream(new FileInputStream(file));
+        try {
+          copyStream(in, zip);
+        } finally {
+          in.close();
+        }
+        zip.closeEntry();
+      }
+    } finally {
+      zip.close();
+    }
+    return archive.getPath();
+  }
+
+  /**
+   * Set up the package cache on a worker from the archives in the distributed
+   * cache. The shared, extracted archive is copied to the working folder of
+   * the task, as Jython updates the index with the jars it didn't find there,
+   * and the tasks must not write the same files concurrently.
+   *
+   * @param archiveName
+   *          the name of the package cache archive, as given in the jobconf
+   * @param archives
+   *          the local paths to the archives in the distributed cache
+   * @return the local cache folder to be used by Jython, or null if the
+   *         package cache was not shipped
+   * @throws IOException
+   */
+  public static String setupTaskCache(String archiveName, Path[] archives) throws IOException {
+    for (Path archive : archives) {
+      if (isPackageCache(archiveName, archive)) {
+        File localCache = new File(LOCAL_CACHE_DIR).getAbsoluteFile();
+        if (!localCache.exists())
+          copyFolder(new File(archive.toString()), localCache);
+        return localCache.getPath();
+      }
+    }
+    return null;
+  }
+
+  /**
+   * Return true if the archive in the distributed cache is the package cache.
+   *
+   * @param archiveName
+   *          the name of the package cache archive, as given in the jobconf
+   * @param archive
+   *          the local path to an archive in the distributed cache
+   */
+  public static boolean isPackageCache(String archiveName, Path archive) {
+    return archiveName != null && archiveName.equals(archive.getName());
+  }
+
+  private static void copyFolder(File source, File dest) throws IOException {
+    dest.mkdirs();
+    for (File file : source.listFiles()) {
+      File destFile = new File(dest, file.getName());
+      if (file.isDirectory())
+        copyFolder(file, destFile);
+      else {
+        InputStream in = new BufferedInputStream(new FileInputStream(file));
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(destFile));
+        try {
+          copyStream(in, out);
+        } finally {
+          in.close();
+          out.close();
+        }
+      }
+    }
+  }
+
+  private static void copyStream(InputStream in, OutputStream out) throws IOException {
+    byte[] buffer = new byte[64 * 1024];
+    int n;
+    while ((n = in.read(buffer)) > 0)
+      out.write(buffer, 0, n);
+  }
+}
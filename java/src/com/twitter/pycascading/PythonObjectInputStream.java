@@ -34,6 +34,10 @@ public class PythonObjectInputStream extends ObjectInputStream {
       String functionType = (String) serializedFunction.get(0);
       String functionName = (String) serializedFunction.get(3);
       PyObject function = null;
+      // Define the names the function depends on, or run the main script if
+      // they were not captured
+      interpreter.set("function_dependencies", serializedFunction.__getitem__(5));
+      interpreter.exec("load_function_scope(function_dependencies)");
       if ("global".equals(functionType)) {
         function = interpreter.get(functionName);
       } else if ("closure".equals(functionType)) {
@@ -0,0 +1,214 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.DataInput;
+import java.io.DataOutput;
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.List;
+import java.util.Random;
+
+import org.apache.hadoop.mapred.FileSplit;
+import org.apache.hadoop.mapred.InputFormat;
+import org.apache.hadoop.mapred.InputSplit;
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.JobConfigurable;
+import org.apache.hadoop.mapred.RecordReader;
+import org.apache.hadoop.mapred.Reporter;
+import org.apache.hadoop.util.ReflectionUtils;
+
+/**
+ * An input format that reads a random sample of the splits of another input
+ * format. It is set up by SampledScheme.
+ *
+ * Of the n splits of the original input format, ceil(fraction * n) are kept,
+ * chosen randomly with the seed. If the records are sampled, too, each record
+ * in the kept splits is read with a probability that makes the expected
+ * fraction of the records read equal to the sampled fraction.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class SampledInputFormat implements InputFormat {
+  // The jobconf parameters set by SampledScheme
+  public static final String INPUT_FORMAT = "pycascading.sample.input_format";
+  public static final String FRACTION = "pycascading.sample.fraction";
+  public static final String SEED = "pycascading.sample.seed";
+  public static final String SAMPLE_RECORDS = "pycascading.sample.records";
+
+  /**
+   * A split of the original input format, with the fraction of its records to
+   * read.
+   */
+  public static class SampledSplit implements InputSplit, JobConfigurable {
+    private InputSplit split;
+    private double recordFraction;
+    private long seed;
+    private JobConf conf = null;
+
+    public SampledSplit() {
+    }
+
+    public SampledSplit(InputSplit split, double recordFraction, long seed) {
+      this.split = split;
+      this.recordFraction = recordFraction;
+      this.seed = seed;
+    }
+
+    public InputSplit getSplit() {
+      return split;
+    }
+
+    @Override
+    public void configure(JobConf conf) {
+      this.conf = conf;
+    }
+
+    @Override
+    public long getLength() throws IOException {
+      return split.getLength();
+    }
+
+    @Override
+    public String[] getLocations() throws IOException {
+      return split.getLocations();
+    }
+
+    @Override
+    public void write(DataOutput out) throws IOException {
+      out.writeUTF(split.getClass().getName());
+      split.write(out);
+      out.writeDouble(recordFraction);
+      out.writeLong(seed);
+    }
+
+    @Override
+    public void readFields(DataInput in) throws IOException {
+      String className = in.readUTF();
+      try {
+        split = (InputSplit) ReflectionUtils.newInstance(Class.forName(className), conf);
+      } catch (ClassNotFoundException e) {
+        throw new IOException("Could not find the input split class " + className);
+      }
+      split.readFields(in);
+      recordFraction = in.readDouble();
+      seed = in.readLong();
+    }
+  }
+
+  /**
+   * A record reader that skips every record with probability 1 - fraction.
+   */
+  private static class SampledRecordReader implements RecordReader {
+    private final RecordReader reader;
+    private final double fraction;
+    private final Random random;
+
+    public SampledRecordReader(RecordReader reader, double fraction, long seed) {
+      this.reader = reader;
+      this.fraction = fraction;
+      this.random = new Random(seed);
+    }
+
+    @Override
+    public boolean next(Object key, Object value) throws IOException {
+      while (reader.next(key, value)) {
+        if (random.nextDouble() < fraction)
+          return true;
+      }
+      return false;
+    }
+
+    @Override
+    public Object createKey() {
+      return reader.createKey();
+    }
+
+    @Override
+    public Object createValue() {
+      return reader.createValue();
+    }
+
+    @Override
+    public long getPos() throws IOException {
+      return reader.getPos();
+    }
+
+    @Override
+    public void close() throws IOException {
+      reader.close();
+    }
+
+    @Override
+    public float getProgress() throws IOException {
+      return reader.getProgress();
+    }
+  }
+
+  private InputFormat getInputFormat(JobConf job) throws IOException {
+    String className = job.get(INPUT_FORMAT);
+    try {
+      return (InputFormat) ReflectionUtils.newInstance(job.getClassByName(className), job);
+    } catch (ClassNotFoundException e) {
+      throw new IOException("Could not find the input format " + className);
+    }
+  }
+
+  @Override
+  public InputSplit[] getSplits(JobConf job, int numSplits) throws IOException {
+    InputSplit[] splits = getInputFormat(job).getSplits(job, numSplits);
+    if (splits.length == 0)
+      return splits;
+    double fraction = Double.parseDouble(job.get(FRACTION));
+    long seed = job.getLong(SEED, 0);
+    int kept = Math.max(1, (int) Math.ceil(fraction * splits.length));
+    // Choose the kept splits randomly, but keep them in their original order
+    List<Integer> indexes = new ArrayList<Integer>();
+    for (int i = 0; i < splits.length; i++)
+      indexes.add(i);
+    Collections.shuffle(indexes, new Random(seed));
+    Integer[] keptIndexes = indexes.subList(0, kept).toArray(new Integer[kept]);
+    Arrays.sort(keptIndexes);
+    double recordFraction = 1.0;
+    if (job.getBoolean(SAMPLE_RECORDS, true))
+      recordFraction = Math.min(1.0, fraction * splits.length / kept);
+    InputSplit[] result = new InputSplit[kept];
+    for (int i = 0; i < kept; i++) {
+      int index = keptIndexes[i];
+      // Every split has its own seed, so that the sample doesn't depend on
+      // the order in which the splits are read
+      result[i] = new SampledSplit(splits[index], recordFraction, seed * 31 + index);
+    }
+    return result;
+  }
+
+  @Override
+  public RecordReader getRecordReader(InputSplit split, JobConf job, Reporter reporter)
+          throws IOException {
+    SampledSplit sampledSplit = (SampledSplit) split;
+    InputSplit originalSplit = sampledSplit.getSplit();
+    // Hadoop only sets this for its own file splits, and some schemes rely
+    // on it
+    if (originalSplit instanceof FileSplit)
+      job.set("map.input.file", ((FileSplit) originalSplit).getPath().toString());
+    RecordReader reader = getInputFormat(job).getRecordReader(originalSplit, job, reporter);
+    if (sampledSplit.recordFraction < 1.0)
+      reader = new SampledRecordReader(reader, sampledSplit.recordFraction, sampledSplit.seed);
+    return reader;
+  }
+}
@@ -0,0 +1,107 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.mapred.JobConf;
+import org.apache.hadoop.mapred.OutputCollector;
+
+import cascading.scheme.Scheme;
+import cascading.tap.Tap;
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntry;
+
+/**
+ * A source scheme that reads a random sample of the data of another scheme.
+ *
+ * The input format of the original scheme is replaced by a
+ * SampledInputFormat, which drops whole input splits before they are read, so
+ * the I/O is proportional to the sampled fraction. Optionally the records in
+ * the kept splits are sampled too, so that the fraction of the records read
+ * is the sampled fraction even if there are only a few splits.
+ *
+ * @author Gabor Szabo
+ */
+public class SampledScheme extends Scheme {
+  private static final long serialVersionUID = -2915479870348210432L;
+
+  private Scheme scheme;
+  private double fraction;
+  private long seed;
+  private boolean sampleRecords;
+
+  /**
+   * @param scheme
+   *          the scheme that reads the data
+   * @param fraction
+   *          the fraction of the data to read, between 0 and 1
+   * @param seed
+   *          the seed of the random choices, the same seed always gives the
+   *          same sample of the same data
+   * @param sampleRecords
+   *          if true, the records in the kept splits are sampled so that the
+   *          fraction of the records read is fraction, otherwise whole splits
+   *          are read and their fraction is fraction rounded up
+   */
+  public SampledScheme(Scheme scheme, double fraction, long seed, boolean sampleRecords) {
+    super(scheme.getSourceFields(), scheme.getSinkFields());
+    if (fraction <= 0.0 || fraction > 1.0)
+      throw new IllegalArgumentException("The sampled fraction must be in (0, 1]: " + fraction);
+    this.scheme = scheme;
+    this.fraction = fraction;
+    this.seed = seed;
+    this.sampleRecords = sampleRecords;
+  }
+
+  /**
+   * @return the scheme that reads the data
+   */
+  public Scheme getScheme() {
+    return scheme;
+  }
+
+  /**
+   * @return the fraction of the data read
+   */
+  public double getFraction() {
+    return fraction;
+  }
+
+  @Override
+  public void sourceInit(Tap tap, JobConf conf) throws IOException {
+    scheme.sourceInit(tap, conf);
+    conf.set(SampledInputFormat.INPUT_FORMAT, conf.getInputFormat().getClass().getName());
+    conf.set(SampledInputFormat.FRACTION, Double.toString(fraction));
+    conf.setLong(SampledInputFormat.SEED, seed);
+    conf.setBoolean(SampledInputFormat.SAMPLE_RECORDS, sampleRecords);
+    conf.setInputFormat(SampledInputFormat.class);
+  }
+
+  @Override
+  public Tuple source(Object key, Object value) {
+    return scheme.source(key, value);
+  }
+
+  @Override
+  public void sinkInit(Tap tap, JobConf conf) throws IOException {
+    throw new UnsupportedOperationException("A sampled scheme can only be used as a source");
+  }
+
+  @Override
+  public void sink(TupleEntry tupleEntry, OutputCollector outputCollector) throws IOException {
+    throw new UnsupportedOperationException("A sampled scheme can only be used as a source");
+  }
+}
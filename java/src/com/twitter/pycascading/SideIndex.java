@@ -0,0 +1,398 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataOutputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.ObjectOutputStream;
+import java.io.RandomAccessFile;
+import java.nio.ByteBuffer;
+import java.nio.MappedByteBuffer;
+import java.nio.channels.FileChannel;
+import java.util.ArrayList;
+import java.util.Comparator;
+import java.util.Iterator;
+import java.util.List;
+import java.util.NoSuchElementException;
+
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntryIterator;
+
+import com.twitter.pycascading.memory.TupleSorter;
+
+/**
+ * An immutable key-value index stored in a local file, sorted by the key,
+ * which is used for lookups from the UDFs in tables that are too large to be
+ * kept on the heap.
+ *
+ * The tuples are stored in blocks of about a page, and only the first key and
+ * the location of every block are kept in memory. The file is memory-mapped,
+ * so a lookup is a binary search in the block index, followed by a scan of
+ * one block, which usually touches one page of the file.
+ *
+ * The file consists of the blocks, the block index, and a trailer. Each block
+ * starts with the number of tuples in it, followed by the tuples. The block
+ * index has the number of blocks, and the offset, length, and first key of
+ * each block. The trailer has the offset of the block index, the position of
+ * the key in the tuples, and a magic number.
+ *
+ * @author Gabor Szabo
+ */
+public class SideIndex {
+  // The target size of the blocks in bytes
+  public static final int BLOCK_SIZE = 4096;
+
+  private static final int MAGIC = 0x50435349;
+  private static final int TRAILER_SIZE = 8 + 4 + 4;
+  // The file is mapped in segments of at most this size, since a
+  // MappedByteBuffer cannot be larger than 2 GB
+  private static final long MAX_SEGMENT_SIZE = 1L << 30;
+
+  // The type tags of the encoded tuple elements
+  private static final byte NULL = 0;
+  private static final byte STRING = 1;
+  private static final byte INTEGER = 2;
+  private static final byte LONG = 3;
+  private static final byte DOUBLE = 4;
+  private static final byte FLOAT = 5;
+  private static final byte BOOLEAN = 6;
+  private static final byte TUPLE = 7;
+  private static final byte SERIALIZED = 8;
+
+  private final int keyPosition;
+  private final Object[] firstKeys;
+  private final int[] blockSegments;
+  private final int[] blockOffsets;
+  private final int[] blockLengths;
+  private final MappedByteBuffer[] segments;
+
+  /**
+   * Sort the tuples by their keys and write them into an index file.
+   *
+   * @param tuples
+   *          the tuples to be indexed
+   * @param keyPosition
+   *          the position of the key field in the tuples
+   * @param path
+   *          the path of the index file to be written
+   * @param spillThreshold
+   *          the number of tuples sorted in memory before spilling to disk
+   * @return the number of tuples written
+   * @throws IOException
+   */
+  public static long build(TupleEntryIterator tuples, final int keyPosition, String path,
+          int spillThreshold) throws IOException {
+    TupleSorter sorter = new TupleSorter(new Comparator<Tuple>() {
+      @Override
+      public int compare(Tuple t1, Tuple t2) {
+        return TupleSorter.compareElements(t1.getObject(keyPosition), t2.getObject(keyPosition));
+      }
+    }, spillThreshold);
+    try {
+      while (tuples.hasNext())
+        sorter.add(new Tuple(tuples.next().getTuple()));
+    } finally {
+      tuples.close();
+    }
+
+    DataOutputStream out = new DataOutputStream(new BufferedOutputStream(new FileOutputStream(
+            path)));
+    long count = 0;
+    try {
+      long offset = 0;
+      List<Long> offsets = new ArrayList<Long>();
+      List<Integer> lengths = new ArrayList<Integer>();
+      List<Object> keys = new ArrayList<Object>();
+      ByteArrayOutputStream block = new ByteArrayOutputStream();
+      DataOutputStream blockOut = new DataOutputStream(block);
+      int blockCount = 0;
+      Iterator<Tuple> sorted = sorter.iterator();
+      while (sorted.hasNext()) {
+        Tuple tuple = sorted.next();
+        if (blockCount == 0)
+          keys.add(tuple.getObject(keyPosition));
+        writeElement(blockOut, tuple);
+        blockCount++;
+        count++;
+        if (block.size() >= BLOCK_SIZE || !sorted.hasNext()) {
+          blockOut.flush();
+          out.writeInt(blockCount);
+          block.writeTo(out);
+          offsets.add(offset);
+          lengths.add(4 + block.size());
+          offset += 4 + block.size();
+          block.reset();
+          blockCount = 0;
+        }
+      }
+      out.writeInt(offsets.size());
+      for (int i = 0; i < offsets.size(); i++) {
+        out.writeLong(offsets.get(i));
+        out.writeInt(lengths.get(i));
+        writeElement(out, keys.get(i));
+      }
+      out.writeLong(offset);
+      out.writeInt(keyPosition);
+      out.writeInt(MAGIC);
+    } finally {
+      out.close();
+      sorter.clear();
+    }
+    return count;
+  }
+
+  /**
+   * Open an index file for lookups. Only the block index is read into memory.
+   *
+   * @param path
+   *          the path to the index file
+   * @throws IOException
+   */
+  public SideIndex(String path) throws IOException {
+    RandomAccessFile file = new RandomAccessFile(path, "r");
+    try {
+      FileChannel channel = file.getChannel();
+      long size = channel.size();
+      ByteBuffer trailer = channel.map(FileChannel.MapMode.READ_ONLY, size - TRAILER_SIZE,
+              TRAILER_SIZE);
+      long indexOffset = trailer.getLong();
+      keyPosition = trailer.getInt();
+      if (trailer.getInt() != MAGIC)
+        throw new IOException("Not a side index file: " + path);
+
+      ByteBuffer index = channel.map(FileChannel.MapMode.READ_ONLY, indexOffset, size
+              - TRAILER_SIZE - indexOffset);
+      int numBlocks = index.getInt();
+      firstKeys = new Object[numBlocks];
+      blockSegments = new int[numBlocks];
+      blockOffsets = new int[numBlocks];
+      blockLengths = new int[numBlocks];
+      long[] offsets = new long[numBlocks];
+      for (int i = 0; i < numBlocks; i++) {
+        offsets[i] = index.getLong();
+        blockLengths[i] = index.getInt();
+        firstKeys[i] = readElement(index);
+      }
+
+      // Map the blocks in segments that don't split blocks
+      List<MappedByteBuffer> segmentList = new ArrayList<MappedByteBuffer>();
+      int i = 0;
+      while (i < numBlocks) {
+        long start = offsets[i];
+        int j = i;
+        while (j < numBlocks && (j == i || offsets[j] + blockLengths[j] - start <= MAX_SEGMENT_SIZE)) {
+          blockSegments[j] = segmentList.size();
+          blockOffsets[j] = (int) (offsets[j] - start);
+          j++;
+        }
+        long end = offsets[j - 1] + blockLengths[j - 1];
+        segmentList.add(channel.map(FileChannel.MapMode.READ_ONLY, start, end - start));
+        i = j;
+      }
+      segments = segmentList.toArray(new MappedByteBuffer[segmentList.size()]);
+    } finally {
+      // The mappings stay valid after the file is closed
+      file.close();
+    }
+  }
+
+  /**
+   * Return the first tuple with the given key, or null if there is none.
+   *
+   * @param key
+   *          the key to look up
+   */
+  public Tuple get(Object key) {
+    Iterator<Tuple> tuples = range(key, null);
+    if (tuples.hasNext()) {
+      Tuple tuple = tuples.next();
+      if (TupleSorter.compareElements(tuple.getObject(keyPosition), key) == 0)
+        return tuple;
+    }
+    return null;
+  }
+
+  /**
+   * Iterate over the tuples with keys in the range [lo, hi), in the order of
+   * their keys.
+   *
+   * @param lo
+   *          the lower bound of the keys, inclusive
+   * @param hi
+   *          the upper bound of the keys, exclusive, or null for no upper
+   *          bound
+   */
+  public Iterator<Tuple> range(final Object lo, final Object hi) {
+    return new Iterator<Tuple>() {
+      // The block after the one we are scanning
+      int nextBlock = findBlock(lo);
+      ByteBuffer block = null;
+      int remaining = 0;
+      Tuple next = advance(true);
+
+      private Tuple advance(boolean skipSmaller) {
+        while (true) {
+          if (remaining == 0) {
+            if (nextBlock >= firstKeys.length)
+              return null;
+            block = segments[blockSegments[nextBlock]].duplicate();
+            block.position(blockOffsets[nextBlock]);
+            block.limit(blockOffsets[nextBlock] + blockLengths[nextBlock]);
+            remaining = block.getInt();
+            nextBlock++;
+          }
+          Tuple tuple = (Tuple) readElement(block);
+          remaining--;
+          Object key = tuple.getObject(keyPosition);
+          if (skipSmaller && TupleSorter.compareElements(key, lo) < 0)
+            continue;
+          if (hi != null && TupleSorter.compareElements(key, hi) >= 0) {
+            nextBlock = firstKeys.length;
+            remaining = 0;
+            return null;
+          }
+          return tuple;
+        }
+      }
+
+      @Override
+      public boolean hasNext() {
+        return next != null;
+      }
+
+      @Override
+      public Tuple next() {
+        if (next == null)
+          throw new NoSuchElementException();
+        Tuple result = next;
+        next = advance(false);
+        return result;
+      }
+
+      @Override
+      public void remove() {
+        throw new UnsupportedOperationException();
+      }
+    };
+  }
+
+  /**
+   * Return the index of the first block that may contain the key. Since
+   * several blocks may start with the same key, this is the last block whose
+   * first key is smaller than the key, or the first block if there is none.
+   */
+  private int findBlock(Object key) {
+    int lo = 0, hi = firstKeys.length - 1, result = 0;
+    while (lo <= hi) {
+      int mid = (lo + hi) >>> 1;
+      if (TupleSorter.compareElements(firstKeys[mid], key) < 0) {
+        result = mid;
+        lo = mid + 1;
+      } else
+        hi = mid - 1;
+    }
+    return result;
+  }
+
+  private static void writeElement(DataOutputStream out, Object element) throws IOException {
+    if (element == null)
+      out.writeByte(NULL);
+    else if (element instanceof String) {
+      byte[] bytes = ((String) element).getBytes("UTF-8");
+      out.writeByte(STRING);
+      out.writeInt(bytes.length);
+      out.write(bytes);
+    } else if (element instanceof Integer) {
+      out.writeByte(INTEGER);
+      out.writeInt((Integer) element);
+    } else if (element instanceof Long) {
+      out.writeByte(LONG);
+      out.writeLong((Long) element);
+    } else if (element instanceof Double) {
+      out.writeByte(DOUBLE);
+      out.writeDouble((Double) element);
+    } else if (element instanceof Float) {
+      out.writeByte(FLOAT);
+      out.writeFloat((Float) element);
+    } else if (element instanceof Boolean) {
+      out.writeByte(BOOLEAN);
+      out.writeBoolean((Boolean) element);
+    } else if (element instanceof Tuple) {
+      Tuple tuple = (Tuple) element;
+      out.writeByte(TUPLE);
+      out.writeInt(tuple.size());
+      for (int i = 0; i < tuple.size(); i++)
+        writeElement(out, tuple.getObject(i));
+    } else {
+      ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+      ObjectOutputStream objectOut = new ObjectOutputStream(bytes);
+      objectOut.writeObject(element);
+      objectOut.close();
+      out.writeByte(SERIALIZED);
+      out.writeInt(bytes.size());
+      bytes.writeTo(out);
+    }
+  }
+
+  private static Object readElement(ByteBuffer in) {
+    byte type = in.get();
+    switch (type) {
+    case NULL:
+      return null;
+    case STRING: {
+      byte[] bytes = new byte[in.getInt()];
+      in.get(bytes);
+      try {
+        return new String(bytes, "UTF-8");
+      } catch (IOException e) {
+        throw new RuntimeException(e);
+      }
+    }
+    case INTEGER:
+      return in.getInt();
+    case LONG:
+      return in.getLong();
+    case DOUBLE:
+      return in.getDouble();
+    case FLOAT:
+      return in.getFloat();
+    case BOOLEAN:
+      return in.get() != 0;
+    case TUPLE: {
+      Object[] elements = new Object[in.getInt()];
+      for (int i = 0; i < elements.length; i++)
+        elements[i] = readElement(in);
+      return new Tuple(elements);
+    }
+    case SERIALIZED: {
+      byte[] bytes = new byte[in.getInt()];
+      in.get(bytes);
+      try {
+        ObjectInputStream objectIn = new ObjectInputStream(new ByteArrayInputStream(bytes));
+        return objectIn.readObject();
+      } catch (Exception e) {
+        throw new RuntimeException(e);
+      }
+    }
+    default:
+      throw new RuntimeException("Unknown element type in side index: " + type);
+    }
+  }
+}
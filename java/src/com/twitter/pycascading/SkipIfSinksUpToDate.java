@@ -0,0 +1,52 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+
+import org.apache.hadoop.mapred.JobConf;
+
+import cascading.flow.Flow;
+import cascading.flow.FlowSkipStrategy;
+import cascading.tap.Tap;
+
+/**
+ * Skips a Flow in a Cascade if all of its sinks exist and are newer than all
+ * of its sources. PyCascading sinks replace their outputs, so the default
+ * Cascading strategy would always consider them stale.
+ *
+ * @author Gabor Szabo
+ */
+public class SkipIfSinksUpToDate implements FlowSkipStrategy {
+
+  @Override
+  public boolean skipFlow(Flow flow) throws IOException {
+    JobConf conf = flow.getJobConf();
+    long oldestSink = Long.MAX_VALUE;
+    for (Object sink : flow.getSinks().values()) {
+      Tap tap = (Tap) sink;
+      if (!tap.pathExists(conf))
+        return false;
+      oldestSink = Math.min(oldestSink, tap.getPathModified(conf));
+    }
+    for (Object source : flow.getSources().values()) {
+      Tap tap = (Tap) source;
+      // If a source does not exist, we let the flow fail with a proper error
+      if (!tap.pathExists(conf) || tap.getPathModified(conf) > oldestSink)
+        return false;
+    }
+    return true;
+  }
+}
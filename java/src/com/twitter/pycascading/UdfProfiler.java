@@ -0,0 +1,256 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.io.IOException;
+import java.io.OutputStreamWriter;
+import java.io.PrintWriter;
+import java.util.HashMap;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Map;
+import java.util.Random;
+import java.util.Set;
+import java.util.concurrent.CopyOnWriteArrayList;
+
+import org.apache.hadoop.fs.FileSystem;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.mapred.JobConf;
+
+/**
+ * A sampling profiler for the Python UDFs running in a task.
+ *
+ * If the pycascading.profile parameter is set to a fraction between 0 and 1,
+ * that fraction of the tasks are profiled. A background thread takes the stack
+ * traces of the threads running the operations periodically, and counts the
+ * Python source lines found in them. Jython compiles Python functions to Java
+ * methods whose stack trace elements carry the Python file names and line
+ * numbers, so the interpreter doesn't need to be hooked. The Python frame
+ * called by the innermost operation wrapper on the stack identifies the UDF.
+ *
+ * The sampling interval is increased if taking the samples takes more than
+ * MAX_OVERHEAD of the time, so the profiler can be left on for production
+ * jobs. The profile of a task is written to a file in the folder given in
+ * pycascading.profile.dir when its last operation is cleaned up.
+ *
+ * The files are tab-separated, with a line for each UDF and source line: the
+ * UDF, the file, the line number, the function, the number of samples where
+ * the line was executing, and the number of samples where the line was on the
+ * stack. The lines starting with "#" contain the total number of samples.
+ *
+ * @author Gabor Szabo
+ */
+public class UdfProfiler implements Runnable {
+  // The jobconf parameter for the fraction of tasks that are profiled
+  public static final String PROFILE = "pycascading.profile";
+
+  // The jobconf parameter for the folder where the profiles are written
+  public static final String PROFILE_DIR = "pycascading.profile.dir";
+
+  // The jobconf parameter for the sampling interval in milliseconds
+  public static final String INTERVAL = "pycascading.profile.interval_ms";
+
+  // The file extension of the profiles
+  public static final String EXTENSION = ".profile";
+
+  private static final int DEFAULT_INTERVAL = 20;
+
+  // The fraction of time the sampling may take at most
+  private static final double MAX_OVERHEAD = 0.02;
+
+  // The maximum number of different lines counted, to bound the memory used
+  private static final int MAX_ENTRIES = 10000;
+
+  private static final String WRAPPER_PREFIX = "com.twitter.pycascading.Cascading";
+
+  private static final Random random = new Random();
+
+  // The profiler of the current task, if it is profiled
+  private static UdfProfiler profiler = null;
+
+  // The number of operations prepared in the current task
+  private static int operations = 0;
+
+  private final JobConf jobConf;
+  private final long interval;
+  private final List<Thread> threads = new CopyOnWriteArrayList<Thread>();
+  private final Thread samplerThread;
+  private volatile boolean stopped = false;
+
+  private long samples = 0;
+  private long udfSamples = 0;
+  // The numbers of self and total samples for the UDF and line keys
+  private final Map<String, long[]> counts = new HashMap<String, long[]>();
+
+  private UdfProfiler(JobConf jobConf) {
+    this.jobConf = jobConf;
+    interval = jobConf.getInt(INTERVAL, DEFAULT_INTERVAL);
+    samplerThread = new Thread(this, "PyCascading UDF profiler");
+    samplerThread.setDaemon(true);
+  }
+
+  /**
+   * Register an operation that is prepared in the current thread. The first
+   * operation of the task decides whether the task is profiled.
+   *
+   * @param jobConf
+   *          the job's configuration
+   */
+  public static synchronized void operationPrepared(JobConf jobConf) {
+    float fraction = jobConf.getFloat(PROFILE, 0);
+    if (fraction <= 0 || jobConf.get(PROFILE_DIR) == null)
+      return;
+    if (operations == 0 && random.nextDouble() < fraction) {
+      profiler = new UdfProfiler(jobConf);
+      profiler.samplerThread.start();
+    }
+    operations++;
+    if (profiler != null && !profiler.threads.contains(Thread.currentThread()))
+      profiler.threads.add(Thread.currentThread());
+  }
+
+  /**
+   * Unregister an operation that was cleaned up. When the last operation of
+   * the task is cleaned up, the profile is written.
+   */
+  public static synchronized void operationCleanedUp() {
+    if (operations == 0)
+      return;
+    operations--;
+    if (operations == 0 && profiler != null) {
+      profiler.stop();
+      profiler.write();
+      profiler = null;
+    }
+  }
+
+  @Override
+  public void run() {
+    long sleep = interval;
+    while (!stopped) {
+      try {
+        Thread.sleep(sleep);
+      } catch (InterruptedException e) {
+        break;
+      }
+      long start = System.nanoTime();
+      for (Thread thread : threads) {
+        StackTraceElement[] stack = thread.getStackTrace();
+        if (stack.length > 0)
+          addSample(stack);
+      }
+      // Back off if the sampling is too expensive, for instance because the
+      // stacks are very deep
+      long cost = (System.nanoTime() - start) / 1000000;
+      sleep = Math.max(interval, (long) (cost / MAX_OVERHEAD));
+    }
+  }
+
+  private void stop() {
+    stopped = true;
+    samplerThread.interrupt();
+    try {
+      samplerThread.join();
+    } catch (InterruptedException e) {
+      Thread.currentThread().interrupt();
+    }
+  }
+
+  private static boolean isPython(StackTraceElement frame) {
+    String file = frame.getFileName();
+    return file != null && file.endsWith(".py");
+  }
+
+  private static String function(StackTraceElement frame) {
+    // Jython names the Java methods of Python functions <name>$<index>
+    String method = frame.getMethodName();
+    int i = method.lastIndexOf('$');
+    return (i > 0 ? method.substring(0, i) : method);
+  }
+
+  private static String location(StackTraceElement frame) {
+    return frame.getFileName() + "\t" + frame.getLineNumber() + "\t" + function(frame);
+  }
+
+  private void addSample(StackTraceElement[] stack) {
+    samples++;
+    // The innermost Python frame is the line being executed, and the UDF is
+    // the outermost Python frame above the innermost wrapper
+    int leaf = -1;
+    int udf = -1;
+    for (int i = 0; i < stack.length && udf < 0; i++) {
+      if (isPython(stack[i])) {
+        if (leaf < 0)
+          leaf = i;
+      } else if (leaf >= 0 && stack[i].getClassName().startsWith(WRAPPER_PREFIX)) {
+        udf = i - 1;
+        while (!isPython(stack[udf]))
+          udf--;
+      }
+    }
+    if (udf < 0)
+      return;
+    udfSamples++;
+    String udfName = function(stack[udf]) + " (" + stack[udf].getFileName() + ")";
+    // Recursive functions would have the same lines on the stack more than
+    // once
+    Set<String> seen = new HashSet<String>();
+    for (int i = leaf; i <= udf; i++) {
+      if (!isPython(stack[i]))
+        continue;
+      String key = udfName + "\t" + location(stack[i]);
+      if (!seen.add(key))
+        continue;
+      long[] count = counts.get(key);
+      if (count == null) {
+        if (counts.size() >= MAX_ENTRIES)
+          key = udfName + "\t(other)\t0\t(other)";
+        count = counts.get(key);
+        if (count == null) {
+          count = new long[2];
+          counts.put(key, count);
+        }
+      }
+      if (i == leaf)
+        count[0]++;
+      count[1]++;
+    }
+  }
+
+  private void write() {
+    String taskId = jobConf.get("mapred.task.id");
+    if (taskId == null)
+      taskId = "local";
+    Path path = new Path(jobConf.get(PROFILE_DIR), taskId + "-"
+            + Long.toHexString(random.nextLong() & Long.MAX_VALUE) + EXTENSION);
+    try {
+      FileSystem fs = path.getFileSystem(jobConf);
+      PrintWriter writer = new PrintWriter(new OutputStreamWriter(fs.create(path), "UTF-8"));
+      try {
+        writer.println("#samples\t" + samples);
+        writer.println("#udf_samples\t" + udfSamples);
+        for (Map.Entry<String, long[]> entry : counts.entrySet()) {
+          writer.println(entry.getKey() + "\t" + entry.getValue()[0] + "\t"
+                  + entry.getValue()[1]);
+        }
+      } finally {
+        writer.close();
+      }
+    } catch (IOException e) {
+      // A failure to write the profile should not fail the task
+      e.printStackTrace();
+    }
+  }
+}
@@ -0,0 +1,208 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading;
+
+import java.util.Arrays;
+import java.util.Iterator;
+
+import org.apache.hadoop.mapred.JobConf;
+
+import cascading.flow.FlowProcess;
+
+/**
+ * Statistics about the calls to a Python UDF in a task, which are collected if
+ * the pycascading.instrument parameter is set. The statistics are aggregated
+ * locally, and are added to the Hadoop counters of the job periodically and
+ * when the operation is cleaned up.
+ *
+ * The counters are in the COUNTER_GROUP group, and are named "<pipe name> |
+ * <statistic>", where the pipe name contains the line number in the script
+ * where the operation was added to the pipeline. The times are in
+ * microseconds.
+ *
+ * Every UDF adds six counters, and Hadoop fails the jobs that have more than
+ * 120 counters by default. So at most pycascading.instrument.max_udfs UDFs
+ * of a flow are instrumented (12 by default), whose pipes are listed in
+ * pycascading.instrument.pipes by the launcher.
+ *
+ * @author Gabor Szabo
+ */
+public class UdfStats {
+  // The jobconf parameter that turns on the instrumentation
+  public static final String INSTRUMENT = "pycascading.instrument";
+
+  // The jobconf parameter for the maximum number of instrumented UDFs
+  public static final String MAX_UDFS = "pycascading.instrument.max_udfs";
+
+  public static final int DEFAULT_MAX_UDFS = 12;
+
+  // The jobconf parameter with the names of the pipes of the instrumented
+  // UDFs, separated by newlines. If it's not set, all UDFs are instrumented.
+  public static final String PIPES = "pycascading.instrument.pipes";
+
+  // The group of the counters
+  public static final String COUNTER_GROUP = "PyCascading UDFs";
+
+  // The separator between the pipe name and the statistic in counter names
+  public static final String SEPARATOR = " | ";
+
+  // The statistics are added to the counters at least this often
+  private static final long FLUSH_INTERVAL = 10 * 1000000000L;
+
+  private final String name;
+
+  private long calls = 0;
+  private long inputTuples = 0;
+  private long outputTuples = 0;
+  private long functionNanos = 0;
+  private long inputConversionNanos = 0;
+  private long outputConversionNanos = 0;
+
+  private long callStart;
+  // The time spent in converting the output tuples and in the downstream
+  // operations during the current call
+  private long excludedFromCall;
+  private long lastFlush = System.nanoTime();
+
+  /**
+   * @param name
+   *          the name of the pipe of the operation
+   */
+  public UdfStats(String name) {
+    this.name = (name == null ? "unnamed" : name);
+  }
+
+  /**
+   * @param jobConf
+   *          the job's configuration
+   * @param name
+   *          the name of the pipe of the operation
+   * @return true if the UDF should be instrumented
+   */
+  public static boolean isInstrumented(JobConf jobConf, String name) {
+    if (!jobConf.getBoolean(INSTRUMENT, false))
+      return false;
+    String pipes = jobConf.get(PIPES);
+    return pipes == null || Arrays.asList(pipes.split("\n")).contains(name);
+  }
+
+  /**
+   * Record the start of a call to the Python function. The time spent in
+   * converting the output tuples and in the downstream operations is
+   * subtracted from the time of the call.
+   */
+  public void callStarted() {
+    calls++;
+    excludedFromCall = 0;
+    callStart = System.nanoTime();
+  }
+
+  /**
+   * Record the end of a call to the Python function, including the iteration
+   * over the generator it returned.
+   *
+   * @param flowProcess
+   *          the flow process to flush the counters to if it's time
+   */
+  public void callFinished(FlowProcess flowProcess) {
+    long now = System.nanoTime();
+    functionNanos += now - callStart - excludedFromCall;
+    if (now - lastFlush > FLUSH_INTERVAL)
+      flush(flowProcess);
+  }
+
+  public void addInputTuples(int n) {
+    inputTuples += n;
+  }
+
+  public void addOutputTuples(int n) {
+    outputTuples += n;
+  }
+
+  /**
+   * Wrap an iterator over the input tuples so that they are counted as they
+   * are read by the Python function.
+   *
+   * @param tuples
+   *          the iterator over the input tuples
+   * @return the counting iterator
+   */
+  public <T> Iterator<T> countInputs(final Iterator<T> tuples) {
+    return new Iterator<T>() {
+      @Override
+      public boolean hasNext() {
+        return tuples.hasNext();
+      }
+
+      @Override
+      public T next() {
+        inputTuples++;
+        return tuples.next();
+      }
+
+      @Override
+      public void remove() {
+        tuples.remove();
+      }
+    };
+  }
+
+  public void addInputConversion(long nanos) {
+    inputConversionNanos += nanos;
+  }
+
+  public void addOutputConversion(long nanos) {
+    outputConversionNanos += nanos;
+    excludedFromCall += nanos;
+  }
+
+  /**
+   * Add the time spent in the downstream operations that an output tuple was
+   * passed on to. This time isn't counted for the UDF at all.
+   */
+  public void addDownstream(long nanos) {
+    excludedFromCall += nanos;
+  }
+
+  /**
+   * Add the statistics collected since the last flush to the counters.
+   *
+   * @param flowProcess
+   *          the flow process of the operation
+   */
+  public void flush(FlowProcess flowProcess) {
+    increment(flowProcess, "calls", calls);
+    increment(flowProcess, "input tuples", inputTuples);
+    increment(flowProcess, "output tuples", outputTuples);
+    // The remainders are kept for the next flush
+    increment(flowProcess, "function (us)", functionNanos / 1000);
+    increment(flowProcess, "input conversion (us)", inputConversionNanos / 1000);
+    increment(flowProcess, "output conversion (us)", outputConversionNanos / 1000);
+    calls = inputTuples = outputTuples = 0;
+    functionNanos %= 1000;
+    inputConversionNanos %= 1000;
+    outputConversionNanos %= 1000;
+    lastFlush = System.nanoTime();
+  }
+
+  private void increment(FlowProcess flowProcess, String statistic, long value) {
+    // The counters can only be incremented by ints
+    while (value > 0) {
+      int n = (int) Math.min(value, Integer.MAX_VALUE);
+      flowProcess.increment(COUNTER_GROUP, name + SEPARATOR + statistic, n);
+      value -= n;
+    }
+  }
+}
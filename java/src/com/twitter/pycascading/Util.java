@@ -14,17 +14,27 @@
  */
 package com.twitter.pycascading;
 
+import java.io.File;
 import java.io.IOException;
+import java.lang.reflect.Field;
+import java.lang.reflect.Method;
 import java.net.URISyntaxException;
+import java.util.Collection;
 import java.util.Map;
 import java.util.Properties;
 
 import org.apache.hadoop.conf.Configuration;
+import org.apache.hadoop.fs.Path;
+import org.apache.hadoop.mapred.RunningJob;
 
 import cascading.flow.Flow;
 import cascading.flow.FlowConnector;
 import cascading.flow.FlowListener;
+import cascading.flow.FlowStep;
+import cascading.operation.Operation;
+import cascading.pipe.Operator;
 import cascading.pipe.Pipe;
+import cascading.stats.StepStats;
 import cascading.tap.Tap;
 
 /**
@@ -78,8 +88,121 @@ public class Util {
     System.setProperty("pycascading.root", root);
   }
 
+  /**
+   * Get the Hadoop job for a step of a running flow. The accessor is not
+   * public in all versions of Cascading, so we call it through reflection.
+   * 
+   * @param stepStats
+   *          the statistics of the flow step
+   * @return the Hadoop job running the step, or null if it's not available
+   *         (the step hasn't started yet, or this is not a Hadoop step)
+   */
+  public static RunningJob getRunningJob(StepStats stepStats) {
+    for (Class<?> c = stepStats.getClass(); c != null; c = c.getSuperclass()) {
+      try {
+        Method method = c.getDeclaredMethod("getRunningJob");
+        method.setAccessible(true);
+        return (RunningJob) method.invoke(stepStats);
+      } catch (NoSuchMethodException e) {
+        // Try the superclass
+      } catch (Exception e) {
+        return null;
+      }
+    }
+    return null;
+  }
+
+  /**
+   * Get the elements of the graph of a flow step, which are the pipes and taps
+   * that run in its MapReduce job. The graph is not public in all versions of
+   * Cascading, so we get it through reflection.
+   * 
+   * @param step
+   *          the flow step
+   * @return the pipes and taps of the step, or null if they are not available
+   */
+  public static Collection<?> getStepElements(FlowStep step) {
+    for (Class<?> c = step.getClass(); c != null; c = c.getSuperclass()) {
+      try {
+        Field field = c.getDeclaredField("graph");
+        field.setAccessible(true);
+        Object graph = field.get(step);
+        return (Collection<?>) graph.getClass().getMethod("vertexSet").invoke(graph);
+      } catch (NoSuchFieldException e) {
+        // Try the superclass
+      } catch (Exception e) {
+        return null;
+      }
+    }
+    return null;
+  }
+
+  /**
+   * Replace the operation of an Each or Every pipe. The operation is final in
+   * Operator, so we set it through reflection. This is used to wrap the native
+   * aggregators of a flow only if it is run with the skew report.
+   * 
+   * @param operator
+   *          the Each or Every pipe
+   * @param operation
+   *          the new operation of the pipe
+   */
+  public static void setOperation(Operator operator, Operation operation) {
+    try {
+      Field field = Operator.class.getDeclaredField("operation");
+      field.setAccessible(true);
+      field.set(operator, operation);
+    } catch (Exception e) {
+      throw new RuntimeException("Cannot set the operation of " + operator, e);
+    }
+  }
+
+  /**
+   * Run a PyCascading flow and wait for it to complete.
+   * 
+   * @see #connect(int, Map, Map, Map, Pipe...)
+   */
   public static void run(int numReducers, Map<String, Object> config, Map<String, Tap> sources,
           Map<String, Tap> sinks, Pipe... tails) throws IOException, URISyntaxException {
+    connect(numReducers, config, sources, sinks, tails).complete();
+  }
+
+  /**
+   * Copy the configuration parameters that have a string, number, or boolean
+   * value to the properties.
+   * 
+   * @param properties
+   *          the properties of the flow
+   * @param config
+   *          the PyCascading configuration parameters
+   */
+  public static void setSimpleParameters(Properties properties, Map<String, Object> config) {
+    for (Map.Entry<String, Object> entry : config.entrySet()) {
+      Object value = entry.getValue();
+      if (value instanceof String || value instanceof Number || value instanceof Boolean)
+        properties.setProperty(entry.getKey(), value.toString());
+    }
+  }
+
+  /**
+   * Set up the MR environment and connect the PyCascading pipeline into a
+   * Cascading Flow, without starting it.
+   * 
+   * @param numReducers
+   *          the default number of reducers
+   * @param config
+   *          the PyCascading configuration parameters
+   * @param sources
+   *          the source taps mapped from the names of the head pipes
+   * @param sinks
+   *          the sink taps mapped from the names of the tail pipes
+   * @param tails
+   *          the tails of the pipeline
+   * @return the connected Cascading Flow
+   */
+  public static Flow connect(int numReducers, Map<String, Object> config,
+          Map<String, Tap> sources, Map<String, Tap> sinks, Pipe... tails) throws IOException,
+          URISyntaxException {
     // String strClassPath = System.getProperty("java.class.path");
     // System.out.println("Classpath is " + strClassPath);
 
@@ -102,6 +225,10 @@ public class Util {
     properties.put("mapred.jobtracker.completeuserjobs.maximum", 50000);
     properties.put("mapred.input.dir.recursive", "true");
 
+    // Pass on the simple configuration parameters, such as
+    // pycascading.load_main_file, to the jobconf
+    setSimpleParameters(properties, config);
+
     // Set the running mode in the jobconf so that the mappers/reducers can
     // easily check this.
     String runningMode = (String) config.get("pycascading.running_mode");
@@ -109,22 +236,39 @@ public class Util {
     properties.setProperty("pycascading.main_file", (String) config.get("pycascading.main_file"));
 
     Configuration conf = new Configuration();
-    TemporaryHdfs tempDir = null;
     if ("hadoop".equals(runningMode)) {
-      tempDir = new TemporaryHdfs();
       // We put the files to be distributed into the distributed cache
       // The pycascading.distributed_cache.archives variable was set by
       // bootstrap.py, based on the command line parameters where we specified
       // the PyCascading & source archives
       Object archives = config.get("pycascading.distributed_cache.archives");
       if (archives != null) {
-        tempDir = new TemporaryHdfs();
-        String tempDirLocation = tempDir.createTmpFolder(conf);
+        // The archives are kept on HDFS under their content hashes, so
+        // unchanged archives are neither uploaded nor localized again
+        ArchiveCache archiveCache = new ArchiveCache(conf);
         String dests = null;
         for (String archive : (Iterable<String>) archives) {
-          String dest = tempDir.copyFromLocalFileToHDFS(archive);
+          String dest = archiveCache.add(archive);
           dests = (dests == null ? dest : dests + "," + dest);
         }
+        // Ship Jython's package index built by the launcher, so that the
+        // workers don't need to scan all the jars on the classpath again. It
+        // must come after the PyCascading and source archives.
+        String packageCache = PackageCache.createArchive();
+        if (packageCache != null) {
+          String dest = archiveCache.add(packageCache);
+          dests = (dests == null ? dest : dests + "," + dest);
+          properties.setProperty(PackageCache.ARCHIVE_PARAMETER, new Path(dest).getName());
+          new File(packageCache).delete();
+        }
+        // The maximum age may also come as a string from a config file or -D
+        Object maxAge = config.get(ArchiveCache.MAX_AGE_PARAMETER);
+        int maxAgeDays = ArchiveCache.DEFAULT_MAX_AGE_DAYS;
+        if (maxAge instanceof Number)
+          maxAgeDays = ((Number) maxAge).intValue();
+        else if (maxAge != null)
+          maxAgeDays = Integer.parseInt(maxAge.toString().trim());
+        archiveCache.collectGarbage(maxAgeDays);
         // Set the distributed cache to the files we just copied to HDFS
         //
         // This is an ugly hack, we should use DistributedCache.
@@ -140,43 +284,49 @@ public class Util {
         // TODO: see the one just above
         properties.setProperty("mapred.create.symlink", "yes");
       }
+      // The files of the broadcast variables and side indexes are symlinked
+      // into the working folders of the tasks with their names
+      Object files = config.get("pycascading.distributed_cache.files");
+      if (files != null && ((Collection<String>) files).size() > 0) {
+        ArchiveCache archiveCache = new ArchiveCache(conf);
+        String dests = null;
+        for (String file : (Iterable<String>) files) {
+          String dest = archiveCache.add(file);
+          dest = dest + "#" + new Path(dest).getName();
+          dests = (dests == null ? dest : dests + "," + dest);
+        }
+        properties.setProperty("mapred.cache.files", dests);
+        properties.setProperty("mapred.create.symlink", "yes");
+      }
     }
 
     FlowConnector.setApplicationJarClass(properties, Main.class);
     FlowConnector flowConnector = new FlowConnector(properties);
     Flow flow = flowConnector.connect(sources, sinks, tails);
-    if ("hadoop".equals(runningMode)) {
-      try {
-        flow.addListener(tempDir);
-      } catch (Exception e) {
-        e.printStackTrace();
-      }
-    } else {
-      try {
-        flow.addListener(new FlowListener() {
-
-          @Override
-          public void onStarting(Flow flow) {
-          }
-
-          @Override
-          public void onStopping(Flow flow) {
-          }
-
-          @Override
-          public void onCompleted(Flow flow) {
-          }
-
-          @Override
-          public boolean onThrowable(Flow flow, Throwable throwable) {
-            throwable.printStackTrace();
-            return false;
-          }
-        });
-      } catch (Exception e) {
-        e.printStackTrace();
-      }
+    try {
+      flow.addListener(new FlowListener() {
+
+        @Override
+        public void onStarting(Flow flow) {
+        }
+
+        @Override
+        public void onStopping(Flow flow) {
+        }
+
+        @Override
+        public void onCompleted(Flow flow) {
+        }
+
+        @Override
+        public boolean onThrowable(Flow flow, Throwable throwable) {
+          throwable.printStackTrace();
+          return false;
+        }
+      });
+    } catch (Exception e) {
+      e.printStackTrace();
     }
-    flow.complete();
+    return flow;
   }
 }
@@ -0,0 +1,1032 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.memory;
+
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.ObjectOutputStream;
+import java.lang.reflect.Field;
+import java.util.ArrayList;
+import java.util.Comparator;
+import java.util.IdentityHashMap;
+import java.util.Iterator;
+import java.util.LinkedList;
+import java.util.List;
+import java.util.Map;
+import java.util.NoSuchElementException;
+import java.util.Properties;
+import java.util.concurrent.Callable;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+
+import org.apache.hadoop.mapred.JobConf;
+
+import cascading.operation.Aggregator;
+import cascading.operation.Buffer;
+import cascading.operation.ConcreteCall;
+import cascading.operation.Filter;
+import cascading.operation.Function;
+import cascading.operation.GroupAssertion;
+import cascading.operation.Operation;
+import cascading.operation.ValueAssertion;
+import cascading.pipe.CoGroup;
+import cascading.pipe.Each;
+import cascading.pipe.Every;
+import cascading.pipe.Group;
+import cascading.pipe.Pipe;
+import cascading.pipe.SubAssembly;
+import cascading.pipe.cogroup.InnerJoin;
+import cascading.pipe.cogroup.Joiner;
+import cascading.pipe.cogroup.LeftJoin;
+import cascading.pipe.cogroup.OuterJoin;
+import cascading.pipe.cogroup.RightJoin;
+import cascading.tap.Tap;
+import cascading.tuple.Fields;
+import cascading.tuple.Tuple;
+import cascading.tuple.TupleEntry;
+import cascading.tuple.TupleEntryCollector;
+import cascading.tuple.TupleEntryIterator;
+
+import com.twitter.pycascading.Util;
+
+/**
+ * Executes a PyCascading pipeline directly in the JVM, without planning it
+ * into MapReduce jobs. This is meant for small data sets and tests, where the
+ * overhead of the Hadoop local job runner dominates the running time.
+ *
+ * The pipe assembly is evaluated from the tails towards the heads, and the
+ * output of every pipe is materialized in a SpillableTupleList, so that
+ * branches can read it several times. Groupings are done with an external
+ * sort. Each and Every operations are run by a thread pool on chunks of the
+ * tuple stream, each thread using its own copy of the operation. The outputs
+ * of the chunks are concatenated in order, so the results are deterministic.
+ *
+ * Traps, assertions, and custom Joiners other than the inner, outer, left, and
+ * right joins are not supported.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings({ "rawtypes", "unchecked" })
+public class MemoryFlow {
+  // Configuration parameter for the number of threads to use
+  public static final String THREADS = "pycascading.memory.threads";
+
+  // Configuration parameter for the maximum number of tuples kept in memory
+  // by any one collection before it is spilled to disk
+  public static final String SPILL_THRESHOLD = "pycascading.memory.spill_threshold";
+
+  private static final int DEFAULT_SPILL_THRESHOLD = 100000;
+
+  // The number of tuples processed by a thread at once
+  private static final int CHUNK_SIZE = 10000;
+
+  // The Python operations set up the shared interpreter in prepare(), which
+  // must not be done concurrently
+  private static final Object PREPARE_LOCK = new Object();
+
+  private final Map<String, Tap> sources;
+  private final Map<String, Tap> sinks;
+  private final Pipe[] tails;
+  private final JobConf jobConf;
+  private final MemoryFlowProcess flowProcess;
+  private final int numThreads;
+  private final int spillThreshold;
+
+  private final Map<Pipe, Stream> streams = new IdentityHashMap<Pipe, Stream>();
+  private final Map<Pipe, Grouping> groupings = new IdentityHashMap<Pipe, Grouping>();
+  private ExecutorService executor;
+
+  /**
+   * A materialized stream of tuples.
+   */
+  private static class Stream {
+    final Fields fields;
+    final SpillableTupleList tuples;
+
+    Stream(Fields fields, SpillableTupleList tuples) {
+      this.fields = fields;
+      this.tuples = tuples;
+    }
+  }
+
+  /**
+   * The output of a GroupBy or CoGroup. Each record is a Tuple of the grouping
+   * Tuple and the value Tuple, sorted by the groupings.
+   */
+  private static class Grouping {
+    final Fields groupFields;
+    final Fields valueFields;
+    final SpillableTupleList records;
+
+    Grouping(Fields groupFields, Fields valueFields, SpillableTupleList records) {
+      this.groupFields = groupFields;
+      this.valueFields = valueFields;
+      this.records = records;
+    }
+  }
+
+  /**
+   * A copy of an operation used by one thread at a time, with its call
+   * context.
+   */
+  private static class Slot {
+    final Operation operation;
+    final ConcreteCall call = new ConcreteCall();
+
+    Slot(Operation operation) {
+      this.operation = operation;
+    }
+  }
+
+  /**
+   * The copies of an operation for the threads. The copies are created and
+   * prepared lazily, so that no more copies are made than there are threads
+   * working on the operation.
+   */
+  private class OperationPool {
+    private final byte[] serialized;
+    private final List<Slot> slots = new ArrayList<Slot>();
+    private final LinkedList<Slot> free = new LinkedList<Slot>();
+
+    OperationPool(Operation operation) {
+      try {
+        ByteArrayOutputStream baos = new ByteArrayOutputStream();
+        ObjectOutputStream out = new ObjectOutputStream(baos);
+        out.writeObject(operation);
+        out.close();
+        serialized = baos.toByteArray();
+      } catch (IOException e) {
+        throw new RuntimeException("Could not serialize operation " + operation, e);
+      }
+    }
+
+    Slot take() {
+      synchronized (PREPARE_LOCK) {
+        if (!free.isEmpty())
+          return free.removeFirst();
+        Operation operation;
+        try {
+          ObjectInputStream in = new ObjectInputStream(new ByteArrayInputStream(serialized));
+          operation = (Operation) in.readObject();
+          in.close();
+        } catch (Exception e) {
+          throw new RuntimeException("Could not deserialize operation", e);
+        }
+        Slot slot = new Slot(operation);
+        operation.prepare(flowProcess, slot.call);
+        slots.add(slot);
+        return slot;
+      }
+    }
+
+    void release(Slot slot) {
+      synchronized (PREPARE_LOCK) {
+        free.add(slot);
+      }
+    }
+
+    void cleanup() {
+      synchronized (PREPARE_LOCK) {
+        for (Slot slot : slots)
+          slot.operation.cleanup(flowProcess, slot.call);
+        slots.clear();
+        free.clear();
+      }
+    }
+  }
+
+  /**
+   * The processing of a chunk of tuples by a thread.
+   */
+  private interface Task {
+    void process(Slot[] slots, SpillableTupleList chunk, SpillableTupleList output)
+            throws Exception;
+  }
+
+  /**
+   * Collects the output tuples of an operation into a list.
+   */
+  private static class ListCollector extends TupleEntryCollector {
+    final List<Tuple> tuples = new ArrayList<Tuple>();
+
+    @Override
+    public void add(TupleEntry tupleEntry) {
+      collect(tupleEntry.getTuple());
+    }
+
+    @Override
+    public void add(Tuple tuple) {
+      collect(tuple);
+    }
+
+    protected void collect(Tuple tuple) {
+      // Operations may reuse their output tuples
+      tuples.add(new Tuple(tuple));
+    }
+  }
+
+  /**
+   * Builds the outgoing tuples of an operation from its incoming tuples and
+   * results, according to the output selector.
+   */
+  private static class Outgoing {
+    private final Fields selector;
+    private final int[] argumentPositions;
+    private final int[] selected;
+    final Fields fields;
+
+    Outgoing(Fields selector, Fields incoming, int[] argumentPositions, Fields declared) {
+      this.selector = selector;
+      this.argumentPositions = argumentPositions;
+      if (selector.isResults()) {
+        fields = declared;
+        selected = null;
+      } else if (selector.isAll()) {
+        fields = append(incoming, declared);
+        selected = null;
+      } else if (selector.isSwap()) {
+        if (incoming.isDefined())
+          fields = append(select(incoming, remainder(incoming.size())), declared);
+        else
+          fields = Fields.UNKNOWN;
+        selected = null;
+      } else {
+        Fields all = append(incoming, declared);
+        selected = positions(selector, all);
+        fields = select(all, selected);
+      }
+    }
+
+    private int[] remainder(int width) {
+      if (argumentPositions == null)
+        return new int[0];
+      boolean[] isArgument = new boolean[width];
+      int numArguments = 0;
+      for (int pos : argumentPositions) {
+        if (!isArgument[pos])
+          numArguments++;
+        isArgument[pos] = true;
+      }
+      int[] result = new int[width - numArguments];
+      int j = 0;
+      for (int i = 0; i < width; i++)
+        if (!isArgument[i])
+          result[j++] = i;
+      return result;
+    }
+
+    Tuple combine(Tuple incomingTuple, Tuple result) {
+      if (selector.isResults())
+        return result;
+      else if (selector.isAll())
+        return concat(incomingTuple, result);
+      else if (selector.isSwap())
+        return concat(select(incomingTuple, remainder(incomingTuple.size())), result);
+      else
+        return select(concat(incomingTuple, result), selected);
+    }
+  }
+
+  /**
+   * Create a new in-memory flow.
+   *
+   * @param config
+   *          the PyCascading configuration parameters
+   * @param sources
+   *          the source taps mapped from the names of the head pipes
+   * @param sinks
+   *          the sink taps mapped from the names of the tail pipes
+   * @param tails
+   *          the tails of the pipeline
+   */
+  public MemoryFlow(Map<String, Object> config, Map<String, Tap> sources, Map<String, Tap> sinks,
+          Pipe... tails) {
+    this.sources = sources;
+    this.sinks = sinks;
+    this.tails = tails;
+
+    jobConf = new JobConf();
+    jobConf.set("io.serializations", "cascading.tuple.hadoop.TupleSerialization,"
+            + "com.twitter.pycascading.bigintegerserialization.BigIntegerSerialization,"
+            + "org.apache.hadoop.io.serializer.WritableSerialization,"
+            + "com.twitter.pycascading.pythonserialization.PythonSerialization");
+    jobConf.set("mapred.input.dir.recursive", "true");
+    Properties properties = new Properties();
+    Util.setSimpleParameters(properties, config);
+    for (String name : properties.stringPropertyNames())
+      jobConf.set(name, properties.getProperty(name));
+    // The operations are run in this JVM, so they should find the PyCascading
+    // and the user's sources locally even if we were started in Hadoop mode
+    jobConf.set("pycascading.running_mode", "local");
+    jobConf.set("pycascading.main_file", (String) config.get("pycascading.main_file"));
+    flowProcess = new MemoryFlowProcess(jobConf);
+
+    numThreads = getIntParameter(config, THREADS, Runtime.getRuntime().availableProcessors());
+    spillThreshold = getIntParameter(config, SPILL_THRESHOLD, DEFAULT_SPILL_THRESHOLD);
+  }
+
+  private static int getIntParameter(Map<String, Object> config, String name, int defaultValue) {
+    Object value = config.get(name);
+    if (value == null)
+      return defaultValue;
+    else if (value instanceof Number)
+      return ((Number) value).intValue();
+    else
+      return Integer.parseInt(value.toString());
+  }
+
+  /**
+   * Run the flow and wait for it to complete.
+   */
+  public void complete() throws IOException {
+    executor = Executors.newFixedThreadPool(numThreads);
+    try {
+      for (Pipe tail : tails) {
+        Tap sink = sinks.get(tail.getName());
+        if (sink == null)
+          throw new IllegalStateException("No sink tap for tail pipe " + tail.getName());
+        writeSink(sink, evaluate(tail));
+      }
+    } finally {
+      executor.shutdownNow();
+      for (Stream stream : streams.values())
+        stream.tuples.clear();
+      for (Grouping grouping : groupings.values())
+        grouping.records.clear();
+      streams.clear();
+      groupings.clear();
+    }
+  }
+
+  /**
+   * Return the counters incremented by the operations during the run.
+   *
+   * @return the values of the counters, by group and counter name
+   */
+  public Map<String, Map<String, Long>> getCounters() {
+    return flowProcess.getCounters();
+  }
+
+  private SpillableTupleList newList() {
+    return new SpillableTupleList(spillThreshold);
+  }
+
+  private Stream evaluate(Pipe pipe) throws IOException {
+    Stream stream = streams.get(pipe);
+    if (stream != null)
+      return stream;
+    Pipe[] previous = pipe.getPrevious();
+    if (pipe instanceof SubAssembly)
+      stream = evaluate(((SubAssembly) pipe).getTails()[0]);
+    else if (pipe instanceof Each)
+      stream = evaluateEach((Each) pipe);
+    else if (pipe instanceof Every)
+      stream = evaluateEvery((Every) pipe);
+    else if (pipe instanceof Group) {
+      Grouping grouping = evaluateGrouping((Group) pipe);
+      SpillableTupleList values = newList();
+      for (Tuple record : grouping.records)
+        values.add((Tuple) record.getObject(1));
+      stream = new Stream(grouping.valueFields, values);
+    } else if (previous.length == 0)
+      stream = readSource(pipe);
+    else if (previous.length == 1)
+      stream = evaluate(previous[0]);
+    else
+      throw new UnsupportedOperationException("Unsupported pipe in the in-memory engine: " + pipe);
+    streams.put(pipe, stream);
+    return stream;
+  }
+
+  private Stream readSource(Pipe head) throws IOException {
+    Tap tap = sources.get(head.getName());
+    if (tap == null)
+      throw new IllegalStateException("No source tap for head pipe " + head.getName());
+    Fields fields = tap.getSourceFields();
+    SpillableTupleList tuples = newList();
+    TupleEntryIterator iterator = tap.openForRead(new JobConf(jobConf));
+    try {
+      while (iterator.hasNext()) {
+        TupleEntry entry = iterator.next();
+        if (!fields.isDefined())
+          fields = entry.getFields();
+        tuples.add(new Tuple(entry.getTuple()));
+      }
+    } finally {
+      iterator.close();
+    }
+    return new Stream(fields, tuples);
+  }
+
+  private void writeSink(Tap sink, Stream stream) throws IOException {
+    JobConf conf = new JobConf(jobConf);
+    if (sink.isReplace() && sink.pathExists(conf))
+      sink.deletePath(conf);
+    TupleEntryCollector collector = sink.openForWrite(conf);
+    try {
+      for (Tuple tuple : stream.tuples)
+        collector.add(new TupleEntry(stream.fields, tuple));
+    } finally {
+      collector.close();
+    }
+  }
+
+  private Stream evaluateEach(Each each) throws IOException {
+    final Stream incoming = evaluate(each.getPrevious()[0]);
+    Operation operation = each.getOperation();
+    if (operation instanceof ValueAssertion)
+      return incoming;
+    final int[] argumentPositions = positions(each.getArgumentSelector(), incoming.fields);
+    final Fields argumentFields = select(incoming.fields, argumentPositions);
+
+    if (operation instanceof Filter) {
+      Task task = new Task() {
+        @Override
+        public void process(Slot[] slots, SpillableTupleList chunk, SpillableTupleList output) {
+          Filter filter = (Filter) slots[0].operation;
+          ConcreteCall call = slots[0].call;
+          for (Tuple tuple : chunk) {
+            call.setArguments(new TupleEntry(argumentFields, select(tuple, argumentPositions)));
+            if (!filter.isRemove(flowProcess, call))
+              output.add(tuple);
+          }
+        }
+      };
+      return new Stream(incoming.fields, runParallel(operation, incoming.tuples, task));
+    } else if (operation instanceof Function) {
+      final Outgoing outgoing = new Outgoing(each.getOutputSelector(), incoming.fields,
+              argumentPositions, declaredFields(operation, argumentFields));
+      Task task = new Task() {
+        @Override
+        public void process(Slot[] slots, SpillableTupleList chunk, SpillableTupleList output) {
+          Function function = (Function) slots[0].operation;
+          ConcreteCall call = slots[0].call;
+          ListCollector collector = new ListCollector();
+          call.setOutputCollector(collector);
+          for (Tuple tuple : chunk) {
+            call.setArguments(new TupleEntry(argumentFields, select(tuple, argumentPositions)));
+            function.operate(flowProcess, call);
+            for (Tuple result : collector.tuples)
+              output.add(outgoing.combine(tuple, result));
+            collector.tuples.clear();
+          }
+        }
+      };
+      return new Stream(outgoing.fields, runParallel(operation, incoming.tuples, task));
+    } else
+      throw new UnsupportedOperationException("Unsupported operation in the in-memory engine: "
+              + operation);
+  }
+
+  private Stream evaluateEvery(Every every) throws IOException {
+    // Find the chain of Everys following the grouping
+    final List<Every> chain = new LinkedList<Every>();
+    Pipe pipe = every;
+    while (pipe instanceof Every) {
+      if (!(((Every) pipe).getOperation() instanceof GroupAssertion))
+        chain.add(0, (Every) pipe);
+      pipe = pipe.getPrevious()[0];
+    }
+    if (!(pipe instanceof Group))
+      throw new UnsupportedOperationException("Every must follow a GroupBy or CoGroup: " + every);
+    final Grouping grouping = evaluateGrouping((Group) pipe);
+    final int n = chain.size();
+    if (n == 0) {
+      Stream stream = evaluate(pipe);
+      return new Stream(stream.fields, stream.tuples);
+    }
+
+    final Operation[] operations = new Operation[n];
+    final int[][] argumentPositions = new int[n][];
+    final Fields[] argumentFields = new Fields[n];
+    final Outgoing[] outgoing = new Outgoing[n];
+    Fields fields = grouping.groupFields;
+    for (int i = 0; i < n; i++) {
+      Every e = chain.get(i);
+      operations[i] = e.getOperation();
+      if (operations[i] instanceof Buffer && n > 1)
+        throw new UnsupportedOperationException(
+                "A Buffer cannot be used together with other Everys on the same grouping");
+      argumentPositions[i] = positions(e.getArgumentSelector(), grouping.valueFields);
+      argumentFields[i] = select(grouping.valueFields, argumentPositions[i]);
+      outgoing[i] = new Outgoing(e.getOutputSelector(), fields, null, declaredFields(
+              operations[i], argumentFields[i]));
+      fields = outgoing[i].fields;
+    }
+
+    Task task = new Task() {
+      @Override
+      public void process(Slot[] slots, SpillableTupleList chunk, SpillableTupleList output) {
+        ListCollector collector = new ListCollector();
+        for (Slot slot : slots)
+          slot.call.setOutputCollector(collector);
+        GroupIterator groups = new GroupIterator(chunk.iterator());
+        while (groups.nextGroup()) {
+          Tuple group = groups.getGroup();
+          TupleEntry groupEntry = new TupleEntry(grouping.groupFields, group);
+          if (operations[0] instanceof Buffer) {
+            final Iterator<Tuple> values = groups;
+            slots[0].call.setGroup(groupEntry);
+            slots[0].call.setArgumentsIterator(new Iterator<TupleEntry>() {
+              @Override
+              public boolean hasNext() {
+                return values.hasNext();
+              }
+
+              @Override
+              public TupleEntry next() {
+                return new TupleEntry(argumentFields[0], select(values.next(),
+                        argumentPositions[0]));
+              }
+
+              @Override
+              public void remove() {
+                throw new UnsupportedOperationException();
+              }
+            });
+            ((Buffer) slots[0].operation).operate(flowProcess, slots[0].call);
+            for (Tuple result : collector.tuples)
+              output.add(outgoing[0].combine(group, result));
+            collector.tuples.clear();
+          } else {
+            for (int i = 0; i < n; i++) {
+              slots[i].call.setGroup(groupEntry);
+              ((Aggregator) slots[i].operation).start(flowProcess, slots[i].call);
+            }
+            while (groups.hasNext()) {
+              Tuple value = groups.next();
+              for (int i = 0; i < n; i++) {
+                slots[i].call.setArguments(new TupleEntry(argumentFields[i], select(value,
+                        argumentPositions[i])));
+                ((Aggregator) slots[i].operation).aggregate(flowProcess, slots[i].call);
+              }
+            }
+            // If an aggregator emits several tuples, we take all combinations
+            List<Tuple> combined = new ArrayList<Tuple>();
+            combined.add(group);
+            for (int i = 0; i < n; i++) {
+              ((Aggregator) slots[i].operation).complete(flowProcess, slots[i].call);
+              List<Tuple> next = new ArrayList<Tuple>();
+              for (Tuple tuple : combined)
+                for (Tuple result : collector.tuples)
+                  next.add(outgoing[i].combine(tuple, result));
+              collector.tuples.clear();
+              combined = next;
+            }
+            for (Tuple tuple : combined)
+              output.add(tuple);
+          }
+        }
+      }
+    };
+    Comparator<Tuple> sameGroup = new Comparator<Tuple>() {
+      @Override
+      public int compare(Tuple r1, Tuple r2) {
+        return TupleSorter.compareTuples((Tuple) r1.getObject(0), (Tuple) r2.getObject(0));
+      }
+    };
+    return new Stream(fields, runParallel(operations, grouping.records, sameGroup, task));
+  }
+
+  /**
+   * Iterates over the values of consecutive groups in a sorted list of
+   * grouping records.
+   */
+  private static class GroupIterator implements Iterator<Tuple> {
+    private final Iterator<Tuple> records;
+    private Tuple next = null;
+    private Tuple group = null;
+    private boolean inGroup = false;
+
+    GroupIterator(Iterator<Tuple> records) {
+      this.records = records;
+      if (records.hasNext())
+        next = records.next();
+    }
+
+    /**
+     * Skip the rest of the current group, and move to the next one.
+     *
+     * @return true if there is a next group
+     */
+    boolean nextGroup() {
+      while (hasNext())
+        next();
+      if (next == null)
+        return false;
+      group = (Tuple) next.getObject(0);
+      inGroup = true;
+      return true;
+    }
+
+    Tuple getGroup() {
+      return group;
+    }
+
+    @Override
+    public boolean hasNext() {
+      if (inGroup && next != null
+              && TupleSorter.compareTuples((Tuple) next.getObject(0), group) == 0)
+        return true;
+      inGroup = false;
+      return false;
+    }
+
+    @Override
+    public Tuple next() {
+      if (!hasNext())
+        throw new NoSuchElementException();
+      Tuple value = (Tuple) next.getObject(1);
+      next = (records.hasNext() ? records.next() : null);
+      return value;
+    }
+
+    @Override
+    public void remove() {
+      throw new UnsupportedOperationException();
+    }
+  }
+
+  private Grouping evaluateGrouping(Group group) throws IOException {
+    Grouping grouping = groupings.get(group);
+    if (grouping != null)
+      return grouping;
+
+    Pipe[] previous = group.getPrevious();
+    Integer numSelfJoins = (Integer) getField(group, "numSelfJoins");
+    if (numSelfJoins != null && numSelfJoins > 0) {
+      Pipe[] copies = new Pipe[numSelfJoins + 1];
+      for (int i = 0; i < copies.length; i++)
+        copies[i] = previous[0];
+      previous = copies;
+    }
+    boolean isCoGroup = (group instanceof CoGroup);
+    Map<String, Fields> groupingSelectors = group.getGroupingSelectors();
+    Map<String, Fields> sortingSelectors = group.getSortingSelectors();
+    boolean hasSorting = false;
+
+    Stream[] inputs = new Stream[previous.length];
+    int[][] keyPositions = new int[previous.length][];
+    int[][] sortPositions = new int[previous.length][];
+    for (int i = 0; i < previous.length; i++) {
+      inputs[i] = evaluate(previous[i]);
+      Fields keySelector = groupingSelectors.get(previous[i].getName());
+      keyPositions[i] = positions(keySelector.isValues() ? Fields.ALL : keySelector,
+              inputs[i].fields);
+      Fields sortSelector = (sortingSelectors == null ? null : sortingSelectors.get(previous[i]
+              .getName()));
+      if (sortSelector != null && sortSelector.size() > 0) {
+        sortPositions[i] = positions(sortSelector, inputs[i].fields);
+        hasSorting = true;
+      } else
+        sortPositions[i] = new int[0];
+    }
+
+    // The records to sort consist of the grouping tuple, the secondary sort
+    // tuple, the index of the input pipe, and the tuple itself
+    final boolean reversed = group.isSortReversed();
+    final boolean reverseGroups = reversed && !hasSorting;
+    TupleSorter sorter = new TupleSorter(new Comparator<Tuple>() {
+      @Override
+      public int compare(Tuple r1, Tuple r2) {
+        int c = TupleSorter.compareTuples((Tuple) r1.getObject(0), (Tuple) r2.getObject(0));
+        if (c != 0)
+          return (reverseGroups ? -c : c);
+        c = (Integer) r1.getObject(2) - (Integer) r2.getObject(2);
+        if (c != 0)
+          return c;
+        c = TupleSorter.compareTuples((Tuple) r1.getObject(1), (Tuple) r2.getObject(1));
+        return (reversed ? -c : c);
+      }
+    }, spillThreshold);
+    for (int i = 0; i < previous.length; i++) {
+      for (Tuple tuple : inputs[i].tuples) {
+        // With GroupBy we merge the input pipes, so their indices don't matter
+        sorter.add(new Tuple(select(tuple, keyPositions[i]), select(tuple, sortPositions[i]),
+                isCoGroup ? i : 0, tuple));
+      }
+    }
+
+    SpillableTupleList records = newList();
+    Fields valueFields;
+    if (isCoGroup) {
+      valueFields = join(group, inputs, sorter.iterator(), records);
+    } else {
+      valueFields = inputs[0].fields;
+      Iterator<Tuple> sorted = sorter.iterator();
+      while (sorted.hasNext()) {
+        Tuple record = sorted.next();
+        records.add(new Tuple(record.getObject(0), record.getObject(3)));
+      }
+    }
+    sorter.clear();
+    Fields groupFields = select(valueFields.isDefined() ? valueFields : inputs[0].fields,
+            keyPositions[0]);
+    grouping = new Grouping(groupFields, valueFields, records);
+    groupings.put(group, grouping);
+    return grouping;
+  }
+
+  /**
+   * Join the co-grouped tuples with the Joiner of the CoGroup.
+   *
+   * @return the fields of the joined tuples
+   */
+  private Fields join(Group group, Stream[] inputs, Iterator<Tuple> sorted,
+          SpillableTupleList records) {
+    Joiner joiner = (Joiner) getField(group, "joiner");
+    if (joiner == null)
+      joiner = new InnerJoin();
+    if (!(joiner instanceof InnerJoin || joiner instanceof OuterJoin
+            || joiner instanceof LeftJoin || joiner instanceof RightJoin))
+      throw new UnsupportedOperationException("Joiner not supported by the in-memory engine: "
+              + joiner);
+
+    int n = inputs.length;
+    int[] widths = new int[n];
+    Fields joinedFields = null;
+    for (int i = 0; i < n; i++) {
+      Fields fields = inputs[i].fields;
+      if (fields.isDefined())
+        widths[i] = fields.size();
+      else {
+        Iterator<Tuple> first = inputs[i].tuples.iterator();
+        widths[i] = (first.hasNext() ? first.next().size() : 0);
+      }
+      joinedFields = (i == 0 ? fields : append(joinedFields, fields));
+    }
+    Fields declared = (Fields) getField(group, "declaredFields");
+    if (declared != null && declared.isDefined())
+      joinedFields = declared;
+
+    Tuple record = (sorted.hasNext() ? sorted.next() : null);
+    while (record != null) {
+      Tuple key = (Tuple) record.getObject(0);
+      List<List<Tuple>> sides = new ArrayList<List<Tuple>>(n);
+      for (int i = 0; i < n; i++)
+        sides.add(new ArrayList<Tuple>());
+      while (record != null && TupleSorter.compareTuples((Tuple) record.getObject(0), key) == 0) {
+        sides.get((Integer) record.getObject(2)).add((Tuple) record.getObject(3));
+        record = (sorted.hasNext() ? sorted.next() : null);
+      }
+
+      // Empty sides are replaced by a tuple of nulls on the outer sides, and
+      // the group is dropped if an inner side is empty
+      boolean skip = false;
+      for (int i = 0; i < n && !skip; i++) {
+        if (!sides.get(i).isEmpty())
+          continue;
+        boolean outer = (joiner instanceof OuterJoin) || (joiner instanceof LeftJoin && i > 0)
+                || (joiner instanceof RightJoin && i == 0);
+        if (outer) {
+          Tuple nulls = new Tuple();
+          for (int j = 0; j < widths[i]; j++)
+            nulls.add(null);
+          sides.get(i).add(nulls);
+        } else
+          skip = true;
+      }
+      if (skip)
+        continue;
+
+      // The cross product of the sides
+      List<Tuple> joined = new ArrayList<Tuple>();
+      joined.add(new Tuple());
+      for (List<Tuple> side : sides) {
+        List<Tuple> next = new ArrayList<Tuple>(joined.size() * side.size());
+        for (Tuple left : joined)
+          for (Tuple right : side)
+            next.add(concat(left, right));
+        joined = next;
+      }
+      for (Tuple tuple : joined)
+        records.add(new Tuple(key, tuple));
+    }
+    return joinedFields;
+  }
+
+  private SpillableTupleList runParallel(Operation operation, Iterable<Tuple> input, Task task)
+          throws IOException {
+    return runParallel(new Operation[] { operation }, input, null, task);
+  }
+
+  /**
+   * Process the input tuples in chunks on the thread pool, and concatenate the
+   * results in the order of the input.
+   *
+   * @param operations
+   *          the operations that the task uses
+   * @param input
+   *          the input tuples
+   * @param boundary
+   *          tuples that are equal according to this comparator are put in
+   *          the same chunk, or null if the chunks may be split anywhere
+   * @param task
+   *          the processing of a chunk
+   * @return the concatenated outputs of the chunks
+   */
+  private SpillableTupleList runParallel(Operation[] operations, Iterable<Tuple> input,
+          Comparator<Tuple> boundary, final Task task) throws IOException {
+    final OperationPool[] pools = new OperationPool[operations.length];
+    for (int i = 0; i < operations.length; i++)
+      pools[i] = new OperationPool(operations[i]);
+    LinkedList<Future<SpillableTupleList>> futures = new LinkedList<Future<SpillableTupleList>>();
+    SpillableTupleList result = newList();
+    try {
+      SpillableTupleList chunk = newList();
+      Tuple previous = null;
+      for (Tuple tuple : input) {
+        if (chunk.size() >= CHUNK_SIZE
+                && (boundary == null || boundary.compare(previous, tuple) != 0)) {
+          futures.add(submit(pools, chunk, task));
+          chunk = newList();
+          // We don't want to keep too many chunks in memory
+          while (futures.size() > 2 * numThreads)
+            collect(futures.removeFirst(), result);
+        }
+        chunk.add(tuple);
+        previous = tuple;
+      }
+      if (chunk.size() > 0)
+        futures.add(submit(pools, chunk, task));
+      while (!futures.isEmpty())
+        collect(futures.removeFirst(), result);
+    } finally {
+      for (Future<SpillableTupleList> future : futures)
+        future.cancel(true);
+      for (OperationPool pool : pools)
+        pool.cleanup();
+    }
+    return result;
+  }
+
+  private Future<SpillableTupleList> submit(final OperationPool[] pools,
+          final SpillableTupleList chunk, final Task task) {
+    return executor.submit(new Callable<SpillableTupleList>() {
+      @Override
+      public SpillableTupleList call() throws Exception {
+        Slot[] slots = new Slot[pools.length];
+        try {
+          for (int i = 0; i < pools.length; i++)
+            slots[i] = pools[i].take();
+          SpillableTupleList output = newList();
+          task.process(slots, chunk, output);
+          return output;
+        } finally {
+          chunk.clear();
+          for (int i = 0; i < pools.length; i++)
+            if (slots[i] != null)
+              pools[i].release(slots[i]);
+        }
+      }
+    });
+  }
+
+  private void collect(Future<SpillableTupleList> future, SpillableTupleList result)
+          throws IOException {
+    SpillableTupleList output;
+    try {
+      output = future.get();
+    } catch (ExecutionException e) {
+      Throwable cause = e.getCause();
+      if (cause instanceof IOException)
+        throw (IOException) cause;
+      else if (cause instanceof RuntimeException)
+        throw (RuntimeException) cause;
+      else
+        throw new RuntimeException(cause);
+    } catch (InterruptedException e) {
+      throw new RuntimeException(e);
+    }
+    result.addAll(output);
+    output.clear();
+  }
+
+  /**
+   * Get the value of a field of an object that has no public accessor. We use
+   * this for the parameters of Groups that are not exposed.
+   */
+  private static Object getField(Object object, String name) {
+    for (Class<?> c = object.getClass(); c != null; c = c.getSuperclass()) {
+      try {
+        Field field = c.getDeclaredField(name);
+        field.setAccessible(true);
+        return field.get(object);
+      } catch (NoSuchFieldException e) {
+        // Try the superclass
+      } catch (IllegalAccessException e) {
+        return null;
+      }
+    }
+    return null;
+  }
+
+  /**
+   * Resolve the fields declared by an operation.
+   */
+  private static Fields declaredFields(Operation operation, Fields argumentFields) {
+    Fields declared = operation.getFieldDeclaration();
+    if (declared.isArguments() || declared.isAll())
+      return argumentFields;
+    return declared;
+  }
+
+  /**
+   * Determine the positions of the fields of a selector in the incoming
+   * fields.
+   *
+   * @return the positions, or null if all the fields are selected
+   */
+  static int[] positions(Fields selector, Fields incoming) {
+    if (selector.isAll() || selector.isArguments() || selector.isUnknown()
+            || selector.isValues())
+      return null;
+    if (!selector.isDefined())
+      throw new UnsupportedOperationException("Field selector not supported by the in-memory engine: "
+              + selector);
+    int[] result = new int[selector.size()];
+    for (int i = 0; i < selector.size(); i++) {
+      Comparable field = selector.get(i);
+      int pos = -1;
+      if (field instanceof Integer) {
+        pos = (Integer) field;
+        if (pos < 0) {
+          if (!incoming.isDefined())
+            throw new IllegalArgumentException("Cannot select field " + field + " from "
+                    + incoming);
+          pos += incoming.size();
+        }
+      } else if (incoming.isDefined()) {
+        for (int j = 0; j < incoming.size(); j++)
+          if (field.equals(incoming.get(j))) {
+            pos = j;
+            break;
+          }
+      }
+      if (pos < 0)
+        throw new IllegalArgumentException("Field " + field + " not found in " + incoming);
+      result[i] = pos;
+    }
+    return result;
+  }
+
+  static Fields select(Fields fields, int[] positions) {
+    if (positions == null)
+      return fields;
+    if (!fields.isDefined())
+      return Fields.UNKNOWN;
+    Comparable[] selected = new Comparable[positions.length];
+    for (int i = 0; i < positions.length; i++)
+      selected[i] = fields.get(positions[i]);
+    return new Fields(selected);
+  }
+
+  static Tuple select(Tuple tuple, int[] positions) {
+    if (positions == null)
+      return tuple;
+    Tuple result = new Tuple();
+    for (int pos : positions)
+      result.add(tuple.getObject(pos));
+    return result;
+  }
+
+  static Fields append(Fields fields1, Fields fields2) {
+    if (!fields1.isDefined() || !fields2.isDefined())
+      return Fields.UNKNOWN;
+    Comparable[] appended = new Comparable[fields1.size() + fields2.size()];
+    for (int i = 0; i < fields1.size(); i++)
+      appended[i] = fields1.get(i);
+    for (int i = 0; i < fields2.size(); i++) {
+      Comparable field = fields2.get(i);
+      for (int j = 0; j < fields1.size(); j++)
+        if (field.equals(appended[j]))
+          throw new IllegalArgumentException("Field " + field + " already exists in "
+                  + fields1);
+      appended[fields1.size() + i] = field;
+    }
+    return new Fields(appended);
+  }
+
+  static Tuple concat(Tuple tuple1, Tuple tuple2) {
+    Tuple result = new Tuple(tuple1);
+    for (int i = 0; i < tuple2.size(); i++)
+      result.add(tuple2.getObject(i));
+    return result;
+  }
+}
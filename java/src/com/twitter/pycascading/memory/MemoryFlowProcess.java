@@ -0,0 +1,66 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.memory;
+
+import java.util.HashMap;
+import java.util.Map;
+
+import org.apache.hadoop.mapred.JobConf;
+
+import cascading.flow.hadoop.HadoopFlowProcess;
+
+/**
+ * The FlowProcess passed to the operations run by the in-memory engine. It is
+ * a HadoopFlowProcess so that the PyCascading wrappers can get the jobconf
+ * from it, and it collects the counters incremented by the operations.
+ *
+ * @author Gabor Szabo
+ */
+@SuppressWarnings("rawtypes")
+public class MemoryFlowProcess extends HadoopFlowProcess {
+  private final Map<String, Map<String, Long>> counters = new HashMap<String, Map<String, Long>>();
+
+  public MemoryFlowProcess(JobConf jobConf) {
+    super(jobConf);
+  }
+
+  @Override
+  public void increment(Enum counter, int amount) {
+    increment(counter.getDeclaringClass().getName(), counter.name(), amount);
+  }
+
+  @Override
+  public synchronized void increment(String group, String counter, int amount) {
+    Map<String, Long> groupCounters = counters.get(group);
+    if (groupCounters == null) {
+      groupCounters = new HashMap<String, Long>();
+      counters.put(group, groupCounters);
+    }
+    Long value = groupCounters.get(counter);
+    groupCounters.put(counter, (value == null ? 0L : value) + amount);
+  }
+
+  /**
+   * Return a copy of the counters incremented so far.
+   *
+   * @return the values of the counters, by group and counter name
+   */
+  public synchronized Map<String, Map<String, Long>> getCounters() {
+    Map<String, Map<String, Long>> result = new HashMap<String, Map<String, Long>>();
+    for (Map.Entry<String, Map<String, Long>> group : counters.entrySet())
+      result.put(group.getKey(), new HashMap<String, Long>(group.getValue()));
+    return result;
+  }
+}
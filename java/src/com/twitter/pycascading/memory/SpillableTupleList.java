@@ -0,0 +1,198 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.memory;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.EOFException;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.ObjectInputStream;
+import java.io.ObjectOutputStream;
+import java.util.ArrayList;
+import java.util.Iterator;
+import java.util.List;
+import java.util.NoSuchElementException;
+
+import cascading.tuple.Tuple;
+
+/**
+ * An append-only list of Tuples that is kept in memory up to a threshold, and
+ * spills to temporary files on the local disk above that. The list can be
+ * iterated several times, so that it can be consumed by several branches of
+ * a pipeline.
+ *
+ * @author Gabor Szabo
+ */
+public class SpillableTupleList implements Iterable<Tuple> {
+  // We reset the object streams periodically so that they don't hold on to
+  // references to all the objects written
+  private static final int RESET_INTERVAL = 1000;
+
+  private final int threshold;
+  private final List<File> spillFiles = new ArrayList<File>();
+  private List<Tuple> current = new ArrayList<Tuple>();
+  private long size = 0;
+
+  /**
+   * @param threshold
+   *          the maximum number of tuples to keep in memory at any time
+   */
+  public SpillableTupleList(int threshold) {
+    this.threshold = threshold;
+  }
+
+  public void add(Tuple tuple) {
+    current.add(tuple);
+    size++;
+    if (current.size() >= threshold)
+      spill();
+  }
+
+  public void addAll(Iterable<Tuple> tuples) {
+    for (Tuple tuple : tuples)
+      add(tuple);
+  }
+
+  public long size() {
+    return size;
+  }
+
+  /**
+   * Write the tuples held in memory to a new temporary file.
+   */
+  private void spill() {
+    try {
+      File file = File.createTempFile("pycascading-spill-", ".bin");
+      file.deleteOnExit();
+      writeTuples(file, current);
+      spillFiles.add(file);
+      current = new ArrayList<Tuple>();
+    } catch (IOException e) {
+      throw new RuntimeException("Could not spill tuples to disk", e);
+    }
+  }
+
+  static void writeTuples(File file, Iterable<Tuple> tuples) throws IOException {
+    ObjectOutputStream out = new ObjectOutputStream(new BufferedOutputStream(
+            new FileOutputStream(file)));
+    int written = 0;
+    for (Tuple tuple : tuples) {
+      out.writeObject(tuple);
+      if (++written % RESET_INTERVAL == 0)
+        out.reset();
+    }
+    out.close();
+  }
+
+  /**
+   * Iterates over the tuples stored in a spill file.
+   */
+  static class FileIterator implements Iterator<Tuple> {
+    private ObjectInputStream in;
+    private Tuple next;
+
+    FileIterator(File file) {
+      try {
+        in = new ObjectInputStream(new BufferedInputStream(new FileInputStream(file)));
+      } catch (IOException e) {
+        throw new RuntimeException("Could not read spilled tuples", e);
+      }
+      advance();
+    }
+
+    private void advance() {
+      try {
+        next = (Tuple) in.readObject();
+      } catch (EOFException e) {
+        next = null;
+        try {
+          in.close();
+        } catch (IOException e1) {
+        }
+      } catch (Exception e) {
+        throw new RuntimeException("Could not read spilled tuples", e);
+      }
+    }
+
+    @Override
+    public boolean hasNext() {
+      return next != null;
+    }
+
+    @Override
+    public Tuple next() {
+      if (next == null)
+        throw new NoSuchElementException();
+      Tuple result = next;
+      advance();
+      return result;
+    }
+
+    @Override
+    public void remove() {
+      throw new UnsupportedOperationException();
+    }
+  }
+
+  @Override
+  public Iterator<Tuple> iterator() {
+    return new Iterator<Tuple>() {
+      private int fileIndex = 0;
+      private Iterator<Tuple> iterator = nextIterator();
+
+      private Iterator<Tuple> nextIterator() {
+        if (fileIndex < spillFiles.size())
+          return new FileIterator(spillFiles.get(fileIndex++));
+        else if (fileIndex++ == spillFiles.size())
+          return current.iterator();
+        else
+          return null;
+      }
+
+      @Override
+      public boolean hasNext() {
+        while (iterator != null && !iterator.hasNext())
+          iterator = nextIterator();
+        return iterator != null;
+      }
+
+      @Override
+      public Tuple next() {
+        if (!hasNext())
+          throw new NoSuchElementException();
+        return iterator.next();
+      }
+
+      @Override
+      public void remove() {
+        throw new UnsupportedOperationException();
+      }
+    };
+  }
+
+  /**
+   * Remove the spill files and release the tuples held in memory.
+   */
+  public void clear() {
+    for (File file : spillFiles)
+      file.delete();
+    spillFiles.clear();
+    current = new ArrayList<Tuple>();
+    size = 0;
+  }
+}
@@ -0,0 +1,190 @@
+/**
+ * Copyright 2011 Twitter, Inc.
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ * http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+package com.twitter.pycascading.memory;
+
+import java.io.File;
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.Iterator;
+import java.util.List;
+import java.util.NoSuchElementException;
+import java.util.PriorityQueue;
+
+import org.python.core.PyObject;
+
+import cascading.tuple.Tuple;
+
+/**
+ * External merge sort for Tuples. Tuples are sorted in memory in runs of at
+ * most a given number of tuples, the runs are written to temporary files, and
+ * the sorted result is produced by merging the runs. The sort is stable.
+ *
+ * @author Gabor Szabo
+ */
+public class TupleSorter {
+  private final Comparator<Tuple> comparator;
+  private final int threshold;
+  private final List<File> runs = new ArrayList<File>();
+  private List<Tuple> current = new ArrayList<Tuple>();
+
+  /**
+   * @param comparator
+   *          the order of the tuples
+   * @param threshold
+   *          the maximum number of tuples to sort in memory at once
+   */
+  public TupleSorter(Comparator<Tuple> comparator, int threshold) {
+    this.comparator = comparator;
+    this.threshold = threshold;
+  }
+
+  public void add(Tuple tuple) {
+    current.add(tuple);
+    if (current.size() >= threshold)
+      spill();
+  }
+
+  private void spill() {
+    Collections.sort(current, comparator);
+    try {
+      File file = File.createTempFile("pycascading-sort-", ".bin");
+      file.deleteOnExit();
+      SpillableTupleList.writeTuples(file, current);
+      runs.add(file);
+      current = new ArrayList<Tuple>();
+    } catch (IOException e) {
+      throw new RuntimeException("Could not spill tuples to disk", e);
+    }
+  }
+
+  /**
+   * The head of a sorted run during the merge.
+   */
+  private static class Run {
+    final int index;
+    final Iterator<Tuple> iterator;
+    Tuple head;
+
+    Run(int index, Iterator<Tuple> iterator) {
+      this.index = index;
+      this.iterator = iterator;
+      this.head = iterator.next();
+    }
+  }
+
+  /**
+   * Return the tuples added so far in sorted order. This may be called only
+   * once, after all the tuples were added.
+   *
+   * @return iterator over the sorted tuples
+   */
+  public Iterator<Tuple> iterator() {
+    Collections.sort(current, comparator);
+    if (runs.isEmpty())
+      return current.iterator();
+
+    // Ties are broken by the index of the run to keep the sort stable. The
+    // tuples in memory were added last, so they are the last run.
+    final PriorityQueue<Run> heads = new PriorityQueue<Run>(runs.size() + 1, new Comparator<Run>() {
+      @Override
+      public int compare(Run r1, Run r2) {
+        int c = comparator.compare(r1.head, r2.head);
+        return (c != 0 ? c : r1.index - r2.index);
+      }
+    });
+    int index = 0;
+    for (File run : runs)
+      heads.add(new Run(index++, new SpillableTupleList.FileIterator(run)));
+    if (!current.isEmpty())
+      heads.add(new Run(index, current.iterator()));
+
+    return new Iterator<Tuple>() {
+      @Override
+      public boolean hasNext() {
+        return !heads.isEmpty();
+      }
+
+      @Override
+      public Tuple next() {
+        if (heads.isEmpty())
+          throw new NoSuchElementException();
+        Run run = heads.poll();
+        Tuple result = run.head;
+        if (run.iterator.hasNext()) {
+          run.head = run.iterator.next();
+          heads.add(run);
+        }
+        return result;
+      }
+
+      @Override
+      public void remove() {
+        throw new UnsupportedOperationException();
+      }
+    };
+  }
+
+  /**
+   * Remove the temporary files of the sorted runs.
+   */
+  public void clear() {
+    for (File run : runs)
+      run.delete();
+    runs.clear();
+    current = new ArrayList<Tuple>();
+  }
+
+  /**
+   * Compare two tuple elements. Nulls come first, numbers are compared by
+   * their values even if they are of different types, and Python objects are
+   * compared with Python semantics.
+   */
+  @SuppressWarnings({ "rawtypes", "unchecked" })
+  public static int compareElements(Object o1, Object o2) {
+    if (o1 == o2)
+      return 0;
+    if (o1 == null)
+      return -1;
+    if (o2 == null)
+      return 1;
+    if (o1 instanceof Number && o2 instanceof Number && o1.getClass() != o2.getClass())
+      return Double.compare(((Number) o1).doubleValue(), ((Number) o2).doubleValue());
+    if (o1 instanceof PyObject && o2 instanceof PyObject)
+      return ((PyObject) o1)._cmp((PyObject) o2);
+    if (o1 instanceof Tuple && o2 instanceof Tuple)
+      return compareTuples((Tuple) o1, (Tuple) o2);
+    if (o1 instanceof Comparable && o1.getClass() == o2.getClass())
+      return ((Comparable) o1).compareTo(o2);
+    // Objects of different types are ordered by the names of their classes
+    int c = o1.getClass().getName().compareTo(o2.getClass().getName());
+    return (c != 0 ? c : o1.toString().compareTo(o2.toString()));
+  }
+
+  /**
+   * Compare two tuples element by element, the shorter tuple coming first if
+   * it is a prefix of the other.
+   */
+  public static int compareTuples(Tuple t1, Tuple t2) {
+    int n = Math.min(t1.size(), t2.size());
+    for (int i = 0; i < n; i++) {
+      int c = compareElements(t1.getObject(i), t2.getObject(i));
+      if (c != 0)
+        return c;
+    }
+    return t1.size() - t2.size();
+  }
+}
@@ -0,0 +1,296 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Choose the number of reducers for each MapReduce step of a flow.
+
+This is used when a flow is run with num_reducers='auto'. The bytes shuffled
+in every step are estimated from the sizes of the source files, multiplied by
+the selectivities of the operations on the way to the GroupBy or CoGroup of
+the step. The selectivities are 1 unless the UDFs are decorated with
+@selectivity.
+
+After a flow with automatically chosen reducers has finished, the bytes that
+were actually shuffled are stored with the estimates in a .pycascading_stats
+file in the folders of its meta sinks. The next time the same sinks are
+written, the estimates are corrected by the ratio of the measured and the
+estimated bytes of the earlier run.
+
+The number of reducers of a step is the estimated bytes divided by
+pycascading.auto_reducers.bytes_per_reducer (1 GB by default), and is kept
+between pycascading.auto_reducers.min and pycascading.auto_reducers.max (1
+and 999 by default). Steps whose inputs have unknown sizes get 50 reducers.
+
+Exports the following:
+estimate
+apply
+record_stats
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import math
+
+from java.io import IOException
+from java.util import Properties
+
+import cascading.tap
+
+from org.apache.hadoop.fs import Path
+from org.apache.hadoop.mapred import JobConf
+
+from com.twitter.pycascading import Util, MetaScheme, SampledScheme, \
+MergeJoinScheme, MergeJoinTap
+
+
+BYTES_PER_REDUCER = 'pycascading.auto_reducers.bytes_per_reducer'
+MIN_REDUCERS = 'pycascading.auto_reducers.min'
+MAX_REDUCERS = 'pycascading.auto_reducers.max'
+
+_DEFAULTS = { BYTES_PER_REDUCER : 1024 * 1024 * 1024,
+              MIN_REDUCERS : 1,
+              MAX_REDUCERS : 999 }
+
+# The number of reducers of the steps whose shuffled bytes are unknown
+DEFAULT_REDUCERS = 50
+
+# The file in the folders of the meta sinks with the measured statistics
+STATS_FILE = '.pycascading_stats'
+
+
+def _input_size(tap):
+    """Return the total size of the files of a tap, or None if not known."""
+    if isinstance(tap, MergeJoinTap):
+        # The size of the right side is added below
+        tap = tap.getLeft()
+    if not isinstance(tap, (cascading.tap.Hfs, cascading.tap.GlobHfs)):
+        return None
+    try:
+        path = tap.getPath()
+        fs = path.getFileSystem(JobConf())
+        statuses = fs.globStatus(path)
+        if not statuses:
+            return None
+        size = sum([fs.getContentSummary(s.getPath()).getLength()
+                    for s in statuses])
+        if isinstance(tap.getScheme(), MergeJoinScheme):
+            # The tap reads the right side of the join, too
+            right = Path(tap.getScheme().getRightPath())
+            size += fs.getContentSummary(right).getLength()
+    except IOException:
+        return None
+    if isinstance(tap.getScheme(), SampledScheme):
+        return size * tap.getScheme().getFraction()
+    return size
+
+
+def _stats_path(tap):
+    """Return the path of the statistics file of a meta sink, or None."""
+    if isinstance(tap, cascading.tap.Hfs) and \
+    isinstance(tap.getScheme(), MetaScheme):
+        return Path(tap.getPath(), STATS_FILE)
+    return None
+
+
+def _read_stats(tap):
+    """Return the statistics recorded for a sink in a dict, or None."""
+    path = _stats_path(tap)
+    if path is None:
+        return None
+    try:
+        fs = path.getFileSystem(JobConf())
+        if not fs.exists(path):
+            return None
+        stream = fs.open(path)
+        try:
+            properties = Properties()
+            properties.load(stream)
+        finally:
+            stream.close()
+        stats = {}
+        for name in properties.stringPropertyNames():
+            stats[name] = float(properties.getProperty(name))
+        return stats
+    except (IOException, ValueError):
+        return None
+
+
+def _write_stats(tap, stats):
+    """Write the statistics of a sink into its folder."""
+    path = _stats_path(tap)
+    if path is None:
+        return
+    properties = Properties()
+    for (name, value) in stats.iteritems():
+        properties.setProperty(name, str(value))
+    stream = path.getFileSystem(JobConf()).create(path, True)
+    try:
+        properties.store(stream, 'PyCascading sink statistics')
+    finally:
+        stream.close()
+
+
+def _corrected(estimate, stats):
+    """Correct an estimate of the shuffled bytes with a measurement."""
+    measured = stats.get('shuffle_bytes')
+    if measured is None:
+        return estimate
+    then = stats.get('estimated_shuffle_bytes')
+    if estimate is None or not then:
+        return measured
+    return estimate * measured / then
+
+
+def estimate(plan, config):
+    """Estimate the bytes shuffled in the steps, and choose the reducers.
+
+    The estimates are stored in plan.estimated_shuffle_bytes, the estimates
+    corrected with the statistics of earlier runs in plan.shuffle_bytes, and
+    the numbers of reducers in plan.reducers. These are lists with an item
+    for every step of the plan, which is None for map-only steps.
+
+    Arguments:
+    plan -- the explain.Plan of the flow
+    config -- the configuration parameters of the flow
+    """
+    parameters = dict(_DEFAULTS)
+    for name in parameters.iterkeys():
+        if config.get(name) is not None:
+            parameters[name] = float(config[name])
+
+    predecessors = [[] for n in plan.nodes]
+    for (p, s) in plan.edges:
+        predecessors[s].append(p)
+    # The estimated bytes coming out of every node. The nodes are in
+    # topological order, so the predecessors come first.
+    volumes = [None] * len(plan.nodes)
+    for (i, node) in enumerate(plan.nodes):
+        if node.kind == 'source':
+            volumes[i] = _input_size(node.tap)
+            continue
+        inputs = [volumes[p] for p in predecessors[i]]
+        if inputs and None not in inputs:
+            volumes[i] = sum(inputs)
+            if node.selectivity is not None:
+                volumes[i] *= node.selectivity
+
+    plan.estimated_shuffle_bytes = [None] * plan.num_steps
+    plan.shuffle_bytes = [None] * plan.num_steps
+    plan.reducers = [None] * plan.num_steps
+    for (i, node) in enumerate(plan.nodes):
+        if node.kind == 'group' and node.step is not None:
+            plan.estimated_shuffle_bytes[node.step] = volumes[i]
+            plan.shuffle_bytes[node.step] = volumes[i]
+            plan.reducers[node.step] = DEFAULT_REDUCERS
+    # Every sink of a step may have statistics, we take the largest
+    # corrected estimate
+    corrected = {}
+    for node in plan.nodes:
+        if node.kind == 'sink' and node.step is not None and \
+        plan.reducers[node.step] is not None:
+            stats = _read_stats(node.tap)
+            if stats:
+                corrected.setdefault(node.step, []).append(_corrected(
+                    plan.estimated_shuffle_bytes[node.step], stats))
+    for (step, values) in corrected.iteritems():
+        plan.shuffle_bytes[step] = max(values)
+    for step in xrange(plan.num_steps):
+        shuffled = plan.shuffle_bytes[step]
+        if shuffled is not None:
+            reducers = int(math.ceil(float(shuffled) /
+                                     parameters[BYTES_PER_REDUCER]))
+            plan.reducers[step] = int(min(max(reducers,
+                                              parameters[MIN_REDUCERS]),
+                                          parameters[MAX_REDUCERS]))
+
+
+def _bucketed(tap):
+    """Return True if a tap is a sink writing a fixed number of buckets.
+
+    Arguments:
+    tap -- a tap, or any other element of the graph of a FlowStep
+    """
+    return isinstance(tap, cascading.tap.Tap) and \
+    isinstance(tap.getScheme(), MetaScheme) and \
+    tap.getScheme().getNumSinkParts() > 0
+
+
+def apply(plan, cascading_flow):
+    """Set the numbers of reducers chosen for the steps of a Cascading Flow.
+
+    The steps of the plan are the FlowSteps of the flow, whose groups and
+    sinks were found in their graphs. If the graphs were not accessible, and
+    the steps of the plan were derived from the assembly instead, we can't
+    tell which step is which, and every step gets the largest number of
+    reducers.
+
+    The steps writing bucketed sinks keep the numbers of reducers of the
+    buckets, otherwise the buckets couldn't be merge joined later.
+
+    Arguments:
+    plan -- the explain.Plan of the flow, after estimate()
+    cascading_flow -- the connected Cascading Flow, not started yet
+    """
+    if plan.steps is not None:
+        steps = plan.steps
+        reducers = list(plan.reducers)
+        for node in plan.nodes:
+            if node.kind == 'sink' and node.step is not None and \
+            _bucketed(node.tap):
+                reducers[node.step] = None
+    else:
+        steps = list(cascading_flow.getSteps())
+        known = [n for n in plan.reducers if n is not None]
+        reducers = [max(known or [DEFAULT_REDUCERS])] * len(steps)
+        bucketed = [n for n in plan.nodes
+                    if n.kind == 'sink' and _bucketed(n.tap)]
+        for (i, step) in enumerate(steps):
+            elements = Util.getStepElements(step)
+            if elements is None:
+                if bucketed:
+                    # We can't tell which steps write the buckets
+                    return
+                continue
+            # The source schemes of meta_sources are never MetaSchemes, so
+            # only the sinks can be bucketed
+            if [e for e in elements if _bucketed(e)]:
+                reducers[i] = None
+    for (step, n) in zip(steps, reducers):
+        if n is not None:
+            step.getProperties().put('mapred.reduce.tasks', str(n))
+
+
+def record_stats(plan, measurements):
+    """Store the bytes shuffled in the steps with the sinks they wrote.
+
+    Arguments:
+    plan -- the explain.Plan of the flow, after estimate()
+    measurements -- the measurements of the steps, as returned by
+        FlowHandle.step_measurements()
+    """
+    if plan.reducers is None or len(measurements) != plan.num_steps:
+        return
+    for node in plan.nodes:
+        if node.kind != 'sink' or node.step is None or \
+        plan.reducers[node.step] is None:
+            continue
+        shuffled = measurements[node.step][2].get('Map output bytes')
+        if shuffled is None:
+            continue
+        stats = { 'shuffle_bytes' : shuffled }
+        if plan.estimated_shuffle_bytes[node.step]:
+            stats['estimated_shuffle_bytes'] = \
+            int(plan.estimated_shuffle_bytes[node.step])
+        _write_stats(node.tap, stats)
@@ -0,0 +1,166 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Broadcast variables for large, read-only objects used by UDFs.
+
+Objects passed to UDFs as context arguments are serialized into every
+operation that uses them, and are deserialized again in each operation in
+every task. A broadcast variable is instead written once to a file when the
+flow is built, which is shipped to the workers in the distributed cache. The
+UDFs get a small handle, and the object is loaded from the file only when it
+is first accessed, at most once in every JVM. All the operations in a JVM
+share the same object, so it must not be modified.
+
+Use Flow.broadcast() to create a broadcast variable:
+
+lookup = flow.broadcast(big_dict)
+
+@udf_map
+def translate(tuple, lookup):
+    yield [lookup.value.get(tuple.get(0))]
+
+input | translate(lookup) | output
+
+Exports the following:
+DistributedFile
+Broadcast
+new_local_file
+write
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import os, atexit, tempfile, threading, hashlib, zlib, cPickle
+
+
+# The file extension of the broadcast files
+EXTENSION = '.broadcast'
+
+# The objects loaded from distributed files in this JVM, keyed by the file
+# names
+_values = {}
+_lock = threading.Lock()
+
+
+class DistributedFile(object):
+
+    """A file shipped to the workers in the distributed cache.
+
+    The handle only refers to the file by name, and the object stored in it
+    is loaded at most once in a JVM, when it is first used. Subclasses
+    implement _load to read the object from the file.
+    """
+
+    def __init__(self, file_name, local_path):
+        """Create a handle to a distributed file.
+
+        Arguments:
+        file_name -- the name of the file in the distributed cache, which is
+            also the name of the symlink to it in the tasks' working folders
+        local_path -- the path to the file on the machine where the flow was
+            built, used in local mode
+        """
+        self.file_name = file_name
+        self.local_path = local_path
+
+    def _get(self):
+        """Return the object loaded from the file, loading it if necessary."""
+        try:
+            return _values[self.file_name]
+        except KeyError:
+            pass
+        _lock.acquire()
+        try:
+            if self.file_name not in _values:
+                _values[self.file_name] = self._load(self._path())
+            return _values[self.file_name]
+        finally:
+            _lock.release()
+
+    def _path(self):
+        """Return the path to the file on this machine."""
+        if os.path.exists(self.file_name):
+            # In Hadoop mode, the distributed cache symlinked the file into
+            # the working folder
+            return self.file_name
+        else:
+            return self.local_path
+
+    def _load(self, path):
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.file_name)
+
+
+class Broadcast(DistributedFile):
+
+    """The handle to a broadcast variable that is passed to the UDFs.
+
+    The object itself is not serialized together with the handle, only the
+    name of its file.
+    """
+
+    def get_value(self):
+        """Return the broadcast object, loading it if necessary."""
+        return self._get()
+
+    value = property(get_value)
+
+    def _load(self, path):
+        """Read the object from the broadcast file."""
+        f = open(path, 'rb')
+        try:
+            return cPickle.loads(zlib.decompress(f.read()))
+        finally:
+            f.close()
+
+
+def new_local_file(extension):
+    """Create a temporary file that is deleted when the launcher exits.
+
+    Arguments:
+    extension -- the extension of the file name
+
+    Return:
+    the path to the file
+    """
+    (fd, local_path) = tempfile.mkstemp(suffix=extension,
+                                        prefix='pycascading-')
+    os.close(fd)
+    atexit.register(os.remove, local_path)
+    return local_path
+
+
+def write(obj):
+    """Write an object to a broadcast file, and return a handle to it.
+
+    The object is pickled and compressed. The file is named after the hash of
+    its contents, so that the same object results in the same file, which
+    is uploaded only once to HDFS.
+
+    Arguments:
+    obj -- the object to broadcast, which must be picklable
+    """
+    data = zlib.compress(cPickle.dumps(obj, 2))
+    file_name = hashlib.sha1(data).hexdigest() + EXTENSION
+    local_path = new_local_file(EXTENSION)
+    f = open(local_path, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    return Broadcast(file_name, local_path)
@@ -0,0 +1,265 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Management of the cached intermediate results.
+
+Cache entries are stored in folders under pycascading.cache/ in the user's
+home folder, named <identifier>/<fingerprint>. The fingerprint is computed
+from the pipeline that generated the cached data, including the sources of
+the user-defined functions, their parameters, and the paths and modification
+times of the source taps. An entry is only used if it was completely written,
+which is marked by a .pycascading_cache file in the folder. The modification
+time of this file is the time of the last use of the entry, and the least
+recently used entries are evicted first when the cache grows too large.
+
+This module can also be run as a PyCascading script to list or clean up the
+cache:
+
+local_run.sh python/pycascading/cache.py ls
+local_run.sh python/pycascading/cache.py gc [-s max_size] [-a max_age_days]
+
+Exports the following:
+cache_root
+tap_fingerprint
+is_complete
+mark_used
+entries
+gc
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys, time, getopt
+
+from org.apache.hadoop.fs import Path
+from org.apache.hadoop.conf import Configuration
+
+from com.twitter.pycascading import MergeJoinTap
+
+from pycascading import serializers
+
+
+# The file that marks a complete cache entry, and whose modification time is
+# the time of the last access
+_marker_file = '.pycascading_cache'
+
+# By default we keep at most this many bytes in the cache after a flow
+# has been run
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024 * 1024
+
+# Incomplete entries (from failed flows) older than this many seconds are
+# removed
+_INCOMPLETE_MAX_AGE = 24 * 60 * 60
+
+
+def cache_root():
+    """Return the folder where the cache entries are stored."""
+    from pycascading.tap import expand_path_with_home
+    return expand_path_with_home('pycascading.cache')
+
+
+def _file_system(path):
+    return path.getFileSystem(Configuration())
+
+
+def _list_files(fs, path):
+    """Recursively list all the files in path (which may be a glob)."""
+    statuses = fs.globStatus(path)
+    if statuses is None:
+        return
+    for status in statuses:
+        if status.getPath().getName()[0] in '._':
+            # Hidden files are not read by Hadoop either
+            continue
+        if status.isDir():
+            for s in _list_files(fs, Path(status.getPath(), '*')):
+                yield s
+        else:
+            yield status
+
+
+def tap_fingerprint(cascading_tap):
+    """Compute a fingerprint of the data read by a Cascading tap.
+
+    For file-based taps we use the paths, lengths, and modification times of
+    all the files read by the tap, so that the fingerprint changes whenever
+    the input data changes. For other taps we can only use their string
+    representation.
+
+    Arguments:
+    cascading_tap -- the source tap
+    """
+    if isinstance(cascading_tap, MergeJoinTap):
+        # The right side of a merge join is read, too
+        return serializers.digest(tap_fingerprint(cascading_tap.getLeft()),
+                                  tap_fingerprint(cascading_tap.getRight()))
+    try:
+        path = cascading_tap.getPath()
+    except AttributeError:
+        return serializers.digest_object(cascading_tap)
+    fs = _file_system(path)
+    files = []
+    for status in _list_files(fs, path):
+        files.append('%s:%d:%d' % (status.getPath().toUri().getPath(),
+                                   status.getLen(),
+                                   status.getModificationTime()))
+    files.sort()
+    return serializers.digest(cascading_tap.getClass().getName(),
+                              cascading_tap.getScheme().getClass().getName(),
+                              path.toString(), *files)
+
+
+def is_complete(folder):
+    """Return True if the cache entry in folder was written completely."""
+    path = Path(folder + '/' + _marker_file)
+    try:
+        return _file_system(path).getFileStatus(path) is not None
+    except:
+        return False
+
+
+def mark_used(folder):
+    """Mark the entry in folder as complete and used now.
+
+    This (re)writes the marker file, so that its modification time becomes
+    the time of the last access.
+    """
+    path = Path(folder + '/' + _marker_file)
+    fs = _file_system(path)
+    stream = fs.create(path, True)
+    stream.writeBytes('%d\n' % int(time.time()))
+    stream.close()
+
+
+def entries():
+    """Return the list of cache entries.
+
+    Each entry is a tuple of (folder, size in bytes, last use in milliseconds
+    since the epoch or None if the entry is incomplete, modification time of
+    the folder in milliseconds).
+    """
+    result = []
+    root = Path(cache_root())
+    fs = _file_system(root)
+    statuses = fs.globStatus(Path(root, '*/*'))
+    if statuses is None:
+        return result
+    for status in statuses:
+        if not status.isDir():
+            continue
+        folder = status.getPath()
+        size = fs.getContentSummary(folder).getLength()
+        try:
+            last_used = fs.getFileStatus(Path(folder, _marker_file)) \
+            .getModificationTime()
+        except:
+            last_used = None
+        result.append((folder.toString(), size, last_used,
+                       status.getModificationTime()))
+    return result
+
+
+def _delete(folder):
+    path = Path(folder)
+    _file_system(path).delete(path, True)
+
+
+def gc(max_size=DEFAULT_MAX_SIZE, max_age=None, verbose=False):
+    """Evict cache entries that were least recently used.
+
+    Incomplete entries left behind by failed flows are removed as well.
+    Then we remove entries that were not used in max_age seconds, and finally
+    the least recently used ones until the total size of the cache is at
+    most max_size.
+
+    Arguments:
+    max_size -- the maximum number of bytes to keep, or None for no limit
+    max_age -- the maximum time in seconds since the last use of an entry, or
+        None for no limit
+
+    Return:
+    the list of folders removed
+    """
+    now = time.time() * 1000
+    removed = []
+    complete = []
+    for (folder, size, last_used, modified) in entries():
+        if last_used is None:
+            if now - modified > _INCOMPLETE_MAX_AGE * 1000:
+                removed.append(folder)
+        elif max_age is not None and now - last_used > max_age * 1000:
+            removed.append(folder)
+        else:
+            complete.append((last_used, size, folder))
+    complete.sort()
+    total_size = sum([e[1] for e in complete])
+    while max_size is not None and total_size > max_size and complete:
+        (last_used, size, folder) = complete.pop(0)
+        removed.append(folder)
+        total_size -= size
+    for folder in removed:
+        if verbose:
+            print 'Removing', folder
+        _delete(folder)
+    return removed
+
+
+def _parse_size(size):
+    """Parse a size like 100, '20k', '300MB', or '2G' into bytes."""
+    if isinstance(size, (int, long)):
+        return long(size)
+    multipliers = { 'K' : 1024, 'M' : 1024 ** 2, 'G' : 1024 ** 3,
+                   'T' : 1024 ** 4 }
+    s = size.strip().upper()
+    if s.endswith('B'):
+        s = s[: -1]
+    multiplier = 1
+    if s and s[-1] in multipliers:
+        multiplier = multipliers[s[-1]]
+        s = s[: -1]
+    try:
+        return long(float(s) * multiplier)
+    except ValueError:
+        raise Exception('Invalid size: %s' % size)
+
+
+def main():
+    usage = 'Usage: cache.py ls | gc [-s max_size] [-a max_age_days]'
+    if len(sys.argv) < 2 or sys.argv[1] not in ('ls', 'gc'):
+        print usage
+        return
+    if sys.argv[1] == 'ls':
+        total_size = 0
+        for (folder, size, last_used, modified) in sorted(entries()):
+            if last_used is None:
+                used = 'incomplete'
+            else:
+                used = time.strftime('%Y-%m-%d %H:%M:%S',
+                                     time.localtime(last_used / 1000))
+            print '%s\t%d\t%s' % (folder, size, used)
+            total_size += size
+        print 'Total size:', total_size
+    else:
+        opts, args = getopt.getopt(sys.argv[2 :], 's:a:')
+        max_size = DEFAULT_MAX_SIZE
+        max_age = None
+        for (opt, value) in opts:
+            if opt == '-s':
+                max_size = _parse_size(value)
+            elif opt == '-a':
+                max_age = float(value) * 24 * 60 * 60
+        removed = gc(max_size, max_age, verbose=True)
+        print 'Removed %d cache entries' % len(removed)
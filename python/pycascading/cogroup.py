@@ -23,6 +23,7 @@ import cascading.pipe.cogroup
 import cascading.operation
 
 from pycascading.pipe import Operation, coerce_to_fields, _Stackable
+from pycascading import serializers
 
 
 class CoGroup(Operation):
@@ -54,6 +55,11 @@ class CoGroup(Operation):
         self.__args = args
         self.__kwargs = kwargs
 
+    def _digest(self):
+        return serializers.digest(self.__class__.__name__,
+                                  serializers.digest_object(self.__args),
+                                  serializers.digest_object(self.__kwargs))
+
     def __create_args(self,
                       group_name=None,
                       pipes=None, group_fields=None, declared_fields=None,
@@ -103,6 +109,29 @@ class CoGroup(Operation):
                 args.append(joiner)
         return args
 
+    def _replace_with_parent(self, parent):
+        # Inner and left outer joins of two bucketed sources are done in the
+        # mappers, if the flow finds that they are bucketed compatibly
+        kwargs = dict(self.__kwargs)
+        joiner = kwargs.pop('joiner', None)
+        declared_fields = kwargs.pop('declared_fields', None)
+        group_fields = kwargs.pop('group_fields', None)
+        if self.__args:
+            group_fields = self.__args[0]
+        flow = getattr(parent.stack[0], 'flow', None)
+        if kwargs or not group_fields or len(parent.stack) != 2 or \
+        flow is None:
+            return None
+        if joiner is None or \
+        isinstance(joiner, cascading.pipe.cogroup.InnerJoin):
+            left_outer = False
+        elif isinstance(joiner, cascading.pipe.cogroup.LeftJoin):
+            left_outer = True
+        else:
+            return None
+        return flow._merge_join(parent.stack, group_fields, declared_fields,
+                                left_outer)
+
     def _create_with_parent(self, parent):
         if isinstance(parent, _Stackable):
             args = self.__create_args(pipes=parent.stack, **self.__kwargs)
@@ -48,6 +48,7 @@ python_dict_expected
 collects_output
 produces_python_list
 produces_tuples
+selectivity
 udf_filter
 udf_map
 udf_buffer
@@ -181,6 +182,21 @@ def produces_tuples(*args, **kwargs):
     CascadingRecordProducerWrapper.OutputType.TUPLE })
 
 
+def selectivity(ratio, *args, **kwargs):
+    """The function outputs about ratio times as much data as it gets.
+
+    This is a hint for choosing the number of reducers when the flow is run
+    with num_reducers='auto'. For instance a filter that keeps one tuple in
+    ten has a selectivity of 0.1, and a map that emits five words for each
+    line has a selectivity of about 5. Functions without this hint are
+    assumed to output as much data as they get.
+
+    Arguments:
+    ratio -- the estimated ratio of the sizes of the outputs and the inputs
+    """
+    return _function_decorator(args, kwargs, { 'selectivity' : ratio })
+
+
 def udf_filter(*args, **kwargs):
     """This makes the function a filter.
 
@@ -30,11 +30,12 @@ import cascading.pipe
 from cascading.tuple import Fields
 
 from com.twitter.pycascading import CascadingFunctionWrapper, \
-CascadingFilterWrapper
+CascadingFilterWrapper, CascadingBaseOperationWrapper
 
 from pycascading.pipe import Operation, coerce_to_fields, wrap_function, \
 random_pipe_name, DecoratedFunction
 from pycascading.decorators import udf
+from pycascading import serializers
 
 
 class _Each(Operation):
@@ -74,9 +75,18 @@ class _Each(Operation):
         else:
             raise Exception('The number of parameters to Apply/Filter ' \
                             'should be between 1 and 3')
+        # We keep the original function to fingerprint the operation
+        self.__python_function = self.__function
         # This is the Cascading Function type
         self.__function = wrap_function(self.__function, function_type)
 
+    def _digest(self):
+        return serializers.digest(self.__class__.__name__,
+                                  serializers.digest_object(
+                                  (self.__argument_selector,
+                                   self.__python_function,
+                                   self.__output_selector)))
+
     def _create_with_parent(self, parent):
         args = []
         if self.__argument_selector:
@@ -88,7 +98,11 @@ class _Each(Operation):
         # joins may not work as the names of pipes apparently have to be
         # different for Cascading.
         each = cascading.pipe.Each(parent.get_assembly(), *args)
-        return cascading.pipe.Pipe(random_pipe_name('each'), each)
+        name = random_pipe_name('each')
+        if isinstance(self.__function, CascadingBaseOperationWrapper):
+            # The instrumentation counters are named after the pipe
+            self.__function.setName(name)
+        return cascading.pipe.Pipe(name, each)
 
 
 class Apply(_Each):
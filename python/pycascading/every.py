@@ -25,10 +25,11 @@ import cascading.operation
 from cascading.tuple import Fields
 
 from com.twitter.pycascading import CascadingAggregatorWrapper, \
-CascadingBufferWrapper
+CascadingBufferWrapper, CascadingBaseOperationWrapper
 
 from pycascading.pipe import Operation, coerce_to_fields, wrap_function, \
-random_pipe_name, DecoratedFunction, _Stackable
+DecoratedFunction, _Stackable
+from pycascading import serializers
 
 
 class Every(Operation):
@@ -60,6 +61,11 @@ class Every(Operation):
         self.__args = args
         self.__kwargs = kwargs
 
+    def _digest(self):
+        return serializers.digest(self.__class__.__name__,
+                                  serializers.digest_object(self.__args),
+                                  serializers.digest_object(self.__kwargs))
+
     def __create_args(self,
                       pipe=None,
                       aggregator=None, output_selector=None,
@@ -89,21 +95,31 @@ class Every(Operation):
             args.append(coerce_to_fields(argument_selector))
         if aggregator is not None:
             # for now we assume it's a Cascading aggregator straight
-            args.append(wrap_function(aggregator, CascadingAggregatorWrapper))
+            # Native aggregators are wrapped to count the group sizes only
+            # if the flow is run with the skew report (see tap.Flow)
+            aggregator = wrap_function(aggregator, CascadingAggregatorWrapper)
+            args.append(aggregator)
             if output_selector:
                 args.append(coerce_to_fields(output_selector))
         if assertion_level is not None:
             args.append(assertion_level)
             args.append(assertion)
         if buffer is not None:
-            args.append(wrap_function(buffer, CascadingBufferWrapper))
+            buffer = wrap_function(buffer, CascadingBufferWrapper)
+            args.append(buffer)
             if output_selector:
                 args.append(coerce_to_fields(output_selector))
         return args
 
     def _create_with_parent(self, parent):
         args = self.__create_args(pipe=parent, **self.__kwargs)
-        return cascading.pipe.Every(*args)
+        every = cascading.pipe.Every(*args)
+        operation = every.getOperation()
+        if isinstance(operation, CascadingBaseOperationWrapper):
+            # The instrumentation counters are named after the Every pipe,
+            # so that explain can find them
+            operation.setName(every.getName())
+        return every
 
 
 class GroupBy(Operation):
@@ -131,6 +147,11 @@ class GroupBy(Operation):
         self.__args = args
         self.__kwargs = kwargs
 
+    def _digest(self):
+        return serializers.digest(self.__class__.__name__,
+                                  serializers.digest_object(self.__args),
+                                  serializers.digest_object(self.__kwargs))
+
     def __create_args(self,
                       group_name=None,
                       pipes=None, group_fields=None, sort_fields=None,
@@ -176,9 +197,15 @@ class GroupBy(Operation):
 
 
 class _DelayedInitialization(Operation):
-    def __init__(self, callback):
+    def __init__(self, callback, *digest_parts):
         Operation.__init__(self)
         self.__callback = callback
+        self.__digest_parts = digest_parts
+
+    def _digest(self):
+        return serializers.digest(
+            '_DelayedInitialization',
+            serializers.digest_object(self.__digest_parts))
 
     def _create_with_parent(self, parent):
         return self.__callback(parent).get_assembly()
@@ -230,11 +257,12 @@ def group_by(*args, **kwargs):
             else:
                 return parent | GroupBy(**kwargs) | \
                     Every(df, argument_selector=input_selector)
-        return _DelayedInitialization(pipe)
+        return _DelayedInitialization(pipe, grouping_fields, input_selector,
+                                      df, kwargs)
     else:
         def pipe(parent):
             if grouping_fields:
                 return parent | GroupBy(grouping_fields, **kwargs)
             else:
                 return parent | GroupBy(**kwargs)
-        return _DelayedInitialization(pipe)
+        return _DelayedInitialization(pipe, grouping_fields, kwargs)
@@ -0,0 +1,411 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Inspect the plan of a flow, with the MapReduce steps it will run.
+
+Use Flow.explain() to print the plan of a flow and write it as a DOT graph.
+The operations are assigned to the MapReduce steps that Cascading planned,
+by looking them up in the graphs of the steps. The operations after the
+GroupBy or CoGroup of a step run in its reducers, and the others in its
+mappers. An operation before a split may run in the mappers of several
+steps. If the graphs of the steps are not accessible in the version of
+Cascading used, the steps are derived from the pipe assembly following the
+rules of the planner instead.
+
+The Python operations are shown with the conversion of their input tuples
+and the way they produce their outputs. If the flow has been run, the
+measured durations and record counts of the steps are shown as well, and
+the times spent in the Python operations if they were instrumented. If the
+numbers of reducers were chosen automatically, they are shown with the
+estimated amounts of data shuffled in the steps.
+
+Exports the following:
+Plan
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+from java.util import IdentityHashMap
+
+import cascading.pipe
+import cascading.tap
+
+from com.twitter.pycascading import Util, CascadingBaseOperationWrapper, \
+CascadingRecordProducerWrapper, CascadingFilterWrapper, GroupSkewAggregator
+
+
+# The counters of the records in the Hadoop jobs
+_RECORD_COUNTERS = [('map in', 'Map input records'),
+                    ('map out', 'Map output records'),
+                    ('reduce in', 'Reduce input records'),
+                    ('reduce out', 'Reduce output records')]
+
+
+class _Node(object):
+
+    """An element of the pipe assembly: a source, an operation, or a sink."""
+
+    def __init__(self, kind, label, details=None, name=None, tap=None,
+                 selectivity=None):
+        self.kind = kind
+        self.label = label
+        self.details = details or []
+        # The name of the pipe of a Python operation, used for its counters
+        self.name = name
+        # The tap of a source or a sink
+        self.tap = tap
+        # The estimated ratio of the output and input sizes of an operation
+        self.selectivity = selectivity
+        # The first step the node runs in, and all the steps it runs in
+        self.step = None
+        self.steps = []
+        self.side = None
+
+
+class Plan(object):
+
+    """The plan of a flow, with its elements grouped into MapReduce steps."""
+
+    def __init__(self, tails, sources, sinks, cascading_flow, handle=None):
+        """Build the plan.
+
+        Arguments:
+        tails -- the Cascading tail pipes of the flow
+        sources -- the source taps mapped from the names of the head pipes
+        sinks -- the sink taps mapped from the names of the tail pipes
+        cascading_flow -- the Cascading Flow planned from the tails
+        handle -- the FlowHandle of a run of the flow, whose measurements are
+            added to the plan, or None
+        """
+        self.sources = sources
+        self.sinks = sinks
+        self.nodes = []
+        self.edges = []
+        self.__ids = IdentityHashMap()
+        # The source and sink taps mapped to their nodes
+        self.__taps = IdentityHashMap()
+        for tail in tails:
+            index = self.__visit(tail)
+            sink = _Node('sink', 'sink', [_tap_name(tail.getName(), sinks)],
+                         tap=sinks.get(tail.getName()))
+            self.__add(sink, [index])
+        # The FlowSteps that the steps of the plan are, or None if the steps
+        # were derived from the assembly
+        self.steps = list(cascading_flow.getSteps())
+        self.step_names = [str(step.getName()) for step in self.steps]
+        if not self.__assign_flow_steps():
+            self.steps = None
+            self.__assign_steps()
+        self.measured = None
+        self.udf_stats = {}
+        # The numbers of reducers and the estimated bytes shuffled in the
+        # steps, if they were chosen with auto_reducers
+        self.reducers = None
+        self.shuffle_bytes = None
+        self.estimated_shuffle_bytes = None
+        if handle is not None:
+            self.add_measurements(handle)
+
+    def add_measurements(self, handle):
+        """Show the measurements of a run of the flow in the plan.
+
+        Arguments:
+        handle -- the FlowHandle of the run
+        """
+        self.measured = handle.step_measurements()
+        import tap
+        self.udf_stats = dict(tap.udf_report(handle.counters()))
+
+    def __add(self, node, previous):
+        index = len(self.nodes)
+        self.nodes.append(node)
+        if node.tap is not None:
+            self.__taps.put(node.tap, index)
+        for p in previous:
+            self.edges.append((p, index))
+        return index
+
+    def __visit(self, pipe):
+        """Add the node of a pipe after its predecessors, return its index."""
+        if isinstance(pipe, cascading.pipe.SubAssembly):
+            return self.__visit(pipe.getTails()[0])
+        if self.__ids.containsKey(pipe):
+            return self.__ids.get(pipe)
+        previous = [self.__visit(p) for p in pipe.getPrevious()]
+        if pipe.getClass().getName() == 'cascading.pipe.Pipe' and previous:
+            # Plain pipes only name the streams, we skip them
+            index = previous[0]
+        else:
+            index = self.__add(_describe(pipe, self.sources), previous)
+        self.__ids.put(pipe, index)
+        return index
+
+    def __element_index(self, element):
+        """Return the index of the node of a pipe or tap, or None."""
+        if isinstance(element, cascading.tap.Tap):
+            if self.__taps.containsKey(element):
+                return self.__taps.get(element)
+        elif isinstance(element, cascading.pipe.Pipe) and \
+        self.__ids.containsKey(element):
+            # The plain pipes after the heads are not nodes, they only have
+            # the index of their predecessors
+            if element.getClass().getName() != 'cascading.pipe.Pipe' or \
+            not element.getPrevious():
+                return self.__ids.get(element)
+        return None
+
+    def __assign_flow_steps(self):
+        """Put the nodes into the steps planned by Cascading.
+
+        The pipes and taps in the graph of every FlowStep are looked up among
+        the nodes. A node after the group of its step runs in the reducers,
+        the others in the mappers. The nodes that are not in the graphs run
+        where their predecessors, or else their successors, run.
+
+        Return:
+        False if the graphs of the steps are not accessible
+        """
+        for (i, step) in enumerate(self.steps):
+            elements = Util.getStepElements(step)
+            if elements is None:
+                return False
+            for element in elements:
+                index = self.__element_index(element)
+                if index is not None and i not in self.nodes[index].steps:
+                    self.nodes[index].steps.append(i)
+        predecessors = [[] for n in self.nodes]
+        successors = [[] for n in self.nodes]
+        for (p, s) in self.edges:
+            predecessors[s].append(p)
+            successors[p].append(s)
+        for (i, node) in enumerate(self.nodes):
+            if not node.steps:
+                for p in predecessors[i]:
+                    if self.nodes[p].steps:
+                        node.steps = list(self.nodes[p].steps)
+                        break
+        for i in xrange(len(self.nodes) - 1, -1, -1):
+            node = self.nodes[i]
+            if not node.steps:
+                for s in successors[i]:
+                    if self.nodes[s].steps:
+                        node.steps = list(self.nodes[s].steps)
+                        break
+        # The nodes are in topological order, so the sides of the
+        # predecessors are known
+        for (i, node) in enumerate(self.nodes):
+            if not node.steps:
+                continue
+            node.step = node.steps[0]
+            if node.kind == 'group':
+                node.side = 'shuffle'
+            elif [p for p in predecessors[i]
+                  if self.nodes[p].step == node.step and
+                  self.nodes[p].side in ('shuffle', 'reduce')]:
+                node.side = 'reduce'
+            else:
+                node.side = 'map'
+        self.num_steps = len(self.steps)
+        return True
+
+    def __assign_steps(self):
+        """Put every node into a step, and on the map or reduce side of it.
+
+        The nodes are in topological order. A node after a group runs in the
+        reducers of the last group before it, and the other nodes run in the
+        mappers of the first group or sink after them. Flows without groups
+        are planned into map-only steps, one for each sink.
+        """
+        predecessors = [[] for n in self.nodes]
+        successors = [[] for n in self.nodes]
+        for (p, s) in self.edges:
+            predecessors[s].append(p)
+            successors[p].append(s)
+        upstream = [None] * len(self.nodes)
+        for i in xrange(len(self.nodes)):
+            if self.nodes[i].kind == 'group':
+                upstream[i] = i
+            else:
+                groups = [upstream[p] for p in predecessors[i]
+                          if upstream[p] is not None]
+                if groups:
+                    upstream[i] = groups[0]
+        downstream = [None] * len(self.nodes)
+        for i in xrange(len(self.nodes) - 1, -1, -1):
+            if self.nodes[i].kind in ('group', 'sink'):
+                downstream[i] = i
+            else:
+                boundaries = [downstream[s] for s in successors[i]
+                              if downstream[s] is not None]
+                if boundaries:
+                    downstream[i] = min(boundaries)
+        # The steps are numbered in the order of their groups or sinks
+        keys = []
+        for (i, node) in enumerate(self.nodes):
+            if node.kind == 'group':
+                key = i
+                node.side = 'shuffle'
+            elif upstream[i] is not None:
+                key = upstream[i]
+                node.side = 'reduce'
+            else:
+                key = downstream[i]
+                node.side = 'map'
+            node.step = key
+            if key not in keys and (key == i or node.kind == 'sink'):
+                keys.append(key)
+        steps = {}
+        keys.sort()
+        for key in keys:
+            steps[key] = len(steps)
+        for node in self.nodes:
+            node.step = steps.get(node.step)
+            if node.step is not None:
+                node.steps = [node.step]
+        self.num_steps = len(keys)
+
+    def __step_title(self, step):
+        """Return the name of a step, and its measurements if available."""
+        title = 'Step %d' % (step + 1)
+        if len(self.step_names) == self.num_steps:
+            title += ': %s' % self.step_names[step]
+        if self.reducers and self.reducers[step] is not None:
+            title += ', %d reducers' % self.reducers[step]
+            if self.shuffle_bytes[step] is not None:
+                title += ' for %.1f MB' % \
+                (self.shuffle_bytes[step] / 1048576.0)
+        if self.measured and len(self.measured) == self.num_steps:
+            (name, duration, records) = self.measured[step]
+            measures = ['%.1f s' % (duration / 1000.0)]
+            for (label, counter) in _RECORD_COUNTERS:
+                if counter in records:
+                    measures.append('%s %d' % (label, records[counter]))
+            title += ' [%s]' % ', '.join(measures)
+        return title
+
+    def __node_details(self, node):
+        details = list(node.details)
+        stats = self.udf_stats.get(node.name)
+        if stats:
+            details.append('%d calls, function %d ms, conversions %d ms' %
+                           (stats.get('calls', 0),
+                            stats.get('function (us)', 0) / 1000,
+                            (stats.get('input conversion (us)', 0) +
+                             stats.get('output conversion (us)', 0)) / 1000))
+        return details
+
+    def text(self):
+        """Return the plan as text, with the nodes listed by steps."""
+        num_shuffles = len([n for n in self.nodes if n.kind == 'group'])
+        num_python = len([n for n in self.nodes if n.name is not None])
+        lines = ['Flow plan: %d MapReduce steps, %d shuffles, '
+                 '%d Python operations' %
+                 (len(self.step_names), num_shuffles, num_python)]
+        if len(self.step_names) != self.num_steps:
+            lines.append('Cascading planned %d steps instead of %d, the '
+                         'operations may run in other steps than shown' %
+                         (len(self.step_names), self.num_steps))
+        for step in xrange(self.num_steps):
+            lines.append('')
+            lines.append(self.__step_title(step))
+            for node in self.nodes:
+                if step in node.steps:
+                    lines.append('  %-8s %s' % (node.side, ' '.join(
+                        [node.label] + self.__node_details(node))))
+        return '\n'.join(lines)
+
+    def dot(self):
+        """Return the plan as a graph in the DOT language."""
+        lines = ['digraph G {', '  node [fontsize=10];']
+        for step in xrange(self.num_steps):
+            lines.append('  subgraph cluster_%d {' % step)
+            lines.append('    label="%s";' % _escape(self.__step_title(step)))
+            for (i, node) in enumerate(self.nodes):
+                if node.step == step:
+                    lines.append('    n%d [label="%s", shape=%s%s];' %
+                                 (i, _escape('\n'.join(
+                                 [node.label] + self.__node_details(node))),
+                                  _SHAPES[node.kind],
+                                  node.name is not None and ', style=filled'
+                                  or ''))
+            lines.append('  }')
+        for (p, s) in self.edges:
+            lines.append('  n%d -> n%d;' % (p, s))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+
+# The shapes of the nodes in the DOT graph
+_SHAPES = { 'source' : 'box', 'sink' : 'box', 'each' : 'ellipse',
+            'every' : 'ellipse', 'group' : 'diamond' }
+
+
+def _escape(s):
+    return s.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _tap_name(pipe_name, taps):
+    """Return the name of a pipe with the path of its tap if it has one."""
+    tap = taps.get(pipe_name)
+    if tap is not None and hasattr(tap, 'getPath'):
+        return '%s (%s)' % (pipe_name, tap.getPath())
+    return pipe_name
+
+
+def _describe_operation(operation):
+    """Return the label, details, name, and selectivity of an operation."""
+    if isinstance(operation, GroupSkewAggregator):
+        operation = operation.getAggregator()
+    if not isinstance(operation, CascadingBaseOperationWrapper):
+        return (operation.getClass().getSimpleName(), [], None, None)
+    if isinstance(operation, CascadingFilterWrapper):
+        label = 'Python filter'
+    else:
+        label = 'Python function'
+    details = ['input: %s' % operation.getConvertInputTuples()]
+    if isinstance(operation, CascadingRecordProducerWrapper):
+        details.append('output: %s %s' % (operation.getOutputMethod(),
+                                          operation.getOutputType()))
+    selectivity = operation.getSelectivity()
+    if selectivity is not None:
+        details.append('selectivity %g' % selectivity)
+    name = operation.getName()
+    if name:
+        details.insert(0, name)
+    return (label, details, name or '', selectivity)
+
+
+def _describe(pipe, sources):
+    """Return the node describing a pipe."""
+    if isinstance(pipe, cascading.pipe.Group):
+        fields = [str(f) for f in pipe.getGroupingSelectors().values()]
+        return _Node('group', pipe.getClass().getSimpleName(),
+                     [pipe.getName(), 'on ' + ', '.join(fields)])
+    elif isinstance(pipe, cascading.pipe.Each):
+        (label, details, name, selectivity) = \
+        _describe_operation(pipe.getOperation())
+        return _Node('each', 'Each ' + label, details, name,
+                     selectivity=selectivity)
+    elif isinstance(pipe, cascading.pipe.Every):
+        (label, details, name, selectivity) = \
+        _describe_operation(pipe.getOperation())
+        return _Node('every', 'Every ' + label, details, name,
+                     selectivity=selectivity)
+    elif not pipe.getPrevious():
+        return _Node('source', 'source', [_tap_name(pipe.getName(), sources)],
+                     tap=sources.get(pipe.getName()))
+    else:
+        return _Node('each', pipe.getClass().getSimpleName(), [pipe.getName()])
@@ -0,0 +1,224 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Incremental processing of the files added to a folder since the last run.
+
+A source created with flow.source(tap, incremental=state_path) only reads the
+files in the folder of the tap that the earlier successful runs of the flow
+haven't read. The state file at state_path lists the size, the modification
+time, and the path of every file read, one file in a line. It is updated
+only after the flow finished successfully, so a failed run reads the same
+files again the next time. A file whose size or modification time changed
+since it was read is read again.
+
+The aggregates of the new files can be merged into the output of the last
+run with merge_aggregates():
+
+flow = Flow()
+logs = flow.source(Hfs(TextLine(), 'logs'), incremental='logs.state')
+counts = logs | map_replace(parse, 'user') | group_by('user', count('n'))
+merged = merge_aggregates(counts, 'counts/%d' % (hour - 1), 'user',
+                          { 'n' : 'sum' })
+merged | flow.binary_sink('counts/%d' % hour)
+flow.run()
+
+Exports the following:
+NoNewInput
+new_files
+commit
+merge_aggregates
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+from java.io import BufferedReader, InputStreamReader
+from java.lang import String
+
+from cascading.tuple import Fields
+
+from org.apache.hadoop.fs import Path
+from org.apache.hadoop.conf import Configuration
+
+from pycascading import cache
+
+
+class NoNewInput(Exception):
+
+    """Raised when an incremental source has no new files to read."""
+
+    pass
+
+
+def _read_state(fs, path):
+    """Return the files in the state file mapped to their sizes and times.
+
+    If commit() was interrupted, the complete new state is read if it was
+    written, and the old state is read if the state file was moved away.
+    """
+    state = {}
+    for name in ['.new', '', '.old']:
+        if fs.exists(Path(path.toString() + name)):
+            path = Path(path.toString() + name)
+            break
+    else:
+        return state
+    reader = BufferedReader(InputStreamReader(fs.open(path), 'UTF-8'))
+    try:
+        while True:
+            line = reader.readLine()
+            if line is None:
+                break
+            (size, mtime, file_path) = line.split('\t', 2)
+            state[file_path] = (long(size), long(mtime))
+    finally:
+        reader.close()
+    return state
+
+
+def new_files(folder, state_path):
+    """Return the files in a folder that were not read by earlier runs.
+
+    Arguments:
+    folder -- the folder of the source, whose subfolders are also read
+    state_path -- the state file of the source
+
+    Return:
+    the list of FileStatuses of the new files
+    """
+    path = Path(folder)
+    fs = path.getFileSystem(Configuration())
+    if not fs.exists(path) or not fs.getFileStatus(path).isDir():
+        raise Exception('Incremental sources must read a folder: %s' % folder)
+    state = _read_state(fs, Path(state_path))
+    result = []
+    for status in cache._list_files(fs, path):
+        done = state.get(status.getPath().toUri().getPath())
+        if done != (status.getLen(), status.getModificationTime()):
+            result.append(status)
+    return result
+
+
+def commit(state_path, statuses):
+    """Record in the state file that the files were read successfully.
+
+    The new state is written into a temporary file first, which is renamed
+    to state_path.new when it is complete. Then the state file is renamed to
+    state_path.old, and the new state to the state file. Renames are atomic,
+    so if the commit is interrupted, a complete state, either the new or the
+    old one, is always kept, and is read by _read_state.
+
+    Arguments:
+    state_path -- the state file of the source
+    statuses -- the FileStatuses of the files read
+    """
+    path = Path(state_path)
+    fs = path.getFileSystem(Configuration())
+    state = _read_state(fs, path)
+    for status in statuses:
+        state[status.getPath().toUri().getPath()] = \
+        (status.getLen(), status.getModificationTime())
+    file_paths = state.keys()
+    file_paths.sort()
+    temp_path = Path(state_path + '.tmp')
+    stream = fs.create(temp_path, True)
+    try:
+        for file_path in file_paths:
+            (size, mtime) = state[file_path]
+            line = '%d\t%d\t%s\n' % (size, mtime, file_path)
+            stream.write(String(line).getBytes('UTF-8'))
+    finally:
+        stream.close()
+    new_path = Path(state_path + '.new')
+    old_path = Path(state_path + '.old')
+    fs.delete(new_path, False)
+    if not fs.rename(temp_path, new_path):
+        raise Exception('Could not write the state file %s' % new_path)
+    if fs.exists(path):
+        fs.delete(old_path, False)
+        if not fs.rename(path, old_path):
+            raise Exception('Could not move the state file %s' % state_path)
+    if not fs.rename(new_path, path):
+        raise Exception('Could not write the state file %s' % state_path)
+    fs.delete(old_path, False)
+
+
+# The ways the aggregates of the same key can be combined
+_COMBINERS = { 'sum' : lambda a, b: a + b,
+               'min' : min,
+               'max' : max }
+
+
+def _merge_group(group, tuples, fields, methods):
+    """Combine the aggregates of the tuples of a group.
+
+    The output tuple has the same fields as the input tuples, so that it can
+    be merged with the aggregates of the next run again.
+    """
+    result = None
+    for tuple in tuples:
+        if result is None:
+            # The iterator reuses its TupleEntry, so we copy the values
+            result = [tuple.get(i) for i in xrange(tuple.size())]
+            positions = [tuple.getFields().getPos(f) for f in fields]
+            continue
+        for (pos, method) in zip(positions, methods):
+            value = tuple.get(pos)
+            if result[pos] is None:
+                result[pos] = value
+            elif value is not None:
+                result[pos] = _COMBINERS[method](result[pos], value)
+    yield result
+
+
+def merge_aggregates(pipe, previous_path, key_fields, aggregates):
+    """Merge new per-key aggregates into the output of the previous run.
+
+    The tuples of pipe and the tuples in previous_path are grouped by the key
+    fields, and the aggregates of the same key are combined. Both must have
+    the same fields in the same order, and the result has the same fields,
+    too. The result has to be written into a different folder than
+    previous_path.
+
+    Arguments:
+    pipe -- the aggregates of the new input, with the key fields and the
+        aggregate fields
+    previous_path -- the folder written by a meta sink in the previous run.
+        If it doesn't exist, only the new aggregates are used.
+    key_fields -- the names of the key fields
+    aggregates -- a dict of the names of the aggregate fields mapped to how
+        they are combined: 'sum', 'min', or 'max'
+
+    Return:
+    a pipe with the merged aggregates, with one tuple for each key
+    """
+    from pycascading.tap import expand_path_with_home
+    from pycascading.pipe import coerce_to_fields
+    from pycascading.every import GroupBy
+    from pycascading.decorators import udf_buffer
+    fields = aggregates.keys()
+    fields.sort()
+    methods = [aggregates[f] for f in fields]
+    unknown = [m for m in methods if m not in _COMBINERS]
+    if unknown:
+        raise Exception('Unknown ways to combine aggregates: %s' % \
+                        ', '.join(map(str, unknown)))
+    previous_path = expand_path_with_home(previous_path)
+    path = Path(previous_path)
+    if path.getFileSystem(Configuration()).exists(path):
+        pipe = pipe.flow.meta_source(previous_path) & pipe
+    key_fields = [str(f) for f in coerce_to_fields(key_fields)]
+    merge = udf_buffer(produces=Fields.ARGS)(_merge_group)
+    return pipe | GroupBy(key_fields) | merge(fields, methods)
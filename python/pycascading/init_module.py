@@ -19,6 +19,11 @@ The module that gets loaded first when a Cascading pipeline is deserialized.
 PyCascading needs to start a Jython interpreter whenever a mapper or reducer
 executes Python code, so we need to start an interpreter, set up the
 environment, and load the job's source code.
+
+By default only the functions, modules, and values that the user-defined
+functions depend on are loaded, instead of running the whole main script of
+the job. Setting the pycascading.load_main_file parameter to True runs the
+main script as a whole.
 """
 
 __author__ = 'Gabor Szabo'
@@ -39,6 +44,11 @@ def setup_paths(module_paths):
     specify the archives of the PyCascading sources and the job sources,
     respectively.
 
+    The archives contain the modules precompiled to Jython bytecode as well.
+    Jython imports a $py.class file instead of compiling the source if it is
+    newer than the source, and the archives preserve the modification times,
+    so the precompiled modules are used on the workers.
+
     Arguments:
     module_paths -- the locations of the Python sources 
     """
@@ -60,3 +70,87 @@ def setup_paths(module_paths):
     # Maybe it's automatically imported in the beginning of a Jython program,
     # but since at that point the sys.path is not set yet to Lib, it will fail?
     #import encodings
+
+
+def load_main_file(file_name):
+    """Run the main PyCascading script in the interpreter's namespace.
+
+    If there is an up-to-date precompiled version of the script next to it
+    ($py.class), we run that instead of compiling the source. execfile() would
+    always compile it.
+
+    Arguments:
+    file_name -- the path to the main script
+    """
+    import os
+    from java.io import FileInputStream
+    from java.lang import Throwable
+    from org.python.core import BytecodeLoader
+    from org.python.core import imp as core_imp
+
+    global main_file_loaded
+    main_file_loaded = True
+    (base, ext) = os.path.splitext(file_name)
+    compiled = base + '$py.class'
+    if ext == '.py' and os.path.exists(compiled) and \
+    os.path.getmtime(compiled) >= os.path.getmtime(file_name):
+        try:
+            stream = FileInputStream(compiled)
+            try:
+                data = core_imp.readCode(file_name, stream, True)
+            finally:
+                stream.close()
+            if data is not None:
+                # The class is named after the module the script was compiled
+                # as, which is its base name
+                module_name = os.path.basename(base)
+                code = BytecodeLoader.makeCode(module_name + '$py', data,
+                                               file_name)
+                exec code in globals()
+                return
+        except (Exception, Throwable):
+            # Fall back to compiling the source
+            pass
+    execfile(file_name, globals())
+
+
+def _import_module(module_name):
+    """Import a module or a Java package by its dotted name and return it."""
+    module = __import__(module_name)
+    for part in module_name.split('.')[1 :]:
+        module = getattr(module, part)
+    return module
+
+
+def load_function_scope(dependencies):
+    """Define the global names that a user-defined function depends on.
+
+    The dependencies are captured by serializers.function_dependencies when
+    the flow is built. If they could not be captured, we run the whole main
+    script instead, once per task.
+
+    Arguments:
+    dependencies -- the tuple of dependencies, or None
+    """
+    import cPickle
+
+    if dependencies is None:
+        if not main_file_loaded:
+            load_main_file(main_file)
+        return
+    namespace = globals()
+    for dependency in dependencies:
+        (kind, name) = dependency[0 : 2]
+        if kind == 'module':
+            namespace[name] = _import_module(dependency[2])
+        elif kind == 'import':
+            namespace[name] = getattr(_import_module(dependency[2]),
+                                      dependency[3])
+        elif kind == 'value':
+            namespace[name] = cPickle.loads(dependency[2])
+        elif kind == 'source':
+            exec dependency[2] in namespace
+            if name != dependency[3]:
+                namespace[name] = namespace[dependency[3]]
+        else:
+            raise Exception('Unknown dependency type: %s' % kind)
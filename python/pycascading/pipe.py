@@ -138,6 +138,8 @@ def wrap_function(function, casc_function_type):
             fw.setOutputType(decorators['output_type'])
         fw.setContextArgs(decorators['args'])
         fw.setContextKwArgs(decorators['kwargs'])
+        if decorators.get('selectivity') is not None:
+            fw.setSelectivity(float(decorators['selectivity']))
     else:
         # When function is a pure Python function, declared without decorators
         fw = casc_function_type()
@@ -159,10 +161,19 @@ class _Stackable(object):
         return result
 
     def __or__(self, other):
-        result = Chainable()
-        result._assembly = other._create_with_parent(self)
-        for s in self.stack:
-            result.add_context(s.context)
+        result = other._replace_with_parent(self)
+        if result is None:
+            result = Chainable()
+            result._assembly = other._create_with_parent(self)
+            for s in self.stack:
+                result.add_context(s.context)
+                if result.flow is None:
+                    result.flow = getattr(s, 'flow', None)
+        digest = other._digest()
+        stack = self.stack
+        result.hash = lambda: serializers.digest(digest,
+                                                 *[getattr(s, 'hash', '') \
+                                                   for s in stack])
         return result
 
 
@@ -170,11 +181,31 @@ class Chainable(_Stackable):
 
     """An object that can be chained with '|' operations."""
 
+    # Whether the flow may automatically cache the output of a grouping
+    # before this operation is applied to it
+    _accepts_auto_cache = True
+
     def __init__(self):
         _Stackable.__init__(self)
         self._assembly = None
         self.context = set()
-        self.hash = 0
+        # A fingerprint of the upstream pipeline that results in this object
+        self.hash = ''
+        # The Flow whose sources this pipeline reads from
+        self.flow = None
+
+    def _get_hash(self):
+        if callable(self._hash):
+            self._hash = self._hash()
+        return self._hash
+
+    def _set_hash(self, value):
+        self._hash = value
+
+    # The fingerprint may be set to a function that computes it. It is then
+    # only computed when it is needed by a cache, since the fingerprints of
+    # the sources list all their files.
+    hash = property(_get_hash, _set_hash)
 
     def add_context(self, ctx):
         # TODO: see if context is indeed needed
@@ -205,11 +236,59 @@ class Chainable(_Stackable):
         elif inspect.isroutine(other):
             other = DecoratedFunction.decorate_function(other)
         if isinstance(other, Chainable):
+            if self._auto_cache_before(other):
+                # Replace the expensive pipeline by its cached results
+                return (self.flow.cache() | self) | other
             result._assembly = other._create_with_parent(self)
             result.add_context(self.context)
-            result.hash = self.hash ^ hash(result._assembly)
+            result.flow = self.flow
+            digest = other._digest()
+            result.hash = lambda: serializers.digest(self.hash, digest)
         return result
 
+    def _auto_cache_before(self, other):
+        """Decide if our output should be cached before applying other.
+
+        If the flow was created with auto_cache, we cache the results of
+        groupings and joins as soon as the reduce side operations are over,
+        since these are the expensive parts of a pipeline. An Every must
+        follow its grouping or another Every, so we never cache before
+        aggregators and buffers, only after the last Every of a group.
+        """
+        if self.flow is None or not self.flow.auto_cache or \
+        not other._accepts_auto_cache:
+            return False
+        import every
+        if isinstance(other, every.Every):
+            # other is going to be applied to the groups
+            return False
+        if isinstance(other, DecoratedFunction) and \
+        other.decorators['type'] in ('buffer', 'auto'):
+            return False
+        return isinstance(self.get_assembly(), (cascading.pipe.Every,
+                                                cascading.pipe.GroupBy,
+                                                cascading.pipe.CoGroup))
+
+    def _replace_with_parent(self, parent):
+        """Return a pipe with the result of this operation applied to parent.
+
+        Operations that can be done differently depending on their inputs,
+        such as the joins of bucketed sources that are done in the mappers,
+        return the pipe that computes their result. Otherwise None is
+        returned, and the operation is applied to parent with
+        _create_with_parent.
+        """
+        return None
+
+    def _digest(self):
+        """Return the fingerprint of this operation without its parents.
+
+        Subclasses should include everything in the digest that influences
+        the results of the operation, such as the user-defined functions,
+        their parameters, and the field selectors.
+        """
+        return serializers.digest(self.__class__.__name__)
+
     def _create_without_parent(self):
         """Called when the Chainable is the first member of a chain.
 
@@ -239,6 +318,9 @@ class Pipe(Chainable):
     is a sink).
     """
 
+    # Pipes only name branches, so we don't want to cache before them
+    _accepts_auto_cache = False
+
     def __init__(self, name=None, *args):
         Chainable.__init__(self)
         if name:
@@ -297,6 +379,9 @@ class DecoratedFunction(Operation):
             self.decorators['kwargs'] = kwargs
         return self
 
+    def _digest(self):
+        return serializers.digest_object(self)
+
     def _create_with_parent(self, parent):
         """
         Use the appropriate operation when the function is used in the pipe.
@@ -379,9 +464,15 @@ class SubAssembly(Operation):
         *args -- parameters passed on to the subassembly's constructor when
             it's initialized
         """
+        Operation.__init__(self)
         self.__sub_assembly_class = sub_assembly_class
         self.__args = args
 
+    def _digest(self):
+        return serializers.digest('SubAssembly',
+                                  self.__sub_assembly_class.__name__,
+                                  serializers.digest_object(self.__args))
+
     def _create_with_parent(self, parent):
         pipe = self.__sub_assembly_class(parent.get_assembly(), *self.__args)
         tails = pipe.getTails()
@@ -23,14 +23,23 @@ This module will serialize a Python function in one of two ways:
 * if the function is scoped locally (nested), we grab its source so that it
   can be reloaded on deserialization.
 
+Together with the function, we also serialize the global names it depends on:
+the modules and objects it imports, the other functions and classes defined in
+the main script, and constant values. The workers rebuild only this minimal
+namespace instead of running the whole main script, unless some dependency
+cannot be serialized, or the pycascading.load_main_file parameter is set.
+
 Exports the following:
 replace_object
+digest
+digest_object
 """
 
 
-import inspect, re, types
+import inspect, re, types, hashlib, tokenize, cPickle
+from StringIO import StringIO
 
-import pipe
+import pipe, broadcast
 
 
 def _remove_indents_from_function(code):
@@ -81,6 +90,144 @@ def _get_source(func):
     return _remove_indents_from_function(inspect.getsource(func))
 
 
+def _strip_decorators(source):
+    """Remove the decorator lines before the def of a function's source."""
+    lines = source.split('\n')
+    for i in xrange(0, len(lines)):
+        if re.match('^def\s', lines[i]):
+            return '\n'.join(lines[i :])
+    return source
+
+
+def _referenced_names(source):
+    """Return the set of identifiers used in source, except attributes.
+
+    Jython's code objects don't have co_names, so we need to look at the
+    tokens of the source. Local variables are included too, but they are only
+    used if there is a global with the same name.
+    """
+    names = set()
+    previous = None
+    for token in tokenize.generate_tokens(StringIO(source).readline):
+        if token[0] == tokenize.NAME and previous != '.':
+            names.add(token[1])
+        previous = token[1]
+    return names
+
+
+def _is_plain_value(value):
+    """Return True if value can be pickled without any user-defined class."""
+    if value is None or isinstance(value, (bool, int, long, float, str,
+                                           unicode)):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        for v in value:
+            if not _is_plain_value(v):
+                return False
+        return True
+    if isinstance(value, dict):
+        for (k, v) in value.iteritems():
+            if not (_is_plain_value(k) and _is_plain_value(v)):
+                return False
+        return True
+    return False
+
+
+class _UnsupportedDependency(Exception):
+    pass
+
+
+def _collect_dependencies(source, func_globals, dependencies, seen):
+    """Add the globals used by source to the dependencies.
+
+    Arguments:
+    source -- the source of a function or class
+    func_globals -- the globals of the module where source was defined
+    dependencies -- a dict from the kind of the dependency to a list of
+        dependencies, which is updated
+    seen -- the set of names already added
+    """
+    for name in _referenced_names(source):
+        if name in seen or name not in func_globals:
+            continue
+        seen.add(name)
+        value = func_globals[name]
+        if isinstance(value, pipe.DecoratedFunction):
+            # The workers call the original function anyway
+            value = value.decorators['function']
+        if isinstance(value, broadcast.DistributedFile):
+            dependencies['value'].append(('value', name,
+                                          cPickle.dumps(value, 2)))
+        elif inspect.ismodule(value):
+            dependencies['module'].append(('module', name, value.__name__))
+        elif (inspect.isfunction(value) or inspect.isclass(value)) and \
+        getattr(value, '__module__', None) == '__main__':
+            try:
+                if inspect.isfunction(value):
+                    dependency_source = _strip_decorators(_get_source(value))
+                    kind = 'function'
+                else:
+                    dependency_source = inspect.getsource(value)
+                    kind = 'class'
+            except (IOError, TypeError):
+                raise _UnsupportedDependency(name)
+            dependencies[kind].append(('source', name, dependency_source,
+                                       value.__name__))
+            _collect_dependencies(dependency_source, func_globals,
+                                  dependencies, seen)
+        elif hasattr(value, '__module__') and hasattr(value, '__name__') and \
+        value.__module__ not in (None, '__main__'):
+            # Functions and classes imported from other modules, including
+            # Java classes
+            dependencies['import'].append(('import', name, value.__module__,
+                                           value.__name__))
+        elif _is_plain_value(value):
+            dependencies['value'].append(('value', name,
+                                          cPickle.dumps(value, 2)))
+        else:
+            raise _UnsupportedDependency(name)
+
+
+def function_dependencies(func, source=None):
+    """Return the global names that func needs to run on the workers.
+
+    The result is a tuple of dependencies, in the order they need to be
+    defined on the workers. Each dependency is a tuple starting with its kind
+    and the global name it's bound to:
+    ('module', name, module_name) -- an imported module
+    ('import', name, module_name, attribute) -- an object imported from a
+        module
+    ('value', name, pickle) -- a constant value pickled
+    ('source', name, source, defined_name) -- a function or class defined in
+        the main script, with its source code
+
+    Arguments:
+    func -- the Python function
+    source -- the source of func as it will be defined on the workers, or
+        None if func is defined by one of the dependencies
+
+    Return:
+    the tuple of dependencies, or None if some dependencies cannot be
+    serialized and the whole main script has to be run on the workers
+    """
+    dependencies = { 'module' : [], 'import' : [], 'value' : [],
+                    'class' : [], 'function' : [] }
+    seen = set([func.func_name])
+    try:
+        if source is None:
+            source = _get_source(func)
+            if func.__module__ == '__main__':
+                dependencies['function'].append(
+                    ('source', func.func_name, source, func.func_name))
+        _collect_dependencies(source, func.func_globals, dependencies, seen)
+    except (_UnsupportedDependency, IOError, TypeError, tokenize.TokenError):
+        return None
+    result = []
+    for kind in ('module', 'import', 'value', 'class', 'function'):
+        result.extend(dependencies[kind])
+    return tuple(result)
+
+
 def function_scope(func):
     if (not inspect.isfunction(func)) and (not inspect.ismethod(func)):
         raise Exception('Expecting a (non-built-in) function or method')
@@ -123,7 +270,95 @@ def function_scope(func):
             # Function is a closure
             type = 'closure'
             source = _get_source(func)
-    return (type, module_name, class_name, name, source)
+    if type == 'global' and module_name:
+        # The function can be imported from its module
+        dependencies = (('import', name, module_name, name), )
+    elif type in ('global', 'closure'):
+        dependencies = function_dependencies(func, source)
+    else:
+        # Methods need their class instances, so we run the main script
+        dependencies = None
+    return (type, module_name, class_name, name, source, dependencies)
+
+
+def digest(*parts):
+    """Return a hex SHA-1 digest of the string representations of parts.
+
+    Parts are separated from each other so that ('ab', 'c') and ('a', 'bc')
+    hash differently.
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part))
+        h.update('\0')
+    return h.hexdigest()
+
+
+def _function_digest(func):
+    """Return a digest for a Python function that changes with its code.
+
+    We hash the source if we can find it, otherwise the compiled bytecode and
+    its constants. Values bound in closures are included too, as these are
+    part of what the function computes.
+    """
+    try:
+        code = inspect.getsource(func)
+    except (IOError, TypeError):
+        code = func.func_code.co_code + repr(func.func_code.co_consts)
+    closure = []
+    if func.func_closure:
+        for cell in func.func_closure:
+            try:
+                closure.append(digest_object(cell.cell_contents))
+            except ValueError:
+                # The cell is empty
+                closure.append(None)
+    return digest('function', func.func_name, code, *closure)
+
+
+def digest_object(obj):
+    """Return a deterministic digest of an object used to build a pipeline.
+
+    This is used to fingerprint operations and their parameters, so that
+    cached results can be identified by the contents of the pipeline that
+    created them. Functions are hashed by their source, Java objects by their
+    class and string representation, and containers recursively.
+
+    Arguments:
+    obj -- the object to compute the digest for
+    """
+    if obj is None or isinstance(obj, (bool, int, long, float, str, unicode)):
+        return digest(type(obj).__name__, repr(obj))
+    elif isinstance(obj, (list, tuple)):
+        return digest(type(obj).__name__, *[digest_object(o) for o in obj])
+    elif isinstance(obj, dict):
+        items = [digest(digest_object(k), digest_object(v)) \
+                 for (k, v) in obj.iteritems()]
+        items.sort()
+        return digest('dict', *items)
+    elif inspect.isfunction(obj) or inspect.ismethod(obj):
+        return _function_digest(obj)
+    elif isinstance(obj, pipe.DecoratedFunction):
+        return digest('decorated', digest_object(obj.decorators))
+    elif isinstance(obj, pipe.Chainable):
+        return obj._digest()
+    elif isinstance(obj, broadcast.DistributedFile):
+        # The file name is the hash of the contents
+        return digest(obj.__class__.__name__, obj.file_name)
+    elif inspect.isclass(obj) or inspect.ismodule(obj):
+        return digest(type(obj).__name__, obj.__name__)
+    elif hasattr(obj, 'getClass'):
+        # A Java object. If it has its own toString, we assume it describes
+        # the object deterministically, otherwise we only have the class.
+        java_class = obj.getClass()
+        if java_class.getMethod('toString', []).getDeclaringClass() \
+        .getName() == 'java.lang.Object':
+            return digest(java_class.getName())
+        return digest(java_class.getName(), obj.toString())
+    elif hasattr(obj, '__dict__'):
+        return digest(obj.__class__.__name__, digest_object(obj.__dict__))
+    else:
+        return digest(type(obj).__name__, repr(obj))
 
 
 def replace_object(obj):
@@ -0,0 +1,108 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Sorted key-value indexes on the local disks of the workers.
+
+A side index is built from the tuples of a pipe or a folder before the flow
+is run, and it is shipped to the workers in the distributed cache like a
+broadcast variable. The UDFs look up tuples in it by key, and the index is
+memory-mapped, so only a small sparse index of its blocks is kept on the
+heap. This is for lookup tables that are too large to be held in memory as
+Python dicts, but still small enough to be copied to every node.
+
+Use Flow.side_index() to build an index:
+
+users = flow.side_index(flow.meta_source('users'), 'user_id')
+
+@udf_map
+def add_country(tuple, users):
+    user = users.get(tuple.get('user_id'))
+    yield [user.get(2) if user else None]
+
+Exports the following:
+SideIndex
+build
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import hashlib
+
+from com.twitter.pycascading import SideIndex as JavaSideIndex
+
+from pycascading.broadcast import DistributedFile, new_local_file
+
+
+# The file extension of the index files
+EXTENSION = '.sideindex'
+
+
+class SideIndex(DistributedFile):
+
+    """The handle to a side index that is passed to the UDFs.
+
+    The index file is opened when it is first used, at most once in a JVM.
+    """
+
+    def get(self, key):
+        """Return the first tuple with key, or None if there is none.
+
+        Arguments:
+        key -- the value of the key field to look up
+        """
+        return self._get().get(key)
+
+    def range(self, lo, hi=None):
+        """Iterate over the tuples whose keys are in [lo, hi), sorted by key.
+
+        Arguments:
+        lo -- the lower bound of the keys, inclusive
+        hi -- the upper bound of the keys, exclusive. If None, all the tuples
+            from lo are returned.
+        """
+        return self._get().range(lo, hi)
+
+    def _load(self, path):
+        return JavaSideIndex(path)
+
+
+def _file_hash(path):
+    """Return the hex SHA-1 digest of a file's contents."""
+    h = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        while True:
+            data = f.read(1 << 16)
+            if not data:
+                break
+            h.update(data)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+
+def build(tuples, key_position, spill_threshold=100000):
+    """Build an index file from tuples, and return a handle to it.
+
+    Arguments:
+    tuples -- a TupleEntryIterator of the tuples to be indexed
+    key_position -- the position of the key field in the tuples
+    spill_threshold -- the number of tuples sorted in memory before sorted
+        runs are spilled to the local disk
+    """
+    local_path = new_local_file(EXTENSION)
+    JavaSideIndex.build(tuples, key_position, local_path, spill_threshold)
+    return SideIndex(_file_hash(local_path) + EXTENSION, local_path)
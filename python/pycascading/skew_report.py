@@ -0,0 +1,178 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Merge and report the sizes of the groups in the reduce steps.
+
+If a flow is run with the pycascading.skew_report parameter set to True, the
+buffers and aggregators after the GroupBys and CoGroups record the sizes of
+the groups they process. Every reduce task keeps its largest groups and a
+histogram of the group sizes, and writes them to the folder in
+pycascading.skew_report.dir. They are merged here into a report of the
+largest groups and the skew of every step, which shows which keys are hot
+and whether some reducers get much more data than the others.
+
+If a task was run more than once, because an attempt failed or was run
+speculatively, only one of its attempts is counted.
+
+Flow.run() prints the report when the flow finishes. The group sizes in a
+folder can also be merged later by running this module as a script:
+
+local_run.sh python/pycascading/skew_report.py <report folder> [<groups>]
+
+Exports the following:
+merge
+report
+print_report
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys
+
+from com.twitter.pycascading import GroupSkew
+
+from org.apache.hadoop.fs import Path
+from org.apache.hadoop.conf import Configuration
+
+from pycascading.udf_profile import _read_lines
+
+
+def merge(folder):
+    """Merge the group sizes of the tasks written in a folder.
+
+    Arguments:
+    folder -- the folder where the group sizes were written
+
+    Return:
+    a dict mapping (job, pipe) tuples to dicts with the numbers of 'groups'
+    and 'tuples', the numbers of tuples of the tasks in 'task_tuples', the
+    'histogram' mapping i to the number of groups with sizes in
+    [2^i, 2^(i+1)), and the 'largest' groups as (size, key) tuples
+    """
+    path = Path(folder)
+    fs = path.getFileSystem(Configuration())
+    result = {}
+    if not fs.exists(path):
+        return result
+    # The attempts of the tasks, keeping the one with the most tuples
+    attempts = {}
+    for status in fs.listStatus(path):
+        if not status.getPath().getName().endswith(GroupSkew.EXTENSION):
+            continue
+        header = {}
+        histogram = {}
+        largest = []
+        for line in _read_lines(fs, status.getPath()):
+            fields = line.split('\t')
+            if fields[0] == '#histogram':
+                histogram[int(fields[1])] = int(fields[2])
+            elif fields[0].startswith('#'):
+                header[fields[0][1:]] = fields[1]
+            else:
+                largest.append((int(fields[0]), fields[1]))
+        task = (header['job'], header['pipe'],
+                header.get('task', status.getPath().getName()))
+        if task not in attempts or \
+        int(header['tuples']) > int(attempts[task][0]['tuples']):
+            attempts[task] = (header, histogram, largest)
+    for (header, histogram, largest) in attempts.itervalues():
+        step = result.setdefault((header['job'], header['pipe']),
+                                 { 'groups' : 0, 'tuples' : 0,
+                                   'task_tuples' : [], 'histogram' : {},
+                                   'largest' : [] })
+        step['groups'] += int(header['groups'])
+        step['tuples'] += int(header['tuples'])
+        step['task_tuples'].append(int(header['tuples']))
+        for (i, n) in histogram.iteritems():
+            step['histogram'][i] = step['histogram'].get(i, 0) + n
+        step['largest'].extend(largest)
+    return result
+
+
+def report(folder, max_groups=10):
+    """Compute the skew of the steps from the merged group sizes.
+
+    The group skew is the size of the largest group divided by the average
+    size of the groups, and the reducer skew is the largest number of tuples
+    processed by a task divided by the average number of tuples of the tasks.
+
+    Arguments:
+    folder -- the folder where the group sizes were written
+    max_groups -- the number of the largest groups returned for each step
+
+    Return:
+    a list of (job, pipe, groups, tuples, group skew, reducer skew,
+    histogram, largest groups) tuples sorted by job. The histogram is a
+    sorted list of (i, number of groups) tuples for the groups with sizes in
+    [2^i, 2^(i+1)), and the largest groups are (size, key) tuples.
+    """
+    result = []
+    for ((job, pipe), step) in merge(folder).iteritems():
+        largest = step['largest']
+        largest.sort(reverse=True)
+        largest = largest[:max_groups]
+        groups = step['groups']
+        tuples = step['tuples']
+        task_tuples = step['task_tuples']
+        group_skew = reducer_skew = 1.0
+        if groups and largest:
+            group_skew = largest[0][0] * float(groups) / tuples
+        if tuples:
+            reducer_skew = max(task_tuples) * float(len(task_tuples)) / tuples
+        histogram = step['histogram'].items()
+        histogram.sort()
+        result.append((job, pipe, groups, tuples, group_skew, reducer_skew,
+                       histogram, largest))
+    result.sort()
+    return result
+
+
+def print_report(folder, step_names=None, max_groups=10):
+    """Print the report of the group sizes written in a folder.
+
+    Arguments:
+    folder -- the folder where the group sizes were written
+    step_names -- a dict mapping the job IDs to the names of the steps
+    max_groups -- the number of the largest groups shown for each step
+    """
+    steps = report(folder, max_groups)
+    if not steps:
+        print 'No group sizes were found in %s' % folder
+        return
+    print 'Group skew report:'
+    for (job, pipe, groups, tuples, group_skew, reducer_skew, histogram,
+         largest) in steps:
+        print
+        print '%s (%s)' % ((step_names or {}).get(job, job), pipe)
+        print '%d groups, %d tuples, largest group / average: %.1f, ' \
+        'largest reducer / average: %.1f' % \
+        (groups, tuples, group_skew, reducer_skew)
+        print 'Group sizes:'
+        for (i, n) in histogram:
+            print '%12d - %-12d %d' % (2 ** i, 2 ** (i + 1) - 1, n)
+        print 'Largest groups:'
+        for (size, key) in largest:
+            print '%12d  %s' % (size, key)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print 'Usage: skew_report.py <report folder> [<groups per step>]'
+        sys.exit(1)
+    if len(sys.argv) > 2:
+        print_report(sys.argv[1], max_groups=int(sys.argv[2]))
+    else:
+        print_report(sys.argv[1])
@@ -20,23 +20,47 @@ them to be named by strings when running the flow.
 
 Exports the following:
 Flow
+FlowHandle
+Cascade
+cascade
+udf_report
+print_udf_report
+read_tuples
+read_sampling
 read_hdfs_tsv_file
 """
 
 __author__ = 'Gabor Szabo'
 
 
-from pycascading.pipe import random_pipe_name, Chainable, Pipe
-from com.twitter.pycascading import Util, MetaScheme
+import time, random
+
+from pycascading.pipe import random_pipe_name, Chainable, Pipe, \
+coerce_to_fields
+from com.twitter.pycascading import Util, MetaScheme, SkipIfSinksUpToDate, \
+UdfStats, UdfProfiler, SampledScheme, CombinedScheme, FileStats, \
+MergeJoinScheme, MergeJoinTap, GroupSkew, CascadingBaseOperationWrapper, \
+GroupSkewAggregator
+from com.twitter.pycascading.memory import MemoryFlow
+
+import jarray
+from java.util import IdentityHashMap
 
 import cascading.tap
 import cascading.scheme
-from cascading.tuple import Fields
+import cascading.flow
+import cascading.pipe
+import cascading.operation
+from cascading.tuple import Fields, Tuple
+from cascading.cascade import CascadeConnector
 
 from org.apache.hadoop.fs import Path
 from org.apache.hadoop.conf import Configuration
+from org.apache.hadoop.mapred import JobConf
 
 from pipe import random_pipe_name, Operation
+import serializers, cache, broadcast, side_index, udf_profile, explain, \
+auto_reducers, incremental, skew_report
 
 
 def expand_path_with_home(output_folder):
@@ -68,10 +92,41 @@ class Flow(object):
     parameter when starting the flow with run().
     """
 
-    def __init__(self):
+    def __init__(self, auto_cache=False):
+        """Create a new flow.
+
+        Arguments:
+        auto_cache -- if True, the results of all groupings and joins are
+            cached automatically, as if they were preceded by a flow.cache()
+        """
         self.source_map = {}
         self.sink_map = {}
         self.tails = []
+        self.auto_cache = auto_cache
+        # The cache folders that will be complete after the flow has run
+        self.cache_folders = []
+        # The local files of the broadcast variables and side indexes to be
+        # shipped
+        self.distributed_files = []
+        # The FlowHandle of the last time the flow was started
+        self.last_handle = None
+        # The plan of the last time the flow was connected with the numbers
+        # of reducers chosen automatically, or None
+        self.last_plan = None
+        # The names of the head pipes of sampled sources mapped to the lines
+        # describing the samples, which are stored with the meta sinks
+        self.sampling = {}
+        # The numbers of files read and skipped by the predicates of the
+        # meta_sources
+        self.skipping_counters = {}
+        # The names of the head pipes of the meta_sources of bucketed data
+        # mapped to (folder, data path, number of buckets, key fields)
+        self.bucketing = {}
+        # The state files of the incremental sources and the files they read,
+        # which are recorded as read after the flow succeeded
+        self.incremental_sources = []
+        # The FlowHandles of the flows run by the last iterate()
+        self.iteration_handles = []
 
     def _connect_source(self, pipe_name, cascading_tap):
         """Add a source to the flow.
@@ -85,33 +140,288 @@ class Flow(object):
         """
         self.source_map[pipe_name] = cascading_tap
 
-    def source(self, cascading_tap):
+    def source(self, cascading_tap, sample=None, seed=None,
+               sample_records=True, combine_splits=None, incremental=None):
         """A generic source using Cascading taps.
 
+        If sample is given, only a random sample of the data is read. Whole
+        input splits are dropped before they are read, so the I/O is
+        proportional to the sampled fraction. The fraction and the seed are
+        stored with the outputs of the flow written with meta sinks, and can
+        be read with read_sampling().
+
+        If combine_splits is given, many small files are packed into one
+        split, up to the given size, preferring the files on the same node.
+        This way a mapper, and its Python interpreter, isn't started for each
+        file. The map_input_file variable of the UDFs is the file that the
+        current tuple was read from.
+
+        If incremental is given, only the files in the folder of the tap
+        that were not read by the earlier successful runs are read. The files
+        read are recorded in the state file when the flow finishes
+        successfully. If there are no new files, incremental.NoNewInput is
+        raised. See the incremental module.
+
+        Sampling and combining the splits only work with Hfs, GlobHfs, and
+        Lfs taps, and incremental sources with Hfs and Lfs taps.
+
         Arguments:
         cascading_tap -- the Cascading Scheme object to store data into
+        sample -- the fraction of the data to read, between 0 and 1, or None
+            to read all of it
+        seed -- the seed of the random sample. The same seed gives the same
+            sample of the same data. Defaults to a random seed.
+        sample_records -- if True, the records of the splits read are also
+            sampled, so that the fraction of the records read is sample even
+            if the input has only a few splits. If False, the fraction of the
+            splits read is sample rounded up.
+        combine_splits -- the maximum size of a combined split in bytes, or
+            as a string such as '256MB', or None to use a split for each
+            block of each file
+        incremental -- the path of the state file with the files read by
+            the earlier runs, or None to read all the files
         """
+        if incremental is not None:
+            cascading_tap = self._incremental_tap(cascading_tap, incremental)
+        fingerprinted = cascading_tap
+        sampling = []
+        if sample is not None or combine_splits is not None:
+            if not isinstance(cascading_tap, _FILE_TAPS):
+                raise Exception('Only Hfs, GlobHfs, and Lfs taps can be '
+                                'sampled or have combined splits')
+            path = cascading_tap.getPath().toString()
+            scheme = cascading_tap.getScheme()
+            if combine_splits is not None:
+                scheme = CombinedScheme(scheme,
+                                        cache._parse_size(combine_splits))
+            if sample is not None:
+                if seed is None:
+                    seed = random.randint(0, 999999999)
+                scheme = SampledScheme(scheme, sample, seed, sample_records)
+                sampling.append('%g\t%s\t%d\t%s' % \
+                                (sample,
+                                 sample_records and 'records' or 'splits',
+                                 seed, path))
+            cascading_tap = cascading_tap.__class__(scheme, path)
         # We can create the source tap right away and also use a Pipe to name
         # the head of this pipeline
         p = Pipe(name=random_pipe_name('source'))
-        p.hash = hash(cascading_tap)
+        # The combined splits don't change the data, so only the sampling is
+        # added to the fingerprint
+        parts = tuple(sampling)
+        p.hash = lambda: serializers.digest(
+            'source', cache.tap_fingerprint(fingerprinted), *parts)
+        p.flow = self
         p.add_context([p.get_assembly().getName()])
         self._connect_source(p.get_assembly().getName(), cascading_tap)
+        if sampling:
+            self.sampling[p.get_assembly().getName()] = sampling
         return p
 
-    def meta_source(self, input_path):
+    def _incremental_tap(self, cascading_tap, state_path):
+        """Return a tap reading the files not read by the earlier runs."""
+        if not isinstance(cascading_tap, cascading.tap.Hfs):
+            raise Exception('Only Hfs and Lfs taps can be incremental')
+        state_path = expand_path_with_home(state_path)
+        folder = cascading_tap.getPath().toString()
+        files = incremental.new_files(folder, state_path)
+        if not files:
+            raise incremental.NoNewInput('No new files in %s since the last '
+                                         'run' % folder)
+        self.incremental_sources.append((state_path, files))
+        # Only the files listed are read and recorded, even on the first run,
+        # so that the files arriving later are read by the next run
+        pattern = _files_glob(folder, [s.getPath().toString() for s in files])
+        return _path_tap(cascading_tap.getScheme(), pattern)
+
+    def broadcast(self, obj):
+        """Ship a large read-only object to the UDFs.
+
+        The object is written once to a file that is shipped to the workers in
+        the distributed cache, instead of being serialized into every
+        operation that uses it. The returned handle can be passed to UDFs as a
+        context argument, and its value attribute gives the object, which is
+        loaded lazily at most once in every JVM and shared by the operations.
+
+        Arguments:
+        obj -- the object to broadcast, which must be picklable
+
+        Return:
+        a Broadcast handle to the object
+        """
+        handle = broadcast.write(obj)
+        self.distributed_files.append(handle.local_path)
+        return handle
+
+    def side_index(self, pipe_or_path, key_field, num_reducers=50):
+        """Build a sorted index of tuples for lookups by key from the UDFs.
+
+        If a pipe is given, it is first run in a separate flow, and its output
+        is stored in a temporary folder. The tuples are then sorted by the key
+        field, and written into an index file on the local disk, which is
+        shipped to the workers in the distributed cache. The UDFs get the
+        returned handle as a context argument, and can use its get(key) and
+        range(lo, hi) methods to look up tuples. The index is memory-mapped
+        on the workers, and only a sparse index of its blocks is kept in
+        memory.
+
+        Arguments:
+        pipe_or_path -- a pipe of this flow, or a folder stored with a meta
+            sink
+        key_field -- the name or position of the key field
+        num_reducers -- the number of reducers for the flow of the pipe
+
+        Return:
+        a SideIndex handle
+        """
+        if isinstance(pipe_or_path, Chainable):
+            path = expand_path_with_home('pycascading.side_index/%d' % \
+                                         int(time.time() * 1000))
+            index_flow = Flow()
+            index_flow.source_map = self.source_map
+            pipe_or_path | Pipe(random_pipe_name('side_index')) | \
+            index_flow.binary_sink(path)
+            # The index is needed before this flow can be built, so we don't
+            # add its flow to a cascade
+            index_flow._connect(num_reducers, None).complete()
+        else:
+            path = expand_path_with_home(pipe_or_path)
+        tap = cascading.tap.Hfs(MetaScheme.getSourceScheme(path), path)
+        if isinstance(key_field, int):
+            key_position = key_field
+        else:
+            key_position = tap.getSourceFields().getPos(key_field)
+        try:
+            handle = side_index.build(tap.openForRead(JobConf()), key_position)
+        finally:
+            if isinstance(pipe_or_path, Chainable):
+                _delete_folder(path)
+        self.distributed_files.append(handle.local_path)
+        return handle
+
+    def meta_source(self, input_path, where=None, predicate=None,
+                    sample=None, seed=None, sample_records=True,
+                    combine_splits=None):
         """Use data files in a folder and read the scheme from the meta file.
 
         Defines a source tap using files in input_path, which should be a
         (HDFS) folder. Takes care of using the appropriate scheme that was
         used to store the data, using meta data in the data folder.
 
+        If the data was computed from sampled sources, the outputs of this
+        flow are marked as sampled, too.
+
+        If the data was written with a partitioned_sink, only the partitions
+        matching the conditions in where are read. The conditions are given
+        for the partition fields as a value, a list of values, or a function
+        that gets the value as a string and returns True for the partitions
+        to read. The folders of the partitions are listed with a glob, so the
+        other partitions are not even opened.
+
+        If the data was written with a bucketed_sink, an inner_join or a
+        left_outer_join of this pipe with another bucketed meta_source is
+        done in the mappers, see bucketed_sink().
+
+        If the data was written with stats_fields, the part files whose
+        ranges of values can't match predicate are skipped. The predicate is
+        a dict of fields mapped to a value or to a (low, high) tuple of
+        inclusive bounds, where None means no bound. It can also be a
+        function that gets the FileStats of a part file and returns False if
+        the file can be skipped. The predicate only skips whole files, so
+        the tuples read still have to be filtered if needed. The numbers of
+        files read and skipped are in the 'PyCascading data skipping' group
+        of FlowHandle.counters().
+
         Arguments:
         input_path -- the HDFS folder to store data into
+        where -- a dict of partition fields mapped to conditions on them
+        predicate -- a dict of fields mapped to values or ranges, or a
+            function, to skip the part files that can't match
+        sample, seed, sample_records -- to read a sample of the data, see
+            source()
+        combine_splits -- to pack small files into larger splits, see
+            source()
         """
         input_path = expand_path_with_home(input_path)
         source_scheme = MetaScheme.getSourceScheme(input_path)
-        return self.source(cascading.tap.Hfs(source_scheme, input_path))
+        data_path = input_path
+        if where:
+            data_path = _partition_glob(input_path, where)
+        if predicate:
+            (data_path, read, skipped, skipped_bytes) = \
+            _skip_files(input_path, data_path, predicate)
+            for (name, value) in [('Files read', read),
+                                  ('Files skipped', skipped),
+                                  ('Bytes skipped', skipped_bytes)]:
+                self.skipping_counters[name] = \
+                self.skipping_counters.get(name, 0) + value
+        p = self.source(_path_tap(source_scheme, data_path),
+                        sample, seed, sample_records, combine_splits)
+        sampling = MetaScheme.getSampling(input_path)
+        if sampling:
+            self.sampling.setdefault(p.get_assembly().getName(), []).extend(
+                sampling.splitlines())
+        bucketing = MetaScheme.getBucketing(input_path)
+        if bucketing and not where and sample is None and \
+        combine_splits is None:
+            self.bucketing[p.get_assembly().getName()] = \
+            (input_path, data_path, int(bucketing[0]), list(bucketing[1:]))
+        return p
+
+    def _merge_join(self, pipes, group_fields, declared_fields, left_outer):
+        """Return a source pipe with the join of two bucketed sources.
+
+        The join is done in the mappers if both pipes are meta_sources of
+        data written by bucketed_sinks with the same number of buckets, and
+        they are joined on the key fields of the buckets. Otherwise None is
+        returned, and the pipes are joined with a CoGroup.
+
+        Arguments:
+        pipes -- the left and the right pipes
+        group_fields -- the fields to join on for each pipe
+        declared_fields -- the fields of the joined tuples, or None
+        left_outer -- True for a left outer join, False for an inner join
+        """
+        if len(pipes) != 2 or len(group_fields) != 2:
+            return None
+        sides = []
+        for (pipe, fields) in zip(pipes, group_fields):
+            name = pipe.get_assembly().getName()
+            # The pipe has to be the head pipe of the source
+            if pipe.flow is not self or name not in self.bucketing or \
+            pipe.get_assembly().getPrevious():
+                return None
+            (path, data_path, buckets, keys) = self.bucketing[name]
+            if [str(f) for f in coerce_to_fields(fields)] != keys:
+                return None
+            sides.append((name, path, data_path, buckets, keys))
+        ((left_name, _, left_data, left_buckets, left_keys),
+         (right_name, right_path, _, right_buckets, right_keys)) = sides
+        if left_buckets != right_buckets:
+            return None
+        left_scheme = self.source_map[left_name].getScheme()
+        right_scheme = self.source_map[right_name].getScheme()
+        if declared_fields is None:
+            names = [str(f) for f in left_scheme.getSourceFields()] + \
+            [str(f) for f in right_scheme.getSourceFields()]
+            if len(set(names)) != len(names):
+                # Let the CoGroup report the clashing field names
+                return None
+        else:
+            declared_fields = coerce_to_fields(declared_fields)
+        scheme = MergeJoinScheme(left_scheme, right_scheme, right_path,
+                                 coerce_to_fields(left_keys),
+                                 coerce_to_fields(right_keys),
+                                 declared_fields, left_outer)
+        # The right side stays a source of the flow, so that the flow is
+        # not skipped or run too early when only the right side changed
+        p = self.source(MergeJoinTap(_path_tap(scheme, left_data),
+                                     self.source_map[right_name]))
+        for name in [left_name, right_name]:
+            if name in self.sampling:
+                self.sampling.setdefault(p.get_assembly().getName(),
+                                         []).extend(self.sampling[name])
+        return p
 
     def sink(self, cascading_scheme):
         """A Cascading sink using a Cascading Scheme.
@@ -121,7 +431,7 @@ class Flow(object):
         """
         return _Sink(self, cascading_scheme)
 
-    def meta_sink(self, cascading_scheme, output_path):
+    def meta_sink(self, cascading_scheme, output_path, stats_fields=None):
         """Store data together with meta information about the scheme used.
 
         A sink that also stores in a file information about the scheme used to
@@ -129,29 +439,112 @@ class Flow(object):
         and .pycascading_types files with the field names and their types,
         respectively.
 
+        If stats_fields are given, the minimum and maximum values and the
+        number of nulls of these fields are stored for every part file, so
+        that meta_source can skip the files that can't match its predicate.
+        This is most useful if the data is sorted or clustered by the fields.
+
         Arguments:
         cascading_scheme -- the Cascading Scheme used to store data
         output_path -- the folder where the output tuples should be stored.
             If it exists, it will be erased and replaced!
+        stats_fields -- the names of the fields to store the ranges of
         """
         output_path = expand_path_with_home(output_path)
         sink_scheme = MetaScheme.getSinkScheme(cascading_scheme, output_path)
+        if stats_fields:
+            sink_scheme.setStatsFields([str(f) for f in
+                                        coerce_to_fields(stats_fields)])
         return self.sink(cascading.tap.Hfs(sink_scheme, output_path,
                                            cascading.tap.SinkMode.REPLACE))
 
-    def tsv_sink(self, output_path, fields=Fields.ALL):
+    def partitioned_sink(self, output_path, partition_fields,
+                         cascading_scheme=None, max_open_files=300):
+        """Store the tuples in folders by the values of some fields.
+
+        The tuples are written in a single pass into the subfolders
+        field1=value1/field2=value2/... of output_path, with a Cascading
+        TemplateTap. The partition fields are also kept in the tuples. The
+        names of the partition fields are stored in the meta data, so that
+        meta_source can read only some of the partitions with its where
+        parameter. The values must not contain '/'.
+
+        Arguments:
+        output_path -- the folder where the partitions are stored. If it
+            exists, it will be erased and replaced!
+        partition_fields -- the names of the fields to partition by, which
+            give the levels of the subfolders in their order
+        cascading_scheme -- the Cascading Scheme used to store the data.
+            Defaults to a SequenceFile with all fields.
+        max_open_files -- the number of partitions that a task writes at the
+            same time at most. If there are more, the least recently used
+            ones are closed.
+        """
+        output_path = expand_path_with_home(output_path)
+        partition_fields = coerce_to_fields(partition_fields)
+        names = [str(f) for f in partition_fields]
+        if cascading_scheme is None:
+            cascading_scheme = cascading.scheme.SequenceFile(Fields.ALL)
+        sink_scheme = MetaScheme.getSinkScheme(cascading_scheme, output_path)
+        sink_scheme.setPartitionFields(names)
+        template = '/'.join(['%s=%%s' % n.replace('%', '%%') for n in names])
+        parent = cascading.tap.Hfs(sink_scheme, output_path,
+                                   cascading.tap.SinkMode.REPLACE)
+        return self.sink(cascading.tap.TemplateTap(
+            parent, template, partition_fields,
+            cascading.tap.SinkMode.REPLACE, False, max_open_files))
+
+    def bucketed_sink(self, output_path, key_fields, buckets,
+                      cascading_scheme=None):
+        """Store the tuples in a fixed number of buckets sorted by keys.
+
+        The tuples are grouped by the key fields, and are written by exactly
+        buckets reducers, so that the tuples with the same keys are in the
+        same part file, sorted by the keys. The bucketing is stored in the
+        meta data.
+
+        If two data sets bucketed into the same number of buckets are read
+        with meta_source, and are joined on their key fields with inner_join
+        or left_outer_join, the join is done in the mappers by merging the
+        part files of the same buckets, without shuffling the data. The
+        tuples of the right side with the same key are kept in memory, so
+        the right side should be the one with fewer tuples per key. The
+        types of the keys must be the same on both sides, as they are hashed
+        into the buckets.
+
+        Arguments:
+        output_path -- the folder where the buckets are stored. If it exists,
+            it will be erased and replaced!
+        key_fields -- the names of the fields to bucket and sort by
+        buckets -- the number of buckets
+        cascading_scheme -- the Cascading Scheme used to store the data.
+            Defaults to a SequenceFile with all fields.
+        """
+        output_path = expand_path_with_home(output_path)
+        key_fields = [str(f) for f in coerce_to_fields(key_fields)]
+        if cascading_scheme is None:
+            cascading_scheme = cascading.scheme.SequenceFile(Fields.ALL)
+        sink_scheme = MetaScheme.getSinkScheme(cascading_scheme, output_path)
+        sink_scheme.setBucketing(int(buckets), key_fields)
+        return _BucketedSink(self, cascading.tap.Hfs(
+            sink_scheme, output_path, cascading.tap.SinkMode.REPLACE),
+            key_fields)
+
+    def tsv_sink(self, output_path, fields=Fields.ALL, stats_fields=None):
         # TODO: in local mode, do not prepend the home folder to the path
         """A sink to store the tuples as tab-separated values in text files.
 
         Arguments:
         output_path -- the folder for the output
         fields -- the fields to store. Defaults to all fields.
+        stats_fields -- the fields to store the ranges of, see meta_sink()
         """
         output_path = expand_path_with_home(output_path)
         return self.meta_sink(cascading.scheme.TextDelimited(fields, '\t'),
-                              output_path)
+                              output_path, stats_fields)
 
-    def binary_sink(self, output_path, fields=Fields.ALL):
+    def binary_sink(self, output_path, fields=Fields.ALL,
+                    stats_fields=None):
         """A sink to store binary sequence files to store the output.
 
         This is a sink that uses the efficient Cascading SequenceFile scheme to
@@ -163,12 +556,13 @@ class Flow(object):
         output_path -- the (HDFS) folder to store data into
         fields -- the Cascading Fields field selector of which tuple fields to
             store. Defaults to Fields.ALL.
+        stats_fields -- the fields to store the ranges of, see meta_sink()
         """
         output_path = expand_path_with_home(output_path)
         return self.meta_sink(cascading.scheme.SequenceFile(fields),
-                              output_path)
+                              output_path, stats_fields)
 
-    def cache(self, identifier, refresh=False):
+    def cache(self, identifier='auto', refresh=False):
         """A sink for temporary results.
 
         This caches results into a temporary folder if the folder does not
@@ -177,32 +571,1011 @@ class Flow(object):
         very useful to store some results that can be reused without having to
         go through the part of the flow that generated them again.
 
+        The cached data is identified by a fingerprint of the pipeline that
+        produced it. If the sources of the functions, their parameters, or
+        the input data change, the cached data is not used, and the pipeline
+        is run again.
+
         Arguments:
-        identifier -- the unique identifier for this cache. This is used as
-            part of the path where the temporary files are stored.
+        identifier -- a name for this cache. This is used as part of the path
+            where the temporary files are stored.
         refresh -- if True, we will regenerate the cache data as if it was
             the first time creating it
         """
         return _Cache(self, identifier, refresh)
 
-    def run(self, num_reducers=50, config=None):
+    def iterate(self, body, inputs, max_iter, converged=None, state=None,
+                key=None, work_dir=None, num_reducers=50):
+        """Run an iterative computation, such as PageRank.
+
+        First this flow is run to store the static inputs and the initial
+        state in a binary format. If key is given, they are stored with
+        bucketed sinks, so that the data is partitioned and sorted by key into
+        the same number of buckets. Then in every iteration a new flow is
+        built by calling body with the static inputs and the current state
+        read back from these folders, and the new state returned by body is
+        stored for the next iteration in the same way. Thus the static inputs
+        are only read, processed, and joined once, even if they are used in
+        every iteration, and an inner_join or a left_outer_join of the state
+        with a static input on key is done in the mappers without shuffling
+        them (see bucketed_sink()). Join the static inputs before passing them
+        in if they are always used together.
+
+        If converged is given, it is called in each iteration to build a
+        pipeline from the old and new states that produces a single small
+        tuple. This is computed in the same flow as the new state, and we stop
+        if the first field of the tuple is true.
+
+        Arguments:
+        body -- a function called as body(flow, inputs, state), where flow is
+            the Flow of the iteration, inputs is a dict of the static input
+            pipes, and state is the pipe with the current state. It must
+            return the pipe of the new state.
+        inputs -- a dict of names mapped to pipes of this flow, which are the
+            inputs that don't change between iterations
+        max_iter -- the maximum number of iterations
+        converged -- a function called as converged(flow, old_state,
+            new_state), returning a pipe with one tuple whose first field
+            indicates that the iteration has converged
+        state -- the pipe of this flow with the initial state
+        key -- the field(s) to partition the inputs and the state on, or a
+            dict of input names (and 'state') mapped to the fields
+        work_dir -- the folder where the inputs and states are stored.
+            Defaults to a new folder under pycascading.iterate/.
+        num_reducers -- the number of reducers used for the flows, or 'auto'.
+            The number of buckets is num_reducers, or the default number of
+            reducers of auto_reducers with 'auto'.
+
+        The FlowHandles of the flows run are in iteration_handles after
+        iterate returns.
+
+        Return:
+        the folder with the final state, which can be read with meta_source
+        """
+        if state is None:
+            raise Exception('The initial state must be given for iterate')
+        if work_dir is None:
+            work_dir = 'pycascading.iterate/%d' % int(time.time() * 1000)
+        work_dir = expand_path_with_home(work_dir)
+        if num_reducers == 'auto':
+            buckets = auto_reducers.DEFAULT_REDUCERS
+        else:
+            buckets = num_reducers
+
+        def partitioned_sink(flow, name, folder):
+            # The buckets are written by a GroupBy, so there is no need to
+            # group the data before the sink
+            if isinstance(key, dict):
+                fields = key.get(name)
+            else:
+                fields = key
+            if fields is None:
+                return flow.binary_sink(folder)
+            return flow.bucketed_sink(folder, fields, buckets)
+
+        for (name, pipe) in inputs.iteritems():
+            pipe | partitioned_sink(self, name,
+                                    '%s/inputs/%s' % (work_dir, name))
+        state_folder = '%s/state/%d' % (work_dir, 0)
+        state | partitioned_sink(self, 'state', state_folder)
+        self.run(num_reducers=num_reducers)
+        self.iteration_handles = [self.last_handle]
+
+        for iteration in xrange(1, max_iter + 1):
+            flow = Flow()
+            static = {}
+            for name in inputs.iterkeys():
+                static[name] = \
+                flow.meta_source('%s/inputs/%s' % (work_dir, name))
+            old_state = flow.meta_source(state_folder)
+            new_state = body(flow, static, old_state)
+            new_state_folder = '%s/state/%d' % (work_dir, iteration)
+            new_state | partitioned_sink(flow, 'state', new_state_folder)
+            if converged:
+                converged_folder = '%s/converged/%d' % (work_dir, iteration)
+                converged(flow, old_state, new_state) | \
+                flow.binary_sink(converged_folder)
+            flow.run(num_reducers=num_reducers)
+            self.iteration_handles.append(flow.last_handle)
+            _delete_folder(state_folder)
+            state_folder = new_state_folder
+            if converged:
+                result = read_tuples(converged_folder)
+                _delete_folder(converged_folder)
+                if result and result[0].getObject(0):
+                    break
+        return state_folder
+
+    def run(self, num_reducers=50, config=None, engine='hadoop'):
         """Start the Cascading job.
 
         We call this when we are done building the pipeline and explicitly want
         to start the flow process.
+
+        If the flow is run inside a cascade, it is only added to the cascade,
+        and will be started together with the other flows when the cascade is
+        run.
+
+        Arguments:
+        num_reducers -- the default number of reducers, or 'auto' to choose
+            the number for each step from the estimated bytes it shuffles
+            (see the auto_reducers module)
+        config -- a dict of additional configuration parameters
+        engine -- 'hadoop' to plan the flow into MapReduce jobs with Cascading,
+            or 'memory' to execute it directly in this JVM. The in-memory
+            engine is much faster for small data sets and tests. The number of
+            threads it uses can be set with the pycascading.memory.threads
+            parameter in config.
+
+        Setting pycascading.load_main_file to True in config runs the whole
+        main script on the workers before the user-defined functions are
+        called. By default only the functions, modules, and values that they
+        depend on are defined there.
+
+        Setting pycascading.profile to a fraction between 0 and 1 profiles the
+        UDFs in that fraction of the tasks, and prints a report of the lines
+        where the UDFs spent their time when the flow finishes. See the
+        udf_profile module.
+
+        Setting pycascading.skew_report to True records the sizes of the
+        groups processed by the buffers and aggregators, and prints the
+        largest groups and the skew of the reduce steps when the flow
+        finishes. See the skew_report module.
         """
+        if engine == 'memory':
+            if _cascades:
+                raise Exception('Flows in a cascade cannot use the memory '
+                                'engine')
+            self._run_in_memory(config)
+        elif engine != 'hadoop':
+            raise Exception('Unknown engine: %s' % engine)
+        elif _cascades:
+            _cascades[-1].add(self, num_reducers, config)
+        else:
+            handle = self.start(num_reducers, config)
+            handle.wait()
+            if self._instrumented(config):
+                print_udf_report(handle.counters())
+            if handle.profile_dir:
+                udf_profile.print_report(handle.profile_dir)
+            if handle.skew_dir:
+                skew_report.print_report(handle.skew_dir,
+                                         handle._job_step_names())
+
+    def start(self, num_reducers=50, config=None):
+        """Start the Cascading job without waiting for it to finish.
+
+        Return:
+        a FlowHandle that can be used to follow the progress of the flow,
+        wait for it to finish, or cancel it
+        """
+        if _cascades:
+            raise Exception('Flows in a cascade are started by the cascade')
+        flow_config = self._flow_config(config)
+        cascading_flow = self._connect(num_reducers, flow_config)
+        cascading_flow.start()
+        self.last_handle = FlowHandle(self, cascading_flow,
+                                      flow_config.get(UdfProfiler.PROFILE_DIR),
+                                      self.last_plan,
+                                      flow_config.get(GroupSkew.REPORT_DIR))
+        return self.last_handle
+
+    def explain(self, num_reducers=50, config=None, dot_file=None,
+                handle=None):
+        """Print the plan of the flow without running it.
+
+        The plan shows the MapReduce steps that the flow will run, the
+        shuffles, and the Python operations with the conversions of their
+        input and output tuples. If the flow has been started already, the
+        measured durations and record counts of its steps are shown too. With
+        num_reducers='auto' the chosen numbers of reducers are shown.
+
+        Arguments:
+        num_reducers -- the default number of reducers, or 'auto'
+        config -- a dict of additional configuration parameters
+        dot_file -- if given, the plan is written to this file as a DOT graph
+        handle -- the FlowHandle of the run whose measurements are shown.
+            Defaults to the last run of this flow.
+
+        Return:
+        the explain.Plan of the flow
+        """
+        flow_config = dict(config or {})
+        # Nothing is copied to the distributed cache in local mode, and the
+        # plan is the same
+        flow_config['pycascading.running_mode'] = 'local'
+        cascading_flow = self._connect(num_reducers, flow_config)
+        if handle is None:
+            handle = self.last_handle
+        plan = self.last_plan or self._plan(cascading_flow)
+        if handle is not None:
+            plan.add_measurements(handle)
+        print plan.text()
+        if dot_file:
+            f = open(dot_file, 'w')
+            try:
+                f.write(plan.dot())
+            finally:
+                f.close()
+        return plan
+
+    def _used_sources(self):
+        """Return the source map without the sources not used by the tails."""
         sources_used = set([])
         for tail in self.tails:
             sources_used.update(tail.context)
-        # Remove unused sources from the source map
         source_map = {}
         for source in self.source_map.iterkeys():
             if source in sources_used:
                 source_map[source] = self.source_map[source]
+        return source_map
+
+    def _connect(self, num_reducers, config):
+        """Connect the pipeline and return the Cascading Flow.
+
+        If num_reducers is 'auto', the numbers of reducers of the steps are
+        chosen with auto_reducers, and the plan is kept in last_plan.
+        """
         tails = [t.get_assembly() for t in self.tails]
+        flow_config = self._flow_config(config)
+        flow_config['pycascading.distributed_cache.files'] = \
+        self.distributed_files
+        self._limit_instrumentation(flow_config, tails)
+        _wrap_aggregators(tails, flow_config.get(GroupSkew.REPORT) is True)
+        self.last_plan = None
+        self._mark_sampled_sinks()
+        if num_reducers != 'auto':
+            cascading_flow = Util.connect(num_reducers, flow_config,
+                                          self._used_sources(),
+                                          self.sink_map, tails)
+            cascading_flow.addListener(_CompletionListener(self))
+            return cascading_flow
+        cascading_flow = Util.connect(auto_reducers.DEFAULT_REDUCERS,
+                                      flow_config, self._used_sources(),
+                                      self.sink_map, tails)
+        cascading_flow.addListener(_CompletionListener(self))
+        plan = self._plan(cascading_flow)
+        auto_reducers.estimate(plan, flow_config)
+        auto_reducers.apply(plan, cascading_flow)
+        self.last_plan = plan
+        return cascading_flow
+
+    def _plan(self, cascading_flow):
+        """Return the explain.Plan of the connected flow."""
+        return explain.Plan([t.get_assembly() for t in self.tails],
+                            self.source_map, self.sink_map, cascading_flow)
+
+    def _run_in_memory(self, config):
+        """Execute the pipeline with the in-memory engine."""
+        memory_config = self._flow_config(config)
+        for tap in self.sink_map.itervalues():
+            # The memory engine writes a single part file
+            if isinstance(tap.getScheme(), MetaScheme) and \
+            tap.getScheme().getNumSinkParts() > 0:
+                raise Exception('Bucketed sinks need the hadoop engine')
+        tails = [t.get_assembly() for t in self.tails]
+        self._limit_instrumentation(memory_config, tails)
+        _wrap_aggregators(tails, memory_config.get(GroupSkew.REPORT) is True)
+        self._mark_sampled_sinks()
+        memory_flow = MemoryFlow(memory_config, self._used_sources(),
+                                 self.sink_map, tails)
+        memory_flow.complete()
+        self._complete_caches()
+        self._complete_incremental_sources()
+        if self._instrumented(config):
+            counters = {}
+            for (group, values) in memory_flow.getCounters().iteritems():
+                counters[group] = dict(values)
+            print_udf_report(counters)
+        if memory_config.get(UdfProfiler.PROFILE_DIR):
+            udf_profile.print_report(memory_config[UdfProfiler.PROFILE_DIR])
+        if memory_config.get(GroupSkew.REPORT_DIR):
+            skew_report.print_report(memory_config[GroupSkew.REPORT_DIR])
+
+    def _mark_sampled_sinks(self):
+        """Tell the meta sinks which sampled sources their data comes from."""
+        for tail in self.tails:
+            tap = self.sink_map[tail.get_assembly().getName()]
+            if not isinstance(tap.getScheme(), MetaScheme):
+                continue
+            lines = set([])
+            for source in tail.context:
+                lines.update(self.sampling.get(source, []))
+            if lines:
+                lines = list(lines)
+                lines.sort()
+                tap.getScheme().setSampling('\n'.join(lines) + '\n')
+            else:
+                tap.getScheme().setSampling(None)
+
+    def _flow_config(self, config):
+        """Merge the global and the flow's configuration parameters.
+
+        If the UDFs are profiled or the group sizes are reported, a new
+        folder is chosen for the profiles or the group sizes unless one was
+        given.
+        """
         import pycascading.pipe
-        Util.run(num_reducers, pycascading.pipe.config, source_map, \
-                 self.sink_map, tails)
+        flow_config = dict(pycascading.pipe.config)
+        if config:
+            flow_config.update(config)
+        if float(flow_config.get(UdfProfiler.PROFILE, 0)) > 0:
+            if not flow_config.get(UdfProfiler.PROFILE_DIR):
+                flow_config[UdfProfiler.PROFILE_DIR] = expand_path_with_home(
+                    'pycascading-profiles/%s-%d' % \
+                    (time.strftime('%Y%m%d-%H%M%S'),
+                     random.randint(0, 999999)))
+        else:
+            flow_config.pop(UdfProfiler.PROFILE_DIR, None)
+        if flow_config.get(GroupSkew.REPORT) in (True, 'true', 'True'):
+            flow_config[GroupSkew.REPORT] = True
+            if not flow_config.get(GroupSkew.REPORT_DIR):
+                flow_config[GroupSkew.REPORT_DIR] = expand_path_with_home(
+                    'pycascading-skew/%s-%d' % \
+                    (time.strftime('%Y%m%d-%H%M%S'),
+                     random.randint(0, 999999)))
+        else:
+            flow_config.pop(GroupSkew.REPORT_DIR, None)
+        return flow_config
+
+    def _instrumented(self, config):
+        """Return True if the UDFs are instrumented with counters."""
+        import pycascading.pipe
+        value = (config or {}).get(UdfStats.INSTRUMENT,
+                                   pycascading.pipe.config.get(
+                                   UdfStats.INSTRUMENT))
+        return value in (True, 'true', 'True')
+
+    def _limit_instrumentation(self, flow_config, tails):
+        """Choose the UDFs to instrument if there are too many of them.
+
+        Every instrumented UDF adds six Hadoop counters, and Hadoop fails the
+        jobs with too many counters. So only the first
+        pycascading.instrument.max_udfs UDFs in the pipeline are instrumented,
+        and their pipes are listed in the configuration.
+        """
+        flow_config.pop(UdfStats.PIPES, None)
+        if flow_config.get(UdfStats.INSTRUMENT) not in (True, 'true', 'True'):
+            return
+        max_udfs = int(flow_config.get(UdfStats.MAX_UDFS,
+                                       UdfStats.DEFAULT_MAX_UDFS))
+        names = _udf_names(tails)
+        if len(names) > max_udfs:
+            print 'Only %d of the %d UDFs are instrumented, set %s to ' \
+            'change this' % (max_udfs, len(names), UdfStats.MAX_UDFS)
+            flow_config[UdfStats.PIPES] = '\n'.join(names[: max_udfs])
+
+    def _complete_caches(self):
+        """Mark the caches written by the flow as usable, and evict old ones.
+
+        This must be called only after the flow finished successfully.
+        """
+        if self.cache_folders:
+            for folder in self.cache_folders:
+                cache.mark_used(folder)
+            self.cache_folders = []
+            cache.gc()
+
+    def _complete_incremental_sources(self):
+        """Record the files read by the incremental sources in their states.
+
+        This must be called only after the flow finished successfully.
+        """
+        for (state_path, files) in self.incremental_sources:
+            incremental.commit(state_path, files)
+        self.incremental_sources = []
+
+
+class _CompletionListener(cascading.flow.FlowListener):
+
+    """Complete the caches and the incremental sources of a flow.
+
+    The listener is called when the Cascading Flow finishes, so the caches
+    and the states of the incremental sources are completed even if the flow
+    was started and nobody waits for it.
+    """
+
+    def __init__(self, flow):
+        self.flow = flow
+
+    def onStarting(self, cascading_flow):
+        pass
+
+    def onStopping(self, cascading_flow):
+        pass
+
+    def onCompleted(self, cascading_flow):
+        if cascading_flow.getFlowStats().isSuccessful():
+            self.flow._complete_caches()
+            self.flow._complete_incremental_sources()
+
+    def onThrowable(self, cascading_flow, throwable):
+        return False
+
+
+class FlowHandle(object):
+
+    """A handle to a flow that was started with Flow.start().
+
+    The flow runs in the background, and the handle can be used to wait for
+    it to finish, query its progress and Hadoop counters, or to stop it.
+    """
+
+    def __init__(self, flow, cascading_flow, profile_dir=None, plan=None,
+                 skew_dir=None):
+        self.__flow = flow
+        self.__cascading_flow = cascading_flow
+        # The folder of the UDF profiles, if the UDFs are profiled
+        self.profile_dir = profile_dir
+        # The folder of the group sizes, if they are reported
+        self.skew_dir = skew_dir
+        # The plan with the automatically chosen numbers of reducers, or None
+        self.__plan = plan
+        self.__finished = False
+
+    def get_cascading_flow(self):
+        """Return the Cascading Flow object that is running."""
+        return self.__cascading_flow
+
+    def wait(self, timeout=None):
+        """Wait for the flow to finish.
+
+        If the flow failed, the exception that caused the failure is raised.
+
+        Arguments:
+        timeout -- the number of seconds to wait at most, or None to wait
+            until the flow finishes
+
+        Return:
+        True if the flow finished, and False if the timeout has passed
+        """
+        if timeout is not None:
+            deadline = time.time() + timeout
+            while not self.is_finished():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(remaining, 1.0))
+        # This joins the thread running the flow, and throws the exception
+        # if the flow failed
+        self.__cascading_flow.complete()
+        if not self.__finished:
+            self.__finished = True
+            if self.__cascading_flow.getFlowStats().isSuccessful():
+                # These were done by the _CompletionListener already, unless
+                # it failed
+                self.__flow._complete_caches()
+                self.__flow._complete_incremental_sources()
+                if self.__plan is not None:
+                    # The next runs can correct their estimates with these
+                    auto_reducers.record_stats(self.__plan,
+                                               self.step_measurements())
+        return True
+
+    def is_finished(self):
+        """Return True if the flow has finished, failed, or was stopped."""
+        return self.__cascading_flow.getFlowStats().isFinished()
+
+    def status(self):
+        """Return the status of the flow as a string, such as RUNNING."""
+        return str(self.__cascading_flow.getFlowStats().getStatus())
+
+    def cancel(self):
+        """Stop the flow, killing the Hadoop jobs that are running."""
+        self.__cascading_flow.stop()
+
+    def _step_stats(self):
+        return list(self.__cascading_flow.getFlowStats().getStepStats())
+
+    def _step_progress(self, step_stats):
+        if step_stats.isFinished():
+            return 1.0
+        job = Util.getRunningJob(step_stats)
+        if job is None:
+            return 0.0
+        return (job.mapProgress() + job.reduceProgress()) / 2.0
+
+    def progress(self):
+        """Return the fraction of the flow completed, between 0.0 and 1.0.
+
+        We assume that all MapReduce steps take the same time, and for each
+        step, that the map and reduce phases take the same time.
+        """
+        steps = self._step_stats()
+        if not steps:
+            if self.is_finished():
+                return 1.0
+            return 0.0
+        return sum([self._step_progress(s) for s in steps]) / len(steps)
+
+    def steps(self):
+        """Return the status of the MapReduce steps of the flow.
+
+        Return:
+        a list of (step name, status, progress, duration in milliseconds)
+        tuples, one for each step
+        """
+        return [(s.getName(), str(s.getStatus()), self._step_progress(s),
+                 s.getDuration()) for s in self._step_stats()]
+
+    def counters(self):
+        """Return the Hadoop counters summed over all steps of the flow.
+
+        Return:
+        a dict of counter groups mapped to dicts of counter names and values
+        """
+        result = {}
+        for step_stats in self._step_stats():
+            step_counters = self._step_counters(step_stats)
+            for (group, counters) in step_counters.iteritems():
+                values = result.setdefault(group, {})
+                for (name, value) in counters.iteritems():
+                    values[name] = values.get(name, 0) + value
+        if self.__flow.skipping_counters:
+            result['PyCascading data skipping'] = \
+            dict(self.__flow.skipping_counters)
+        return result
+
+    def _step_counters(self, step_stats):
+        """Return the Hadoop counters of a step in a dict of dicts."""
+        result = {}
+        job = Util.getRunningJob(step_stats)
+        if job is None:
+            return result
+        counters = job.getCounters()
+        if counters is None:
+            return result
+        for group in counters:
+            values = result.setdefault(group.getDisplayName(), {})
+            for counter in group:
+                values[counter.getDisplayName()] = counter.getCounter()
+        return result
+
+    def step_measurements(self):
+        """Return the durations and record counts of the MapReduce steps.
+
+        Return:
+        a list of (step name, duration in milliseconds, records) tuples, where
+        records is a dict of the record counters of the Map-Reduce Framework
+        group, such as 'Map input records'
+        """
+        return [(s.getName(), s.getDuration(),
+                 self._step_counters(s).get('Map-Reduce Framework', {}))
+                for s in self._step_stats()]
+
+    def udf_report(self):
+        """Return the statistics of the instrumented UDFs of the flow.
+
+        See udf_report() in this module.
+        """
+        return udf_report(self.counters())
+
+    def udf_profile(self):
+        """Return the merged profiles of the UDFs, if they were profiled.
+
+        See udf_profile.report().
+        """
+        if self.profile_dir:
+            return udf_profile.report(self.profile_dir)
+        else:
+            return None
+
+    def skew_report(self):
+        """Return the group sizes of the reduce steps, if they were recorded.
+
+        See skew_report.report().
+        """
+        if self.skew_dir:
+            return skew_report.report(self.skew_dir)
+        else:
+            return None
+
+    def _job_step_names(self):
+        """Return the Hadoop job IDs of the steps mapped to their names."""
+        result = {}
+        for step_stats in self._step_stats():
+            job = Util.getRunningJob(step_stats)
+            if job is not None:
+                result[job.getID().toString()] = step_stats.getName()
+        return result
+
+
+def _udf_names(tails):
+    """Return the names of the pipes of the Python UDFs in the pipeline.
+
+    The UDFs are listed in the order they are applied, starting from the
+    sources.
+    """
+    names = []
+    visited = IdentityHashMap()
+
+    def visit(pipe):
+        if isinstance(pipe, cascading.pipe.SubAssembly):
+            for tail in pipe.getTails():
+                visit(tail)
+            return
+        if visited.containsKey(pipe):
+            return
+        visited.put(pipe, True)
+        for previous in pipe.getPrevious():
+            visit(previous)
+        if isinstance(pipe, cascading.pipe.Operator) and \
+        isinstance(pipe.getOperation(), CascadingBaseOperationWrapper):
+            name = pipe.getOperation().getName()
+            if name is not None and name not in names:
+                names.append(name)
+
+    for tail in tails:
+        visit(tail)
+    return names
+
+
+def _wrap_aggregators(tails, skew_report):
+    """Wrap the native aggregators to record the sizes of their groups.
+
+    The native aggregators of the Every pipes are wrapped in
+    GroupSkewAggregators if skew_report is True, and unwrapped otherwise, so
+    that a pipeline run again without the skew report doesn't pay for it.
+    The Python aggregators and buffers record the sizes themselves.
+    """
+    visited = IdentityHashMap()
+
+    def visit(pipe):
+        if isinstance(pipe, cascading.pipe.SubAssembly):
+            for tail in pipe.getTails():
+                visit(tail)
+            return
+        if visited.containsKey(pipe):
+            return
+        visited.put(pipe, True)
+        for previous in pipe.getPrevious():
+            visit(previous)
+        if not isinstance(pipe, cascading.pipe.Every):
+            return
+        operation = pipe.getOperation()
+        if isinstance(operation, GroupSkewAggregator):
+            if not skew_report:
+                Util.setOperation(pipe, operation.getAggregator())
+        elif skew_report and \
+        isinstance(operation, cascading.operation.Aggregator) and \
+        not isinstance(operation, CascadingBaseOperationWrapper):
+            Util.setOperation(pipe, GroupSkewAggregator(operation,
+                                                        pipe.getName()))
+
+    for tail in tails:
+        visit(tail)
+
+
+def udf_report(counters):
+    """Collect the statistics of the UDFs from the counters of a flow.
+
+    The UDFs are instrumented if the flow was run with the
+    pycascading.instrument parameter set to True. The UDFs are identified
+    by the names of their pipes, which contain the line number and the name
+    of the script where they were used.
+
+    Arguments:
+    counters -- the counters of the flow, as returned by FlowHandle.counters()
+
+    Return:
+    a list of (pipe name, statistics) pairs, where statistics is a dict of
+    the statistic names mapped to their values. The list is sorted by the
+    total time spent in the UDFs in decreasing order.
+    """
+    stats = {}
+    for (counter, value) in \
+    counters.get(UdfStats.COUNTER_GROUP, {}).iteritems():
+        (name, statistic) = counter.rsplit(UdfStats.SEPARATOR, 1)
+        stats.setdefault(name, {})[statistic] = value
+    def total_time(item):
+        s = item[1]
+        return s.get('function (us)', 0) + \
+        s.get('input conversion (us)', 0) + s.get('output conversion (us)', 0)
+    result = stats.items()
+    result.sort(key=total_time, reverse=True)
+    return result
+
+
+def print_udf_report(counters):
+    """Print the statistics of the UDFs, the slowest first.
+
+    Arguments:
+    counters -- the counters of the flow, as returned by FlowHandle.counters()
+    """
+    report = udf_report(counters)
+    if not report:
+        return
+    print 'UDF statistics (times in ms):'
+    print '%-40s %12s %12s %12s %10s %10s %10s' % \
+    ('pipe', 'calls', 'inputs', 'outputs', 'function', 'in conv',
+     'out conv')
+    for (name, s) in report:
+        print '%-40s %12d %12d %12d %10d %10d %10d' % \
+        (name, s.get('calls', 0), s.get('input tuples', 0),
+         s.get('output tuples', 0), s.get('function (us)', 0) / 1000,
+         s.get('input conversion (us)', 0) / 1000,
+         s.get('output conversion (us)', 0) / 1000)
+
+
+def read_tuples(path):
+    """Read all the tuples stored in a folder with a meta sink.
+
+    This is meant for small results that the driver script needs to
+    examine, as all the tuples are read in memory.
+
+    Arguments:
+    path -- the folder where the tuples are stored with a meta sink
+
+    Return:
+    the list of Cascading Tuples read
+    """
+    path = expand_path_with_home(path)
+    tap = cascading.tap.Hfs(MetaScheme.getSourceScheme(path), path)
+    iterator = tap.openForRead(JobConf())
+    result = []
+    try:
+        while iterator.hasNext():
+            result.append(Tuple(iterator.next().getTuple()))
+    finally:
+        iterator.close()
+    return result
+
+
+def read_sampling(path):
+    """Tell if the data in a folder was computed from sampled sources.
+
+    Arguments:
+    path -- the folder where the tuples are stored with a meta sink
+
+    Return:
+    a list of (fraction, method, seed, source path) tuples, one for each
+    sampled source that the data was computed from, where method is 'records'
+    or 'splits' depending on whether the records in the splits were sampled.
+    The list is empty if the data is not sampled.
+    """
+    sampling = MetaScheme.getSampling(expand_path_with_home(path))
+    result = []
+    for line in (sampling or '').splitlines():
+        (fraction, method, seed, source) = line.split('\t', 3)
+        result.append((float(fraction), method, int(seed), source))
+    return result
+
+
+# The taps reading files, whose paths may be changed
+_FILE_TAPS = (cascading.tap.Hfs, cascading.tap.GlobHfs)
+
+
+def _path_tap(scheme, path):
+    """Return a tap reading a path, or the files matching it if a glob.
+
+    Hfs takes the path literally when it checks whether it exists and when
+    it was modified, so globs need a GlobHfs.
+    """
+    for c in '{[*?':
+        if c in path:
+            return cascading.tap.GlobHfs(scheme, path)
+    return cascading.tap.Hfs(scheme, path)
+
+
+def _glob_escape(s):
+    """Escape the characters that have a special meaning in Hadoop globs."""
+    for c in '\\{}[]*?,':
+        s = s.replace(c, '\\' + c)
+    return s
+
+
+def _partition_glob(root, where):
+    """Return a glob of the partition folders matching the conditions.
+
+    Arguments:
+    root -- the folder written by a partitioned_sink
+    where -- a dict of partition fields mapped to a value, a list of values,
+        or a function returning True for the values to keep
+    """
+    fields = MetaScheme.getPartitionFields(root)
+    if fields is None:
+        raise Exception('The data in %s is not partitioned' % root)
+    fields = list(fields)
+    unknown = [f for f in where.iterkeys() if f not in fields]
+    if unknown:
+        raise Exception('%s are not partition fields of %s' % \
+                        (', '.join(unknown), root))
+    fs = Path(root).getFileSystem(Configuration())
+    pattern = root
+    for field in fields:
+        condition = where.get(field)
+        level = '%s/%s=' % (pattern, _glob_escape(field))
+        if condition is None:
+            pattern = level + '*'
+            continue
+        if callable(condition):
+            # List the values at this level in the partitions matched so far
+            prefix = field + '='
+            values = set([])
+            for status in fs.globStatus(Path(level + '*')) or []:
+                value = status.getPath().getName()[len(prefix):]
+                if status.isDir() and condition(value):
+                    values.add(value)
+            values = list(values)
+        elif isinstance(condition, (list, tuple, set, frozenset)):
+            values = [str(v) for v in condition]
+        else:
+            values = [str(condition)]
+        if not values:
+            raise Exception('No partitions of %s match %s' % (root, where))
+        values.sort()
+        if len(values) == 1:
+            pattern = level + _glob_escape(values[0])
+        else:
+            pattern = level + '{%s}' % ','.join(map(_glob_escape, values))
+    if not fs.globStatus(Path(pattern)):
+        raise Exception('No partitions of %s match %s' % (root, where))
+    return pattern
+
+
+def _may_match(stats, predicate):
+    """Return False if the file with the statistics can't match predicate.
+
+    The fields whose ranges are not known in the statistics can't be used to
+    skip the file.
+    """
+    if callable(predicate):
+        return predicate(stats)
+    for (field, condition) in predicate.iteritems():
+        if not stats.hasField(field):
+            continue
+        (low, high) = (stats.getMin(field), stats.getMax(field))
+        if low is None:
+            # All values are nulls
+            return False
+        if isinstance(condition, tuple):
+            (c_low, c_high) = condition
+        else:
+            (c_low, c_high) = (condition, condition)
+        if c_low is not None and high < c_low:
+            return False
+        if c_high is not None and low > c_high:
+            return False
+    return True
+
+
+def _skip_files(root, data_path, predicate):
+    """Return a glob of the part files that may match the predicate.
+
+    Arguments:
+    root -- the folder written by a meta sink
+    data_path -- the folder or glob of the data in root that is read
+    predicate -- a dict of fields mapped to values or (low, high) ranges, or
+        a function getting the FileStats of a file
+
+    Return:
+    a tuple of the glob, the numbers of files read and skipped, and the
+    number of bytes skipped
+    """
+    fs = Path(root).getFileSystem(Configuration())
+    (kept, skipped, skipped_bytes) = ([], 0, 0)
+    smallest = None
+    for status in cache._list_files(fs, Path(data_path)):
+        path = status.getPath().toString()
+        stats = FileStats.read(path)
+        if smallest is None or status.getLen() < smallest[1]:
+            smallest = (path, status.getLen())
+        if stats is None or _may_match(stats, predicate):
+            kept.append(path)
+        else:
+            skipped += 1
+            skipped_bytes += status.getLen()
+    if smallest is None:
+        return (data_path, 0, 0, 0)
+    if not kept:
+        # Cascading needs at least one file to read, so we read the smallest
+        # one, and the tuples in it won't match the predicate
+        kept.append(smallest[0])
+        skipped -= 1
+        skipped_bytes -= smallest[1]
+    return (_files_glob(root, kept), len(kept), skipped, skipped_bytes)
+
+
+def _files_glob(root, paths):
+    """Return a glob matching the files with the given paths in root."""
+    fs = Path(root).getFileSystem(Configuration())
+    prefix = fs.makeQualified(Path(root)).toString() + '/'
+    relative = [_glob_escape(p[len(prefix):]) for p in paths]
+    if len(relative) == 1:
+        return '%s/%s' % (root, relative[0])
+    return '%s/{%s}' % (root, ','.join(relative))
+
+
+def _delete_folder(folder):
+    """Delete a folder recursively from HDFS or the local file system."""
+    path = Path(folder)
+    path.getFileSystem(Configuration()).delete(path, True)
+
+
+# The stack of cascades that we are building with 'with' statements
+_cascades = []
+
+
+class Cascade(object):
+
+    """Run several flows together with a Cascading Cascade.
+
+    The dependencies between the flows are determined from the paths of their
+    sources and sinks, and flows that do not depend on each other are run
+    concurrently. Flows whose sinks are newer than all of their sources are
+    skipped.
+
+    The easiest way to use it is with the 'with' statement, in which case
+    any flow that is run() in the block will be added to the cascade, and
+    the cascade is run at the end of the block:
+
+    with cascade():
+        flow1.run()
+        flow2.run()
+
+    Note that in Jython 2.5 we need 'from __future__ import with_statement'
+    for this. Also note that a flow's meta_source cannot read the output of
+    another flow in the same cascade, as the output doesn't exist yet when the
+    flow is built.
+    """
+
+    def __init__(self, skip_up_to_date=True):
+        """Create an empty cascade.
+
+        Arguments:
+        skip_up_to_date -- if True, flows whose sinks are newer than their
+            sources are not run again
+        """
+        self.skip_up_to_date = skip_up_to_date
+        self.flows = []
+        self.__cascading_flows = []
+
+    def add(self, flow, num_reducers=50, config=None):
+        """Add a flow to the cascade.
+
+        Arguments:
+        flow -- the PyCascading Flow to add
+        num_reducers -- the default number of reducers for the flow, or 'auto'
+        config -- configuration parameters for the flow
+        """
+        cascading_flow = flow._connect(num_reducers, config)
+        if self.skip_up_to_date:
+            cascading_flow.setFlowSkipStrategy(SkipIfSinksUpToDate())
+        self.flows.append(flow)
+        self.__cascading_flows.append(cascading_flow)
+
+    def run(self):
+        """Run all the flows in the cascade and wait for them to finish."""
+        flows = jarray.array(self.__cascading_flows, cascading.flow.Flow)
+        CascadeConnector().connect(flows).complete()
+        for (flow, cascading_flow) in zip(self.flows,
+                                          self.__cascading_flows):
+            # A flow skipped because its sinks were up to date didn't write
+            # its caches or read the new files, and a failed flow may have
+            # written only a part of them
+            if cascading_flow.getFlowStats().isSuccessful():
+                flow._complete_caches()
+                flow._complete_incremental_sources()
+
+    def __enter__(self):
+        _cascades.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _cascades.pop()
+        if exc_type is None:
+            self.run()
+        return False
+
+
+def cascade(skip_up_to_date=True):
+    """Create a Cascade, to be used in a 'with' statement.
+
+    Arguments:
+    skip_up_to_date -- if True, flows whose sinks are newer than their
+        sources are not run again
+    """
+    return Cascade(skip_up_to_date)
 
 
 class _Sink(Chainable):
@@ -212,6 +1585,9 @@ class _Sink(Chainable):
     Used internally.
     """
 
+    # The sink writes the output already, so caching it would write it twice
+    _accepts_auto_cache = False
+
     def __init__(self, taps, cascading_tap):
         Chainable.__init__(self)
         self.__cascading_tap = cascading_tap
@@ -228,35 +1604,48 @@ class _Sink(Chainable):
         return None
 
 
+class _BucketedSink(_Sink):
+
+    """A sink that groups the tuples by the keys of the buckets.
+
+    Used internally.
+    """
+
+    def __init__(self, taps, cascading_tap, key_fields):
+        _Sink.__init__(self, taps, cascading_tap)
+        self.__key_fields = key_fields
+
+    def _create_with_parent(self, parent):
+        from pycascading.every import GroupBy
+        return _Sink._create_with_parent(self,
+                                         parent | GroupBy(self.__key_fields))
+
+
 class _Cache:
 
     """Act as a source or sink to store and retrieve temporary data."""
 
-    def __init__(self, taps, hdfs_folder, refresh=False):
-        tmp_folder = 'pycascading.cache/' + hdfs_folder
-        self.__cache_folder = expand_path_with_home(tmp_folder)
-        self.__hdfs_folder_exists = \
-        self.hdfs_folder_exists(self.__cache_folder)
+    def __init__(self, taps, identifier, refresh=False):
+        self.__identifier = identifier.replace('/', '_')
         self.__taps = taps
         self.__refresh = refresh
 
-    def hdfs_folder_exists(self, folder):
-        path = Path(folder)
-        fs = path.getFileSystem(Configuration())
-        try:
-            status = fs.getFileStatus(path)
-            # TODO: there could be problems if it exists but is a simple file
-            return status.isDir()
-        except:
-            return False
-
     def __or__(self, pipe):
-        if not self.__refresh and self.__hdfs_folder_exists:
+        # The folder is determined by the fingerprint of the pipeline that
+        # is cached
+        cache_folder = '%s/%s/%s' % (cache.cache_root(), self.__identifier,
+                                     pipe.hash)
+        if not self.__refresh and cache.is_complete(cache_folder):
+            cache.mark_used(cache_folder)
             # We remove all sources that are replaced by this cache, otherwise
             # Cascading complains about unused source taps
-            return self.__taps.meta_source(self.__cache_folder)
+            cached = self.__taps.meta_source(cache_folder)
+            # The cached data is equivalent to the pipeline's output
+            cached.hash = pipe.hash
+            return cached
         else:
             # We split the data into storing and processing pipelines
             pipe | Pipe(random_pipe_name('cache')) | \
-            self.__taps.binary_sink(self.__cache_folder)
+            self.__taps.binary_sink(cache_folder)
+            self.__taps.cache_folders.append(cache_folder)
             return pipe | Pipe(random_pipe_name('no_cache'))
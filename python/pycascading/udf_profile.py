@@ -0,0 +1,151 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Merge and report the profiles of the Python UDFs.
+
+If a flow is run with the pycascading.profile parameter set to a fraction
+between 0 and 1, that fraction of its tasks sample the stacks of the Python
+UDFs, and write their profiles to the folder in pycascading.profile.dir. The
+profiles of all the tasks are merged here into one report, which shows for
+each UDF the source lines where most of its time was spent.
+
+Flow.run() prints the report when the flow finishes. The profiles in a folder
+can also be merged later by running this module as a script:
+
+local_run.sh python/pycascading/udf_profile.py <profile folder> [<lines>]
+
+Exports the following:
+merge
+report
+print_report
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys
+
+from com.twitter.pycascading import UdfProfiler
+
+from java.io import BufferedReader, InputStreamReader
+from org.apache.hadoop.fs import Path
+from org.apache.hadoop.conf import Configuration
+
+
+def _read_lines(fs, path):
+    """Return the lines of a file."""
+    reader = BufferedReader(InputStreamReader(fs.open(path), 'UTF-8'))
+    lines = []
+    try:
+        line = reader.readLine()
+        while line is not None:
+            lines.append(line)
+            line = reader.readLine()
+    finally:
+        reader.close()
+    return lines
+
+
+def merge(folder):
+    """Merge the profiles of the tasks written in a folder.
+
+    Arguments:
+    folder -- the folder where the profiles were written
+
+    Return:
+    a tuple (number of profiles, number of samples, number of samples in
+    UDFs, counts), where counts is a dict mapping (UDF, file, line, function)
+    tuples to [self samples, total samples] lists
+    """
+    path = Path(folder)
+    fs = path.getFileSystem(Configuration())
+    num_profiles = samples = udf_samples = 0
+    counts = {}
+    if not fs.exists(path):
+        return (num_profiles, samples, udf_samples, counts)
+    for status in fs.listStatus(path):
+        if not status.getPath().getName().endswith(UdfProfiler.EXTENSION):
+            continue
+        num_profiles += 1
+        for line in _read_lines(fs, status.getPath()):
+            fields = line.split('\t')
+            if fields[0] == '#samples':
+                samples += int(fields[1])
+            elif fields[0] == '#udf_samples':
+                udf_samples += int(fields[1])
+            else:
+                key = (fields[0], fields[1], int(fields[2]), fields[3])
+                count = counts.setdefault(key, [0, 0])
+                count[0] += int(fields[4])
+                count[1] += int(fields[5])
+    return (num_profiles, samples, udf_samples, counts)
+
+
+def report(folder):
+    """Group the merged profiles by UDFs.
+
+    Arguments:
+    folder -- the folder where the profiles were written
+
+    Return:
+    a tuple (number of samples, number of samples in UDFs, UDFs), where UDFs
+    is a list of (UDF, samples, lines) tuples sorted by the samples in
+    decreasing order. lines is the list of (file, line, function, self
+    samples, total samples) tuples of the UDF, sorted by self samples.
+    """
+    (_, samples, udf_samples, counts) = merge(folder)
+    udfs = {}
+    for ((udf, file, line, function), (own, total)) in counts.iteritems():
+        udfs.setdefault(udf, []).append((file, line, function, own, total))
+    result = []
+    for (udf, lines) in udfs.iteritems():
+        lines.sort(key=lambda l: (l[3], l[4]), reverse=True)
+        # Every sample in a UDF had exactly one line executing
+        result.append((udf, sum([l[3] for l in lines]), lines))
+    result.sort(key=lambda u: u[1], reverse=True)
+    return (samples, udf_samples, result)
+
+
+def print_report(folder, max_lines=10):
+    """Print the report of the profiles written in a folder.
+
+    Arguments:
+    folder -- the folder where the profiles were written
+    max_lines -- the number of the most expensive lines shown for each UDF
+    """
+    (samples, udf_samples, udfs) = report(folder)
+    if not samples:
+        print 'No profiles were found in %s' % folder
+        return
+    print 'UDF profile (%d samples, %.1f%% in UDFs):' % \
+    (samples, 100.0 * udf_samples / samples)
+    for (udf, udf_total, lines) in udfs:
+        print
+        print '%5.1f%%  %s' % (100.0 * udf_total / samples, udf)
+        print '%8s %8s  %s' % ('self', 'total', 'line')
+        for (file, line, function, own, total) in lines[:max_lines]:
+            print '%7.1f%% %7.1f%%  %s:%d %s' % \
+            (100.0 * own / udf_total, 100.0 * total / udf_total,
+             file, line, function)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print 'Usage: udf_profile.py <profile folder> [<lines per UDF>]'
+        sys.exit(1)
+    if len(sys.argv) > 2:
+        print_report(sys.argv[1], int(sys.argv[2]))
+    else:
+        print_report(sys.argv[1])
@@ -34,6 +34,11 @@ server_deploys_dir='$HOME/pycascading/deploys'
 # files can be found from any directory.
 server_build_dir='$HOME/pycascading/master'
 
+# The folder on the remote server where the deployed files are stored under
+# their content hashes. The deploy folders are assembled from hard links to
+# these files, so it should be on the same file system as the folders above.
+server_store_dir='$HOME/pycascading/store'
+
 # Additional SSH options (see "man ssh"; private key, etc.)
 ssh_options=""
 
@@ -79,6 +84,16 @@ Options:
                      command line parameters can be passed in this case for
                      the job.
 
+   -l <folder>       Deploy to a folder on the local machine instead of the
+                     server, with the same layout as on the server. This is
+                     useful for testing the deployment.
+
+Only the files whose contents changed since an earlier deploy are copied to the
+server. The files are kept there in a content-addressed store, and the deploy
+folders are built from hard links to them. The sources.tgz archive submitted
+with the job is rebuilt only if the sources changed. The store is not cleaned
+up automatically.
+
 EOF
 }
 
@@ -107,15 +122,30 @@ remove_leading_slash()
 }
 
 
+# Run a command on the server, or in a local shell if we deploy to a local
+# folder. The standard input is passed on to the command.
+remote()
+{
+    if [ "$local_dir" == "" ]; then
+        ssh $server $ssh_options "$1"
+    else
+        bash -c "$1"
+    fi
+}
+
+
 # Copy the master jar over first? The -m option.
 master_first=no
 
 # Run job after submission with SSH?
 run_immediately='dont_run'
 
+# Deploy to a local folder instead of the server? The -l option.
+local_dir=''
+
 declare -a files_to_copy
 
-while getopts ":hmf:s:o:O:r" OPTION; do
+while getopts ":hmf:s:o:O:rl:" OPTION; do
 	case $OPTION in
 		h)	usage
          	exit 1
@@ -132,6 +162,11 @@ while getopts ":hmf:s:o:O:r" OPTION; do
             ;;
         r)  run_immediately='do_run'
             ;;
+        l)  local_dir=$(realpath "$OPTARG")
+            server_deploys_dir="$local_dir/deploys"
+            server_build_dir="$local_dir/master"
+            server_store_dir="$local_dir/store"
+            ;;
 	esac
 done
 shift $((OPTIND-1))
@@ -145,13 +180,24 @@ fi
 home_dir=$(realpath $(dirname "$0"))
 # This is the version that works both on Linux and MacOS
 tmp_dir=$(mktemp -d -t PyCascading-tmp-XXXXXX)
+if which sha1sum >/dev/null 2>&1; then
+    sha1='sha1sum'
+else
+    sha1='shasum -a 1'
+fi
+
+# The files to be deployed are collected in the master, sources, and others
+# folders in $stage
+stage="$tmp_dir/stage"
+mkdir "$stage"
 
 if [ $master_first == yes ]; then
     build_dir="$home_dir/build"
 	if [ -a "$build_dir/pycascading.jar" -a \
 	-a "$build_dir/pycascading.tgz" ]; then
+		mkdir "$stage/master"
 		ln -s "$build_dir/pycascading.jar" "$build_dir/pycascading.tgz" \
-		"$home_dir/python/pycascading/bootstrap.py" "$tmp_dir"
+		"$home_dir/python/pycascading/bootstrap.py" "$stage/master"
 	else
 	    echo 'Build the PyCascading master package first in the "java" folder with ant.'
 		exit 2
@@ -159,37 +205,93 @@ if [ $master_first == yes ]; then
 fi
 
 if [ "$main_file" != "" ]; then
-	tar -c -z -f "$tmp_dir/sources.tgz" "$@"
+    # The sources are precompiled to Jython bytecode in a copy, so that the
+    # user's folders are left intact
+    mkdir "$stage/sources"
+    tar -c -f - "$@" | tar -x -f - -C "$stage/sources"
+    "$home_dir/compile_python.sh" "$stage/sources"
     if [ ${#files_to_copy} -gt 0 ]; then
-        tar -c -z -f "$tmp_dir/others.tgz" "${files_to_copy[@]}"
+        mkdir "$stage/others"
+        tar -c -f - "${files_to_copy[@]}" | tar -x -f - -C "$stage/others"
     fi
 fi
 
+# The manifest lists the hash and the path of every file, sorted by path
+(cd "$stage" && find -L . -type f -print0 | xargs -0 $sha1) | \
+sed 's/^\([0-9a-f]*\) [ *]\.\//\1 /' | sort -k 2 >"$tmp_dir/manifest"
+# The hash of all the sources, which identifies sources.tgz
+sources_hash=$(grep '^[0-9a-f]* sources/' "$tmp_dir/manifest" | $sha1 | cut -d ' ' -f 1)
+
+# Ask the server which files it doesn't have yet, and copy only those
+mkdir "$tmp_dir/upload"
+missing=$(cut -d ' ' -f 1 "$tmp_dir/manifest" | sort -u | remote \
+"mkdir -p \"$server_store_dir\"; while read h; do [ -e \"$server_store_dir/\$h\" ] || echo \$h; done")
+if [ "$missing" != "" ]; then
+    mkdir "$tmp_dir/upload/objects"
+    while read hash path; do
+        if echo "$missing" | grep -q "^$hash\$"; then
+            cp -p -L "$stage/$path" "$tmp_dir/upload/objects/$hash"
+        fi
+    done <"$tmp_dir/manifest"
+fi
+mv "$tmp_dir/manifest" "$tmp_dir/upload"
+
 #
 # Create a setup file that will be run on the deploy server after everything
 # is copied over.
 #
-cat >"$tmp_dir/setup.sh" <<EOF
+cat >"$tmp_dir/upload/setup.sh" <<EOF
 #
 # This script is run on the deploy server to set up the PyCascading job folder
 #
-if [ -e pycascading.jar ]; then
+store="$server_store_dir"
+if [ -d objects ]; then
+    # Add the new files to the store. They are shared by the deploys, so they
+    # must not be modified.
+    chmod a-w objects/*
+    mv -f objects/* "\$store"
+fi
+
+# Hard link the files in the manifest under the folder \$1 to the folder \$2
+link_files()
+{
+    sed -n "s|^\([0-9a-f]*\) \$1/|\1 |p" manifest | while read hash path; do
+        mkdir -p "\$2/\$(dirname "\$path")"
+        ln -f "\$store/\$hash" "\$2/\$path" 2>/dev/null || \\
+        cp -f -p "\$store/\$hash" "\$2/\$path"
+    done
+}
+
+if grep -q '^[0-9a-f]* master/' manifest; then
     # If we packaged the master jar, update it
     mkdir -p "$server_build_dir"
-    mv pycascading.jar pycascading.tgz bootstrap.py "$server_build_dir"
-    rm -rf "$server_build_dir/python"
-    tar -x -z -f "$server_build_dir/pycascading.tgz" -C "$server_build_dir"
+    link_files master "$server_build_dir"
+    tgz_hash=\$(sed -n 's|^\([0-9a-f]*\) master/pycascading.tgz\$|\1|p' manifest)
+    if [ "\$tgz_hash" != "\$(cat "$server_build_dir/.pycascading.tgz.sha1" 2>/dev/null)" ]; then
+        rm -rf "$server_build_dir/python"
+        tar -x -z -f "$server_build_dir/pycascading.tgz" -C "$server_build_dir"
+        echo "\$tgz_hash" >"$server_build_dir/.pycascading.tgz.sha1"
+    fi
 fi
-if [ -e sources.tgz ]; then
+if grep -q '^[0-9a-f]* sources/' manifest; then
     mkdir -p "$server_deploys_dir"
     deploy_dir=\$(mktemp -d "$server_deploys_dir/XXXXXX")
     mkdir "\$deploy_dir/job"
     mv run.sh "\$deploy_dir"
-    tar -x -z -f sources.tgz -C "\$deploy_dir/job"
-    mv sources.tgz "\$deploy_dir"
-    if [ -e others.tgz ]; then
-        tar -x -z -f others.tgz -C "\$deploy_dir/job"
+    link_files sources "\$deploy_dir/job"
+    # The sources archive is only built if the sources changed, otherwise the
+    # earlier archive is used, which is then also found in the distributed
+    # cache
+    archive="\$store/sources-$sources_hash.tgz"
+    if [ ! -e "\$archive" ]; then
+        sed -n 's|^[0-9a-f]* sources/||p' manifest >sources.list
+        tar -c -z -f "\$archive.tmp" -C "\$deploy_dir/job" -T "\$(pwd)/sources.list"
+        chmod a-w "\$archive.tmp"
+        mv "\$archive.tmp" "\$archive"
     fi
+    ln -f "\$archive" "\$deploy_dir/sources.tgz" 2>/dev/null || \\
+    cp -p "\$archive" "\$deploy_dir/sources.tgz"
+    link_files others "\$deploy_dir/job"
     if [ ! -e "$server_build_dir/pycascading.jar" ]; then
         echo 'WARNING!!!'
         echo 'The PyCascading master jar has not yet been deployed, do a "remote_deploy.sh -m" first.'
@@ -202,13 +304,13 @@ if [ \$1 == 'do_run' ]; then
     \$deploy_dir/run.sh "\$@"
 fi
 EOF
-chmod +x "$tmp_dir/setup.sh"
+chmod +x "$tmp_dir/upload/setup.sh"
 
 #
 # Create a small script on the remote server that runs the job
 #
 main_file=$(remove_leading_slash "$main_file")
-cat >"$tmp_dir/run.sh" <<EOF
+cat >"$tmp_dir/upload/run.sh" <<EOF
 # Run the PyCascading job
 cd "\$(dirname "\$0")/job"
 hadoop $hadoop_options jar "$server_build_dir/pycascading.jar" \\
@@ -216,11 +318,11 @@ hadoop $hadoop_options jar "$server_build_dir/pycascading.jar" \\
 -a "$server_build_dir/pycascading.tgz" -a ../sources.tgz \\
 "$main_file" "\$@"
 EOF
-chmod +x "$tmp_dir/run.sh"
+chmod +x "$tmp_dir/upload/run.sh"
 
 # Upload the package to the server and run the setup script
-cd "$tmp_dir"
-tar -c -z -h -f - . | ssh $server $ssh_options \
-"dir=\$(mktemp -d -t PyCascading-tmp-XXXXXX); cd \"\$dir\"; tar -x -z -f -; " \
-"./setup.sh $run_immediately \"\$@\"; rm -r \"\$dir\""
+cd "$tmp_dir/upload"
+tar -c -z -f - . | remote \
+"dir=\$(mktemp -d -t PyCascading-tmp-XXXXXX); cd \"\$dir\"; tar -x -z -f -; \
+./setup.sh $run_immediately \"\$@\"; rm -rf \"\$dir\""
 rm -r "$tmp_dir"
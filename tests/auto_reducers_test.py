@@ -0,0 +1,135 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Tests that auto_reducers.apply sets the reducers of the right FlowSteps.
+
+A flow with two reduce steps is connected: one writes a TSV sink, and the
+other a bucketed sink. The TSV step must get the chosen number of reducers,
+and the bucketed step must keep the number of its buckets. This is checked
+both when the steps of the plan are the FlowSteps, and when apply has to
+fall back to the steps of the connected flow.
+
+This is a PyCascading script, so run it with local_run.sh:
+
+local_run.sh tests/auto_reducers_test.py
+
+The script exits with status 1 if a check failed.
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys, os, shutil, tempfile
+
+from pycascading.helpers import *
+from pycascading import auto_reducers
+
+from com.twitter.pycascading import Util
+
+
+_failures = []
+
+
+def check(message, condition):
+    """Print the result of a check, and count it if it failed."""
+    if condition:
+        print 'ok: %s' % message
+    else:
+        print 'FAILED: %s' % message
+        _failures.append(message)
+
+
+@udf_map(produces=['word'])
+def split_words(tuple):
+    for word in tuple.get(1).split():
+        yield [word]
+
+
+def build_flow(folder):
+    """Return a flow writing a TSV sink and a bucketed sink."""
+    input_file = os.path.join(folder, 'input.txt')
+    f = open(input_file, 'w')
+    try:
+        f.write('a b c\nb c d\nc d e\n')
+    finally:
+        f.close()
+    flow = Flow()
+    words = flow.source(Hfs(TextLine(), input_file)) | split_words
+    words | group_by('word', native.count()) | \
+    flow.tsv_sink(os.path.join(folder, 'counts'))
+    words | flow.bucketed_sink(os.path.join(folder, 'buckets'), 'word',
+                               buckets=3)
+    return flow
+
+
+def reducers(step):
+    """Return the number of reducers set for a FlowStep, or None."""
+    return step.getProperties().get('mapred.reduce.tasks')
+
+
+def bucketed_steps(cascading_flow):
+    """Return the FlowSteps that write the bucketed sink."""
+    result = []
+    for step in cascading_flow.getSteps():
+        elements = Util.getStepElements(step)
+        if [e for e in elements if auto_reducers._bucketed(e)]:
+            result.append(step)
+    return result
+
+
+def test_plan_steps(flow):
+    cascading_flow = flow._connect('auto', {})
+    plan = flow.last_plan
+    check('the steps of the plan are the FlowSteps', plan.steps is not None)
+    bucketed = bucketed_steps(cascading_flow)
+    check('one step writes the bucketed sink', len(bucketed) == 1)
+    for (i, step) in enumerate(plan.steps):
+        if step in bucketed:
+            check('the bucketed step keeps its reducers',
+                  reducers(step) is None)
+        else:
+            check('the other step gets the chosen reducers',
+                  reducers(step) == str(plan.reducers[i]))
+
+
+def test_fallback(flow):
+    cascading_flow = flow._connect(7, {})
+    plan = flow._plan(cascading_flow)
+    auto_reducers.estimate(plan, {})
+    # As if the graphs of the FlowSteps were not accessible
+    plan.steps = None
+    auto_reducers.apply(plan, cascading_flow)
+    bucketed = bucketed_steps(cascading_flow)
+    largest = max([n for n in plan.reducers if n is not None])
+    for step in cascading_flow.getSteps():
+        if step in bucketed:
+            check('the bucketed step keeps its reducers in the fallback',
+                  reducers(step) is None)
+        else:
+            check('the other step gets the largest reducers in the '
+                  'fallback', reducers(step) == str(largest))
+
+
+def main():
+    folder = tempfile.mkdtemp(prefix='pycascading-test-')
+    try:
+        test_plan_steps(build_flow(folder))
+        test_fallback(build_flow(folder))
+    finally:
+        shutil.rmtree(folder, True)
+    if _failures:
+        print '%d checks failed' % len(_failures)
+        sys.exit(1)
+    print 'All checks passed'
@@ -0,0 +1,103 @@
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Tests that the memory engine computes the same results as Hadoop.
+
+The pipelines of the word_count, joins, reduce, and total_sort examples are
+run on the same generated data with the hadoop and the memory engines, and
+their outputs are compared. The engines write different numbers of part
+files in different orders, so the sorted lines of all the part files are
+compared. The pipelines are the workloads of the benchmarks. The pagerank
+workload runs its iterations with the hadoop engine itself, so it is not
+compared.
+
+This is a PyCascading script, so run it with local_run.sh:
+
+local_run.sh tests/engines_test.py [<size>]
+
+The size factor of the generated data is 0.1 by default. The script exits
+with status 1 if the outputs of a pipeline differ.
+"""
+
+__author__ = 'Gabor Szabo'
+
+
+import sys, os, shutil, tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'benchmarks'))
+import workloads
+
+
+# The workloads compared
+_WORKLOADS = ['word_count', 'joins', 'reduce', 'total_sort']
+
+
+def read_output(folder):
+    """Return the sorted lines of all the part files under a folder."""
+    lines = []
+    for (dir_path, dir_names, file_names) in os.walk(folder):
+        dir_names[:] = [d for d in dir_names if d[0] not in '._']
+        for name in file_names:
+            # The meta files and the checksums are not part of the output
+            if name[0] in '._':
+                continue
+            f = open(os.path.join(dir_path, name))
+            try:
+                lines.extend(f.read().splitlines())
+            finally:
+                f.close()
+    lines.sort()
+    return lines
+
+
+def run(workload, data_dir, output_dir, engine):
+    """Run a workload with an engine, and return its output."""
+    workload(data_dir, output_dir).run(num_reducers=2, engine=engine)
+    return read_output(output_dir)
+
+
+def main():
+    size = float((sys.argv[1:] or ['0.1'])[0])
+    folder = tempfile.mkdtemp(prefix='pycascading-test-')
+    failures = 0
+    try:
+        data_dir = os.path.join(folder, 'data')
+        workloads.generate_data(data_dir, size)
+        for (name, workload, inputs) in workloads.WORKLOADS:
+            if name not in _WORKLOADS:
+                continue
+            hadoop = run(workload, data_dir,
+                         os.path.join(folder, name, 'hadoop'), 'hadoop')
+            memory = run(workload, data_dir,
+                         os.path.join(folder, name, 'memory'), 'memory')
+            if hadoop and hadoop == memory:
+                print 'ok: %s has the same %d output lines' % \
+                (name, len(hadoop))
+            else:
+                print 'FAILED: %s has %d output lines with hadoop, and %d ' \
+                'with memory' % (name, len(hadoop), len(memory))
+                (hadoop_lines, memory_lines) = (set(hadoop), set(memory))
+                for line in list(hadoop_lines - memory_lines)[:5]:
+                    print '  only with hadoop: %s' % line
+                for line in list(memory_lines - hadoop_lines)[:5]:
+                    print '  only with memory: %s' % line
+                failures += 1
+    finally:
+        shutil.rmtree(folder, True)
+    if failures:
+        print '%d pipelines have different outputs' % failures
+        sys.exit(1)
+    print 'All checks passed'
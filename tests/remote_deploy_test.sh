@@ -0,0 +1,117 @@
+#!/usr/bin/env bash
+
+#
+# Copyright 2011 Twitter, Inc.
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+#
+# Tests the incremental deploys of remote_deploy.sh, using a local folder
+# with the -l option as a stand-in for the server.
+#
+# A job is deployed three times: first to an empty folder, then again without
+# changes, and then with a changed source file. The second deploy must reuse
+# the files and the sources archive in the store, and the third must add the
+# changed file and a new sources archive.
+#
+# Usage: tests/remote_deploy_test.sh
+#
+
+home_dir=$(cd "$(dirname "$0")/.." && pwd)
+tmp_dir=$(mktemp -d -t PyCascading-test-XXXXXX)
+trap 'rm -rf "$tmp_dir"' EXIT
+
+failures=0
+
+# Run the test command after the message, and count it if it fails
+check()
+{
+    message="$1"
+    shift
+    if "$@"; then
+        echo "ok: $message"
+    else
+        echo "FAILED: $message"
+        failures=$((failures+1))
+    fi
+}
+
+# The number of entries in a folder matching a glob
+count()
+{
+    ls -d $1 2>/dev/null | wc -l | tr -d ' '
+}
+
+deploy()
+{
+    (cd "$tmp_dir/job" && \
+    "$home_dir/remote_deploy.sh" -l "$tmp_dir/server" -f data.txt \
+    main.py lib.py >/dev/null) || {
+        echo "FAILED: remote_deploy.sh exited with an error"
+        exit 1
+    }
+}
+
+mkdir "$tmp_dir/job"
+echo 'import lib' >"$tmp_dir/job/main.py"
+echo 'x = 1' >"$tmp_dir/job/lib.py"
+echo 'some data' >"$tmp_dir/job/data.txt"
+store="$tmp_dir/server/store"
+
+# The first deploy copies everything into the store
+deploy
+check 'the first deploy creates a deploy folder' \
+[ $(count "$tmp_dir/server/deploys/*") == 1 ]
+first=$(ls -d "$tmp_dir"/server/deploys/*)
+check 'the first deploy builds a sources archive' \
+[ $(count "$store/sources-*.tgz") == 1 ]
+archive=$(ls "$store"/sources-*.tgz)
+check 'the sources archive is linked into the deploy folder' \
+[ "$first/sources.tgz" -ef "$archive" ]
+check 'the sources are in the deploy folder' \
+cmp -s "$tmp_dir/job/lib.py" "$first/job/lib.py"
+check 'the other files are in the deploy folder' \
+cmp -s "$tmp_dir/job/data.txt" "$first/job/data.txt"
+objects=$(count "$store/*")
+
+# The second deploy has nothing new to copy or to archive
+deploy
+check 'the second deploy creates another deploy folder' \
+[ $(count "$tmp_dir/server/deploys/*") == 2 ]
+second=$(ls -d "$tmp_dir"/server/deploys/* | grep -v "^$first\$")
+check 'the second deploy adds nothing to the store' \
+[ $(count "$store/*") == $objects ]
+check 'the second deploy reuses the sources archive' \
+[ "$second/sources.tgz" -ef "$archive" ]
+check 'the unchanged sources are shared by the deploys' \
+[ "$second/job/lib.py" -ef "$first/job/lib.py" ]
+
+# The third deploy copies only the changed file, and archives the sources
+sleep 1
+echo 'x = 2' >"$tmp_dir/job/lib.py"
+deploy
+third=$(ls -td "$tmp_dir"/server/deploys/* | head -n 1)
+check 'the third deploy builds a new sources archive' \
+[ $(count "$store/sources-*.tgz") == 2 ]
+check 'the third deploy does not reuse the old sources archive' \
+[ ! "$third/sources.tgz" -ef "$archive" ]
+check 'the changed source is deployed' \
+cmp -s "$tmp_dir/job/lib.py" "$third/job/lib.py"
+check 'the unchanged sources are still shared' \
+[ "$third/job/main.py" -ef "$first/job/main.py" ]
+
+if [ $failures -gt 0 ]; then
+    echo "$failures checks failed"
+    exit 1
+fi
+echo 'All checks passed'